@@ -5,6 +5,8 @@ from typing import List
 from operator import itemgetter
 import random as rnd
 
+import shout_history
+
 @dataclass
 class ReservationValues:
     owners_name: str
@@ -50,10 +52,9 @@ class ReservationValues:
         based on current_unit.  Returns None if
         current_unit is out of range.
         """
-        try:
+        if self.current_unit < len(self.reservation_values):
             return self.reservation_values[self.current_unit]
-        except IndexError:
-            return None
+        return None
 
 class ZI_Buyer:
     """ 
@@ -80,6 +81,18 @@ class ZI_Buyer:
         else:
             return None
 
+    @staticmethod
+    def bid_batch(standing_bid, standing_ask, current, next_token, lowest, highest, round_fraction, rng):
+        """
+        Batch form of bid for M markets at once.  Arguments are arrays of
+        length M: standing bid and ask, the current and next reservation
+        value (nan when no units are left), the lowest and highest value,
+        and num_round / total_rounds.  rng is a numpy Generator.
+        Returns bid prices, nan for no bid.
+        """
+        draw = standing_bid + rng.random(len(current)) * (current - standing_bid)
+        return np.where(standing_bid < current, draw, np.nan)
+
     def contract(self, price, your_contract):
         """
         Buyer becomes informed about contract prices from Double Auction.
@@ -92,6 +105,15 @@ class ZI_Buyer:
             self.contracts.append(price)
             self.values.current_unit += 1
 
+    def contract_batch(self, prices, your_prices):
+        """
+        Same as calling contract for each price in prices, in order, where
+        your_prices are the prices of this buyer's own contracts among them.
+        """
+        self.prices.extend(prices)
+        self.contracts.extend(your_prices)
+        self.values.current_unit += len(your_prices)
+
 class Kaplan_Buyer:
     """
     A Buyer who can bid in a Double Auction Spot Market.
@@ -145,6 +167,20 @@ class Kaplan_Buyer:
         else:
             return self.name, "bid", 1
 
+    @staticmethod
+    def bid_batch(standing_bid, standing_ask, current, next_token, lowest, highest, round_fraction, rng):
+        """
+        Batch form of bid for M markets at once (see ZI_Buyer.bid_batch).
+        """
+        most = np.where(standing_ask != 0, np.minimum(standing_ask, next_token - 1), next_token - 1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            jump = ((standing_ask <= 999) & ((current - standing_bid) / current > 0.02)
+                    & (standing_ask - standing_bid < 0.1 * standing_ask))
+        act = (most > standing_bid) & (jump | (standing_ask <= 0) | (1 - round_fraction <= 0.1))
+        price = np.where(act, np.minimum(standing_ask, most), np.nan)
+        price = np.where(standing_bid == 0, 1.0, price)
+        return np.where(np.isnan(current), np.nan, price)
+
     def contract(self, price, your_contract):
         """
         Buyer becomes informed about contract prices from Double Auction.
@@ -156,6 +192,15 @@ class Kaplan_Buyer:
         if your_contract:
             self.contracts.append(price)
             self.values.current_unit += 1
+
+    def contract_batch(self, prices, your_prices):
+        """
+        Same as calling contract for each price in prices, in order, where
+        your_prices are the prices of this buyer's own contracts among them.
+        """
+        self.prices.extend(prices)
+        self.contracts.extend(your_prices)
+        self.values.current_unit += len(your_prices)
                    
 class Ringuette_Buyer:
     """
@@ -168,20 +213,31 @@ class Ringuette_Buyer:
         self.values = ReservationValues(name, reservation_values)
         self.prices = []
         self.contracts = []
+        self.skeleton = Skeleton_Buyer(name, self.values.reservation_values)
+        self.share_state()
+
+    def share_state(self):
+        """
+        Points the Skeleton delegate used late in the period at this
+        trader's tokens, prices and contracts, so it is built only once.
+        """
+        self.skeleton.values = self.values
+        self.skeleton.prices = self.prices
+        self.skeleton.contracts = self.contracts
 
     def __repr__(self):
         return f"{self.type}--{self.name} {self.values.reservation_values} current unit = {self.values.current_unit}"
     
     def bid(self, standing_bid, standing_ask, num_round, total_rounds):
-        try:
-            next_token = self.values.reservation_values[self.values.current_unit + 1]
-        except IndexError:
-            next_token = self.values.current
-
         if (1 - (num_round / total_rounds)) <= 0.1:
-            skeleton = Skeleton_Buyer(self.name, self.values.reservation_values)
-            skeleton.bid(standing_bid, standing_ask, num_round, total_rounds)
+            if self.skeleton.values is not self.values:
+                self.share_state()
+            return self.skeleton.bid(standing_bid, standing_ask, num_round, total_rounds)
         else:
+            try:
+                next_token = self.values.reservation_values[self.values.current_unit + 1]
+            except IndexError:
+                next_token = self.values.current
             span = (self.values.reservation_values[0] - self.values.reservation_values[-1] + 10)
             if standing_bid < (total_rounds/4):
                 return self.name, "bid", standing_bid + 1
@@ -206,6 +262,15 @@ class Ringuette_Buyer:
             self.contracts.append(price)
             self.values.current_unit += 1
 
+    def contract_batch(self, prices, your_prices):
+        """
+        Same as calling contract for each price in prices, in order, where
+        your_prices are the prices of this buyer's own contracts among them.
+        """
+        self.prices.extend(prices)
+        self.contracts.extend(your_prices)
+        self.values.current_unit += len(your_prices)
+
 class PS_Buyer:
     """
     A Buyer who can bid in a Double Auction Spot Market.
@@ -252,6 +317,22 @@ class PS_Buyer:
             else:
                 return None
 
+    @staticmethod
+    def bid_batch(standing_bid, standing_ask, current, next_token, lowest, highest, round_fraction, rng):
+        """
+        Batch form of bid for M markets at once (see ZI_Buyer.bid_batch).
+        """
+        r_1 = rng.uniform(0, 0.2, len(current))
+        r_2 = rng.uniform(0, 0.2, len(current))
+        gamma = 0.5
+        beta = 0.1
+
+        spread = standing_ask > standing_bid
+        delta = r_1 * np.where(spread, standing_bid, standing_ask) + r_2
+        target = np.where(spread, standing_bid + delta, standing_ask - delta)
+        potential_bid = gamma * current + (1 - gamma) * beta * (target - current)
+        return np.where(potential_bid <= current, potential_bid, np.nan)
+
     def contract(self, price, your_contract):
         """
         Buyer becomes informed about contract prices from Double Auction.
@@ -264,6 +345,15 @@ class PS_Buyer:
             self.contracts.append(price)
             self.values.current_unit += 1
 
+    def contract_batch(self, prices, your_prices):
+        """
+        Same as calling contract for each price in prices, in order, where
+        your_prices are the prices of this buyer's own contracts among them.
+        """
+        self.prices.extend(prices)
+        self.contracts.extend(your_prices)
+        self.values.current_unit += len(your_prices)
+
 class Skeleton_Buyer:
     def __init__(self, name, reservation_values):
         self.name = name
@@ -276,9 +366,10 @@ class Skeleton_Buyer:
         return f"{self.type}--{self.name} {self.values.reservation_values} current unit = {self.values.current_unit}"
     
     def bid(self, standing_bid, standing_ask, num_round, total_rounds):
-        try:
+        # bounds check rather than IndexError, this runs every late round
+        if self.values.current_unit + 1 < len(self.values.reservation_values):
             next_token = self.values.reservation_values[self.values.current_unit + 1]
-        except IndexError:
+        else:
             next_token = self.values.current
 
         if self.values.current == None:
@@ -306,6 +397,19 @@ class Skeleton_Buyer:
                 most = self.values.reservation_values[-1] - 1
                 return self.name, "bid", most - (alpha * (self.values.reservation_values[0] - self.values.reservation_values[-1]))
 
+    @staticmethod
+    def bid_batch(standing_bid, standing_ask, current, next_token, lowest, highest, round_fraction, rng):
+        """
+        Batch form of bid for M markets at once (see ZI_Buyer.bid_batch).
+        """
+        alpha = 0.25 + 0.1 * rng.random(len(current))
+        most = np.where(standing_ask != 0, np.minimum(standing_ask, next_token - 1), next_token - 1)
+        inside = np.where(most <= standing_bid, np.nan, (1 - alpha) * (standing_bid + 1) + alpha * most)
+        most = np.where(standing_ask != 0, np.minimum(standing_ask, lowest - 1), lowest - 1)
+        opening = most - alpha * (highest - lowest)
+        price = np.where(standing_bid != 0, inside, opening)
+        return np.where(np.isnan(current), np.nan, price)
+
     def contract(self, price, your_contract):
         """
         Buyer becomes informed about contract prices from Double Auction.
@@ -318,6 +422,94 @@ class Skeleton_Buyer:
             self.contracts.append(price)
             self.values.current_unit += 1
 
+    def contract_batch(self, prices, your_prices):
+        """
+        Same as calling contract for each price in prices, in order, where
+        your_prices are the prices of this buyer's own contracts among them.
+        """
+        self.prices.extend(prices)
+        self.contracts.extend(your_prices)
+        self.values.current_unit += len(your_prices)
+
+class GD_Buyer:
+    """
+    A Buyer who can bid in a Double Auction Spot Market.
+    Modeled after the belief-based strategy of Gjerstad & Dickhaut (1998):
+    the bid maximizes belief(bid) * (value - bid), the belief that a bid is
+    accepted coming from the shouts and contracts of the last memory
+    contracts (see shout_history.ShoutHistory).  Bids are searched on
+    candidates evenly spaced prices between the standing bid and the lower
+    of value and standing ask, where the standing ask is sure to be taken.
+    With no history yet (or no double auction) it bids like ZI_Buyer.
+    """
+    memory = 5
+    candidates = 20
+
+    def __init__(self, name, reservation_values):
+        self.name = name
+        self.type = 'B'
+        self.values = ReservationValues(name, reservation_values)
+        self.prices = []
+        self.contracts = []
+        self.history = None
+
+    def __repr__(self):
+        return f"{self.type}--{self.name} {self.values.reservation_values} current unit = {self.values.current_unit}"
+
+    def attach(self, da):
+        """
+        Shares the shout history of the double auction da registered with.
+        """
+        self.history = shout_history.shared(da, self.memory)
+
+    def bid(self, standing_bid, standing_ask, num_round, total_rounds):
+        value = self.values.current
+        if value == None or standing_bid >= value:
+            return None
+        if not self.history:
+            return self.name, "bid", rnd.uniform(standing_bid, value)
+
+        belief = self.history.bid_belief
+        top = min(value, standing_ask)
+        step = (top - standing_bid) / self.candidates
+        best, best_surplus = None, 0
+        for k in range(1, self.candidates + 1):
+            price = standing_bid + k * step
+            surplus = (1.0 if price >= standing_ask else belief(price)) * (value - price)
+            if surplus > best_surplus:
+                best, best_surplus = price, surplus
+        if best is None:
+            return None
+        return self.name, "bid", best
+
+    def snapshot_state(self):
+        return self.history.snapshot() if self.history is not None else None
+
+    def restore_state(self, state):
+        if state is not None:
+            self.history.restore(state)
+
+    def contract(self, price, your_contract):
+        """
+        Buyer becomes informed about contract prices from Double Auction.
+        Buyer must be registered with Double Auction to get price information.
+        If your_contract == True buyer learns they have a contract at price.
+        If your_contract == True buyer updates their current_unit.
+        """
+        self.prices.append(price)
+        if your_contract:
+            self.contracts.append(price)
+            self.values.current_unit += 1
+
+    def contract_batch(self, prices, your_prices):
+        """
+        Same as calling contract for each price in prices, in order, where
+        your_prices are the prices of this buyer's own contracts among them.
+        """
+        self.prices.extend(prices)
+        self.contracts.extend(your_prices)
+        self.values.current_unit += len(your_prices)
+
 if __name__ == "__main__":
     print()
     print("Testing ReservationValues class")
@@ -5,6 +5,8 @@ from typing import List
 from operator import itemgetter
 import random as rnd
 
+import shout_history
+
 @dataclass
 class UnitCosts:
     owners_name: str
@@ -46,10 +48,9 @@ class UnitCosts:
         on current_unit.  Returns None if
         current_unit is out of range.
         """
-        try:
+        if self.current_unit < len(self.unit_costs):
             return self.unit_costs[self.current_unit]
-        except IndexError:
-            return None
+        return None
 
 class ZI_Seller:
     def __init__(self, name, unit_costs):
@@ -72,6 +73,15 @@ class ZI_Seller:
         else:
             return None
 
+    @staticmethod
+    def ask_batch(standing_bid, standing_ask, current, next_token, lowest, highest, round_fraction, rng):
+        """
+        Batch form of ask for M markets at once (see the buyers' bid_batch).
+        Returns ask prices, nan for no ask.
+        """
+        draw = current + rng.random(len(current)) * (standing_ask - current)
+        return np.where(current < standing_ask, draw, np.nan)
+
     def contract(self, price, your_contract):
         """
         Seller becomes informed about contract prices from Double Auction.
@@ -84,6 +94,15 @@ class ZI_Seller:
             self.contracts.append(price)
             self.costs.current_unit += 1
 
+    def contract_batch(self, prices, your_prices):
+        """
+        Same as calling contract for each price in prices, in order, where
+        your_prices are the prices of this seller's own contracts among them.
+        """
+        self.prices.extend(prices)
+        self.contracts.extend(your_prices)
+        self.costs.current_unit += len(your_prices)
+
 class Kaplan_Seller:
     """
     A Buyer who can bid in a Double Auction Spot Market.
@@ -136,6 +155,20 @@ class Kaplan_Seller:
                     return None
         else:
             return self.name, "ask", 1
+
+    @staticmethod
+    def ask_batch(standing_bid, standing_ask, current, next_token, lowest, highest, round_fraction, rng):
+        """
+        Batch form of ask for M markets at once (see ZI_Seller.ask_batch).
+        """
+        least = np.where(standing_bid != 0, np.maximum(standing_bid, next_token + 1), next_token + 1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            jump = ((standing_bid >= 999) & ((standing_ask - current) / current > 0.02)
+                    & (standing_ask - standing_bid < 0.1 * standing_bid))
+        act = (least < standing_ask) & (jump | (standing_bid >= 0) | (1 - round_fraction <= 0.2))
+        price = np.where(act, np.maximum(standing_bid, least), np.nan)
+        price = np.where(standing_ask == 0, 1.0, price)
+        return np.where(np.isnan(current), np.nan, price)
         
     def contract(self, price, your_contract):
         """
@@ -149,6 +182,15 @@ class Kaplan_Seller:
             self.contracts.append(price)
             self.costs.current_unit += 1
 
+    def contract_batch(self, prices, your_prices):
+        """
+        Same as calling contract for each price in prices, in order, where
+        your_prices are the prices of this seller's own contracts among them.
+        """
+        self.prices.extend(prices)
+        self.contracts.extend(your_prices)
+        self.costs.current_unit += len(your_prices)
+
 class Ringuette_Seller:
     """
     A Buyer who can bid in a Double Auction Spot Market.
@@ -160,20 +202,31 @@ class Ringuette_Seller:
         self.costs = UnitCosts(name, unit_costs)
         self.prices = []
         self.contracts = []
+        self.skeleton = Skeleton_Seller(name, self.costs.unit_costs)
+        self.share_state()
+
+    def share_state(self):
+        """
+        Points the Skeleton delegate used late in the period at this
+        trader's tokens, prices and contracts, so it is built only once.
+        """
+        self.skeleton.costs = self.costs
+        self.skeleton.prices = self.prices
+        self.skeleton.contracts = self.contracts
 
     def __repr__(self):
         return f"{self.type}--{self.name} {self.costs.unit_costs} current unit = {self.costs.current_unit}"
         
     def ask(self, standing_bid, standing_ask, num_round, total_rounds):
-        try:
-            next_token = self.costs.unit_costs[self.costs.current_unit + 1]
-        except IndexError:
-            next_token = self.costs.current
-        
         if (1 - (num_round / total_rounds)) <= 0.2:
-            skeleton = Skeleton_Seller(self.name, self.costs.unit_costs)
-            skeleton.ask(standing_bid, standing_ask, num_round, total_rounds)
+            if self.skeleton.costs is not self.costs:
+                self.share_state()
+            return self.skeleton.ask(standing_bid, standing_ask, num_round, total_rounds)
         else:
+            try:
+                next_token = self.costs.unit_costs[self.costs.current_unit + 1]
+            except IndexError:
+                next_token = self.costs.current
             span = (self.costs.unit_costs[-1] - self.costs.unit_costs[0] + 10)
             if standing_ask > (total_rounds/4):
                 return self.name, "ask", standing_ask - 1
@@ -198,6 +251,15 @@ class Ringuette_Seller:
             self.contracts.append(price)
             self.costs.current_unit += 1
 
+    def contract_batch(self, prices, your_prices):
+        """
+        Same as calling contract for each price in prices, in order, where
+        your_prices are the prices of this seller's own contracts among them.
+        """
+        self.prices.extend(prices)
+        self.contracts.extend(your_prices)
+        self.costs.current_unit += len(your_prices)
+
 class PS_Seller:
     """
     A Buyer who can bid in a Double Auction Spot Market.
@@ -238,6 +300,22 @@ class PS_Seller:
             else:
                 return None
 
+    @staticmethod
+    def ask_batch(standing_bid, standing_ask, current, next_token, lowest, highest, round_fraction, rng):
+        """
+        Batch form of ask for M markets at once (see ZI_Seller.ask_batch).
+        """
+        r_1 = rng.uniform(0, 0.2, len(current))
+        r_2 = rng.uniform(0, 0.2, len(current))
+        gamma = 0.3
+        beta = 0.05
+
+        spread = standing_ask > standing_bid
+        delta = r_1 * np.where(spread, standing_ask, standing_bid) + r_2
+        target = np.where(spread, standing_bid - delta, standing_ask + delta)
+        potential_ask = gamma * current + (1 - gamma) * beta * (target - current)
+        return np.where(potential_ask >= current, potential_ask, np.nan)
+
     def contract(self, price, your_contract):
         """
         Buyer becomes informed about contract prices from Double Auction.
@@ -250,6 +328,15 @@ class PS_Seller:
             self.contracts.append(price)
             self.costs.current_unit += 1
 
+    def contract_batch(self, prices, your_prices):
+        """
+        Same as calling contract for each price in prices, in order, where
+        your_prices are the prices of this seller's own contracts among them.
+        """
+        self.prices.extend(prices)
+        self.contracts.extend(your_prices)
+        self.costs.current_unit += len(your_prices)
+
 class Skeleton_Seller:
     def __init__(self, name, unit_costs):
         self.name = name
@@ -262,9 +349,10 @@ class Skeleton_Seller:
         return f"{self.type}--{self.name} {self.costs.unit_costs} current unit = {self.costs.current_unit}"
     
     def ask(self, standing_bid, standing_ask, num_round, total_rounds):
-        try:
+        # bounds check rather than IndexError, this runs every late round
+        if self.costs.current_unit + 1 < len(self.costs.unit_costs):
             next_token = self.costs.unit_costs[self.costs.current_unit + 1]
-        except IndexError:
+        else:
             next_token = self.costs.current
 
         if self.costs.current == None:
@@ -292,6 +380,21 @@ class Skeleton_Seller:
                 most = self.costs.unit_costs[0] + 1
                 return self.name, "ask", most + (alpha * (self.costs.unit_costs[-1] - self.costs.unit_costs[0]))
 
+    @staticmethod
+    def ask_batch(standing_bid, standing_ask, current, next_token, lowest, highest, round_fraction, rng):
+        """
+        Batch form of ask for M markets at once (see ZI_Seller.ask_batch).
+        Keeps ask's comparison with the standing bid when there is no standing bid.
+        """
+        alpha = 0.25 + 0.1 * rng.random(len(current))
+        most = np.where(standing_bid != 0, np.maximum(standing_bid, next_token + 1), next_token + 1)
+        blocked = np.where(standing_bid != 0, most >= standing_ask, most >= standing_bid)
+        inside = np.where(blocked, np.nan, (1 - alpha) * (standing_ask - 1) + alpha * most)
+        most = np.where(standing_bid != 0, np.maximum(standing_bid, lowest + 1), lowest + 1)
+        opening = most + alpha * (highest - lowest)
+        price = np.where(standing_ask != 0, inside, opening)
+        return np.where(np.isnan(current), np.nan, price)
+
     def contract(self, price, your_contract):
         """
         Buyer becomes informed about contract prices from Double Auction.
@@ -304,6 +407,94 @@ class Skeleton_Seller:
             self.contracts.append(price)
             self.costs.current_unit += 1
 
+    def contract_batch(self, prices, your_prices):
+        """
+        Same as calling contract for each price in prices, in order, where
+        your_prices are the prices of this seller's own contracts among them.
+        """
+        self.prices.extend(prices)
+        self.contracts.extend(your_prices)
+        self.costs.current_unit += len(your_prices)
+
+class GD_Seller:
+    """
+    A Seller who can ask in a Double Auction Spot Market.
+    Modeled after the belief-based strategy of Gjerstad & Dickhaut (1998):
+    the ask maximizes belief(ask) * (ask - cost), the belief that an ask is
+    accepted coming from the shouts and contracts of the last memory
+    contracts (see shout_history.ShoutHistory).  Asks are searched on
+    candidates evenly spaced prices between the standing ask and the higher
+    of cost and standing bid, where the standing bid is sure to be taken.
+    With no history yet (or no double auction) it asks like ZI_Seller.
+    """
+    memory = 5
+    candidates = 20
+
+    def __init__(self, name, unit_costs):
+        self.name = name
+        self.type = 'S'
+        self.costs = UnitCosts(name, unit_costs)
+        self.prices = []
+        self.contracts = []
+        self.history = None
+
+    def __repr__(self):
+        return f"{self.type}--{self.name} {self.costs.unit_costs} current unit = {self.costs.current_unit}"
+
+    def attach(self, da):
+        """
+        Shares the shout history of the double auction da registered with.
+        """
+        self.history = shout_history.shared(da, self.memory)
+
+    def ask(self, standing_bid, standing_ask, num_round, total_rounds):
+        cost = self.costs.current
+        if cost == None or standing_ask <= cost:
+            return None
+        if not self.history:
+            return self.name, "ask", rnd.uniform(cost, standing_ask)
+
+        belief = self.history.ask_belief
+        bottom = max(cost, standing_bid)
+        step = (standing_ask - bottom) / self.candidates
+        best, best_surplus = None, 0
+        for k in range(1, self.candidates + 1):
+            price = standing_ask - k * step
+            surplus = (1.0 if price <= standing_bid else belief(price)) * (price - cost)
+            if surplus > best_surplus:
+                best, best_surplus = price, surplus
+        if best is None:
+            return None
+        return self.name, "ask", best
+
+    def snapshot_state(self):
+        return self.history.snapshot() if self.history is not None else None
+
+    def restore_state(self, state):
+        if state is not None:
+            self.history.restore(state)
+
+    def contract(self, price, your_contract):
+        """
+        Buyer becomes informed about contract prices from Double Auction.
+        Buyer must be registered with Double Auction to get price information.
+        If your_contract == True buyer learns they have a contract at price.
+        If your_contract == True buyer updates their current_unit.
+        """
+        self.prices.append(price)
+        if your_contract:
+            self.contracts.append(price)
+            self.costs.current_unit += 1
+
+    def contract_batch(self, prices, your_prices):
+        """
+        Same as calling contract for each price in prices, in order, where
+        your_prices are the prices of this seller's own contracts among them.
+        """
+        self.prices.extend(prices)
+        self.contracts.extend(your_prices)
+        self.costs.current_unit += len(your_prices)
+
 if __name__ == "__main__":
     print()
     print("Testing UnitCosts class")
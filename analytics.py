@@ -0,0 +1,166 @@
+import numpy as np
+
+class MarketRecords:
+    """
+    Collects the tokens, trades and contract prices of many periods, one
+    add(sim) per period, for the vectorized measures in this module.
+    arrays() stacks them, padded with nan (tokens, prices) or 0 (trades):
+        values, (periods, buyers, units) buyer reservation values
+        costs, (periods, sellers, units) seller unit costs
+        buyer_trades, seller_trades, (periods, seats) units each trader traded
+        prices, (periods, max contracts) contract prices in order
+        equilibrium, (periods, 4) eq_units, eq_price_low, eq_price_high,
+                     max_surplus (nan prices when there is no equilibrium)
+    """
+    def __init__(self):
+        self.periods = []
+
+    def add(self, sim):
+        """
+        Records the period just run by sim (a MarketSim).
+        """
+        buyers, sellers = sim.env.buyers, sim.env.sellers
+        eq_units, eq_price_low, eq_price_high, max_surplus = sim.env.get_equilibrium()
+        self.periods.append((
+            [buyer.values.reservation_values for buyer in buyers],
+            [seller.costs.unit_costs for seller in sellers],
+            [len(buyer.contracts) for buyer in buyers],
+            [len(seller.contracts) for seller in sellers],
+            np.asarray(sim.da.prices, dtype=float),
+            [eq_units, np.nan if eq_price_low is None else eq_price_low,
+             np.nan if eq_price_high is None else eq_price_high, max_surplus]))
+
+    def __len__(self):
+        return len(self.periods)
+
+    def arrays(self):
+        periods = len(self.periods)
+        num_buyers = max(len(period[0]) for period in self.periods)
+        num_sellers = max(len(period[1]) for period in self.periods)
+        units = max(len(tokens) for period in self.periods for tokens in period[0] + period[1])
+        contracts = max(1, max(len(period[4]) for period in self.periods))
+        values = np.full((periods, num_buyers, units), np.nan)
+        costs = np.full((periods, num_sellers, units), np.nan)
+        buyer_trades = np.zeros((periods, num_buyers), dtype=np.int64)
+        seller_trades = np.zeros((periods, num_sellers), dtype=np.int64)
+        prices = np.full((periods, contracts), np.nan)
+        for row, (buyer_tokens, seller_tokens, bought, sold, period_prices, _) in enumerate(self.periods):
+            for k, tokens in enumerate(buyer_tokens):
+                values[row, k, :len(tokens)] = tokens
+            for k, tokens in enumerate(seller_tokens):
+                costs[row, k, :len(tokens)] = tokens
+            buyer_trades[row, :len(bought)] = bought
+            seller_trades[row, :len(sold)] = sold
+            prices[row, :len(period_prices)] = period_prices
+        equilibrium = np.array([period[5] for period in self.periods], dtype=float)
+        return {'values': values, 'costs': costs, 'buyer_trades': buyer_trades,
+                'seller_trades': seller_trades, 'prices': prices, 'equilibrium': equilibrium}
+
+def price_deviation(prices, p0):
+    """
+    Returns the root mean squared deviation of each period's contract
+    prices from p0, and Smith's alpha, the same as a percentage of p0.
+    args:
+        prices, (periods, contracts) padded with nan.
+        p0, (periods,) equilibrium price.
+    """
+    count = np.count_nonzero(~np.isnan(prices), axis=1)
+    squares = np.nansum((prices - p0[:, None]) ** 2, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rmsd = np.where(count > 0, np.sqrt(squares / count), np.nan)
+        alpha = 100.0 * rmsd / p0
+    return rmsd, alpha
+
+def marginal(tokens, eq_units, descending):
+    """
+    Marks the intra-marginal tokens of each period: the eq_units highest
+    values (descending) or lowest costs across all traders of a side.
+    args:
+        tokens, (periods, seats, units) padded with nan.
+        eq_units, (periods,)
+    returns:
+        bool array shaped like tokens
+    """
+    periods = tokens.shape[0]
+    flat = tokens.reshape(periods, -1)
+    key = np.where(np.isnan(flat), np.inf, -flat if descending else flat)
+    order = np.argsort(key, axis=1, kind='stable')
+    rank = np.empty_like(order)
+    np.put_along_axis(rank, order, np.arange(flat.shape[1])[None, :], axis=1)
+    return (rank < eq_units[:, None]).reshape(tokens.shape)
+
+def traded(tokens, trades):
+    """
+    Marks the tokens each trader traded: units are used in order, so the
+    first trades units of each trader (up to their number of tokens).
+    """
+    return (np.arange(tokens.shape[2])[None, None, :] < trades[:, :, None]) & ~np.isnan(tokens)
+
+def loss_decomposition(values, costs, buyer_trades, seller_trades, eq_units, p0):
+    """
+    Splits each period's lost surplus, measured at the equilibrium price
+    p0, into missed trades of intra-marginal units and trades of
+    extra-marginal units.  The two add up to max_surplus minus the
+    actual surplus whenever every contract used a real token on both sides.
+    returns:
+        missed, surplus of intra-marginal units that did not trade
+        extra, loss from extra-marginal units that did trade
+        extra_trades, number of extra-marginal units traded
+    """
+    intra_b = marginal(values, eq_units, descending=True)
+    intra_s = marginal(costs, eq_units, descending=False)
+    traded_b = traded(values, buyer_trades)
+    traded_s = traded(costs, seller_trades)
+    p = p0[:, None, None]
+    missed = (np.where(intra_b & ~traded_b, values - p, 0.0).sum(axis=(1, 2))
+              + np.where(intra_s & ~traded_s, p - costs, 0.0).sum(axis=(1, 2)))
+    extra = (np.where(~intra_b & traded_b, p - values, 0.0).sum(axis=(1, 2))
+             + np.where(~intra_s & traded_s, costs - p, 0.0).sum(axis=(1, 2)))
+    extra_trades = (~intra_b & traded_b).sum(axis=(1, 2)) + (~intra_s & traded_s).sum(axis=(1, 2))
+    return missed, extra, extra_trades
+
+def analyze(records):
+    """
+    Computes market-performance measures of every period at once.
+    args:
+        records, a MarketRecords or the dictionary of its arrays().
+    returns:
+        {measure: array (periods,)} for
+            efficiency, actual surplus as a percentage of max_surplus
+            rmsd, root mean squared deviation of prices from the
+                  equilibrium midpoint
+            alpha, Smith's alpha (rmsd as a percentage of the midpoint)
+            trade_ratio, contracts / eq_units
+            missed_loss, surplus lost to intra-marginal units not traded
+            extra_loss, surplus lost to extra-marginal units traded
+            extra_trades, number of extra-marginal units traded
+    """
+    data = records.arrays() if isinstance(records, MarketRecords) else records
+    values, costs = data['values'], data['costs']
+    buyer_trades, seller_trades = data['buyer_trades'], data['seller_trades']
+    eq_units, eq_price_low, eq_price_high, max_surplus = data['equilibrium'].T
+    eq_units = eq_units.astype(np.int64)
+    p0 = (eq_price_low + eq_price_high) / 2.0
+
+    traded_b = traded(values, buyer_trades)
+    traded_s = traded(costs, seller_trades)
+    actual = np.where(traded_b, values, 0.0).sum(axis=(1, 2)) - np.where(traded_s, costs, 0.0).sum(axis=(1, 2))
+    contracts = np.count_nonzero(~np.isnan(data['prices']), axis=1)
+    rmsd, alpha = price_deviation(data['prices'], p0)
+    missed, extra, extra_trades = loss_decomposition(values, costs, buyer_trades, seller_trades,
+                                                     eq_units, np.nan_to_num(p0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        efficiency = 100.0 * actual / max_surplus
+        trade_ratio = contracts / eq_units
+    return {'efficiency': efficiency, 'rmsd': rmsd, 'alpha': alpha, 'trade_ratio': trade_ratio,
+            'missed_loss': missed, 'extra_loss': extra, 'extra_trades': extra_trades}
+
+def report(analysis):
+    """
+    Neatly prints the mean of each measure over the periods with an equilibrium.
+    """
+    for measure, values in analysis.items():
+        values = np.asarray(values, dtype=float)
+        values = values[np.isfinite(values)]
+        mean = values.mean() if len(values) else np.nan
+        print(f"Mean {measure.replace('_', ' ').title()}: {mean:.2f}")
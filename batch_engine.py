@@ -0,0 +1,284 @@
+import random as rnd
+
+import numpy as np
+
+import spot_market_environment as environment
+import token_bank
+
+STARTING_BID = 0
+STARTING_ASK = 999
+MARKET = -1         # bid_id / ask_id of the starting quotes
+
+class BatchMarkets:
+    """
+    Steps many independent markets of one configuration at once.
+    Every market has the seats of the configuration with its own token
+    draws, a standing bid and ask (as DoubleAuction with the 'standing'
+    book) and its own arrival sequence.  Each round, the markets whose
+    arriving trader has the same strategy are decided in one call to the
+    strategy's bid_batch / ask_batch; strategies without one fall back to
+    their scalar bid / ask, market by market.  Matching is vectorized over
+    all markets.
+    Random draws come from a numpy Generator, so runs are reproducible
+    from seed but do not repeat MarketSim's draws one for one.
+    The per-market arrays of a round (prices from decide(), contract from
+    match()) are buffers allocated once and overwritten every round;
+    only index arrays sized by the markets of a group or the contracts
+    of the round are allocated.
+    args:
+        config, per-seat configuration dictionary laid out as in the TOML files.
+        markets, number of markets.
+        sim_period, rounds per period.
+        seed, seed of the tokens, arrivals and strategy draws.
+        bank, optional token_bank.TokenBank to take the tokens from
+              (markets rounds per period, in order).
+        agent, optional seat name (e.g. 'B1') whose orders are supplied by
+               the caller; decide() leaves its markets at nan.
+    """
+    def __init__(self, config, markets, sim_period, seed = 0, bank = None, agent = None):
+        self.config = config
+        self.markets = markets
+        self.sim_period = sim_period
+        self.seed = seed
+        self.bank = bank
+        self.buyer_seats = token_bank.seats(config, 'B')
+        self.seller_seats = token_bank.seats(config, 'S')
+        self.num_buyers = len(self.buyer_seats)
+        self.num_sellers = len(self.seller_seats)
+        self.agent = agent
+        self.agent_arrival = -1     # arrival index of the agent seat
+        self.groups = []    # (side, strategy class, seat indices)
+        for side, seats, types in (('B', self.buyer_seats, environment.buyer_types),
+                                   ('S', self.seller_seats, environment.seller_types)):
+            classes = {}
+            for k, seat in enumerate(seats):
+                if seat['name'] == agent:
+                    self.agent_arrival = k if side == 'B' else self.num_buyers + k
+                    continue
+                classes.setdefault(types[seat['trader_type']], []).append(k)
+            self.groups.extend((side, cls, np.array(ks)) for cls, ks in classes.items())
+        self.arrival_group = np.full(self.num_buyers + self.num_sellers, -1)   # arrival -> group index
+        for g, (side, _, seats) in enumerate(self.groups):
+            self.arrival_group[seats if side == 'B' else seats + self.num_buyers] = g
+        self.prices = np.empty(markets)
+        self.fraction = np.empty(markets)
+        self.group = np.empty(markets, dtype=self.arrival_group.dtype)
+        self.in_group = np.empty(markets, dtype=bool)
+        self.is_bid = np.empty(markets, dtype=bool)
+        self.is_ask = np.empty(markets, dtype=bool)
+        self.bid_contract = np.empty(markets, dtype=bool)
+        self.ask_contract = np.empty(markets, dtype=bool)
+        self.bid_standing = np.empty(markets, dtype=bool)
+        self.ask_standing = np.empty(markets, dtype=bool)
+        self.contract = np.empty(markets, dtype=bool)
+        self.seller_seat = np.empty(markets, dtype=self.arrival_group.dtype)
+        self.reset()
+
+    def reset(self):
+        """
+        Reseeds and starts the first period.
+        """
+        self.rng = np.random.default_rng(self.seed)
+        rnd.seed(self.seed)
+        self.period = 0
+        self.new_period()
+
+    def new_period(self):
+        """
+        Draws new tokens (or takes the bank's next rounds) and clears every
+        market, without reseeding.
+        """
+        if self.bank is not None:
+            rows = (self.period * self.markets + np.arange(self.markets)) % self.bank.rounds
+            values = self.bank.values[rows]
+            costs = self.bank.costs[rows]
+            table = self.bank.equilibrium_table[rows]
+        else:
+            values = token_bank.draw_tokens(self.rng, self.markets, self.buyer_seats, descending=True)
+            costs = token_bank.draw_tokens(self.rng, self.markets, self.seller_seats, descending=False)
+            table = token_bank.equilibria(values, costs,
+                                          sum(seat['num_units'] for seat in self.buyer_seats),
+                                          sum(seat['num_units'] for seat in self.seller_seats))
+        self.max_surplus = table[:, 3].astype(float)
+        self.eq_units = table[:, 0]
+        self.values = self.token_array(values, self.buyer_seats)
+        self.costs = self.token_array(costs, self.seller_seats)
+        self.lowest = (np.nanmin(self.values, axis=2), np.nanmin(self.costs, axis=2))
+        self.highest = (np.nanmax(self.values, axis=2), np.nanmax(self.costs, axis=2))
+        self.buyer_unit = np.zeros((self.markets, self.num_buyers), dtype=np.int64)
+        self.seller_unit = np.zeros((self.markets, self.num_sellers), dtype=np.int64)
+        self.buyer_surplus = np.zeros((self.markets, self.num_buyers))
+        self.seller_surplus = np.zeros((self.markets, self.num_sellers))
+        self.contracts = np.zeros(self.markets, dtype=np.int64)
+        self.standing_bid = np.full(self.markets, STARTING_BID, dtype=float)
+        self.standing_ask = np.full(self.markets, STARTING_ASK, dtype=float)
+        self.bid_id = np.full(self.markets, MARKET)
+        self.ask_id = np.full(self.markets, MARKET)
+        self.last_price = np.full(self.markets, np.nan)
+        self.scalar_traders = {}
+        self.period += 1
+
+    @staticmethod
+    def token_array(tokens, seats):
+        """
+        Returns padded token_bank tokens as floats with nan for missing
+        tokens, plus two nan columns so the current and next token of a
+        trader past their last unit read as nan.
+        """
+        units = np.array([seat['num_units'] for seat in seats])
+        array = tokens.astype(float)
+        array[:, np.arange(array.shape[2])[None, :] >= units[:, None]] = np.nan
+        pad = np.full(array.shape[:2] + (2,), np.nan)
+        return np.concatenate([array, pad], axis=2)
+
+    def scalar_trader(self, side, market, seat):
+        """
+        Returns the scalar strategy object used for one seat of one market
+        by strategies without a batch form, built on first use.
+        """
+        key = (side, market, seat)
+        if key not in self.scalar_traders:
+            if side == 'B':
+                config_seat = self.buyer_seats[seat]
+                tokens = self.values[market, seat]
+                cls = environment.buyer_types[config_seat['trader_type']]
+            else:
+                config_seat = self.seller_seats[seat]
+                tokens = self.costs[market, seat]
+                cls = environment.seller_types[config_seat['trader_type']]
+            tokens = [int(token) for token in tokens[~np.isnan(tokens)]]
+            self.scalar_traders[key] = cls(config_seat['name'], tokens)
+        return self.scalar_traders[key]
+
+    def arrive(self):
+        """
+        Draws the arriving trader of every market: buyer seat k is k,
+        seller seat k is num_buyers + k.
+        """
+        return self.rng.integers(0, self.num_buyers + self.num_sellers, self.markets)
+
+    def decide(self, arrivals, round):
+        """
+        Returns each market's order price for its arriving trader, nan for
+        no order, in the self.prices buffer.
+        """
+        prices = self.prices
+        prices.fill(np.nan)
+        self.fraction.fill(round / self.sim_period)
+        np.take(self.arrival_group, arrivals, out=self.group)
+        for g, (side, cls, seats) in enumerate(self.groups):
+            np.equal(self.group, g, out=self.in_group)
+            markets = np.flatnonzero(self.in_group)
+            if len(markets) == 0:
+                continue
+            if side == 'B':
+                seat = arrivals[markets]
+                tokens, units, k = self.values, self.buyer_unit, 0
+            else:
+                seat = arrivals[markets] - self.num_buyers
+                tokens, units, k = self.costs, self.seller_unit, 1
+            unit = units[markets, seat]
+            batch = getattr(cls, 'bid_batch' if side == 'B' else 'ask_batch', None)
+            if batch is not None:
+                current = tokens[markets, seat, unit]
+                next_token = tokens[markets, seat, unit + 1]
+                np.copyto(next_token, current, where=np.isnan(next_token))
+                prices[markets] = batch(self.standing_bid[markets], self.standing_ask[markets],
+                                        current, next_token,
+                                        self.lowest[k][markets, seat], self.highest[k][markets, seat],
+                                        self.fraction[:len(markets)], self.rng)
+                continue
+            for market, s, u in zip(markets.tolist(), seat.tolist(), unit.tolist()):
+                trader = self.scalar_trader(side, market, s)
+                if side == 'B':
+                    trader.values.current_unit = u
+                    order = trader.bid(self.standing_bid[market], self.standing_ask[market], round, self.sim_period)
+                else:
+                    trader.costs.current_unit = u
+                    order = trader.ask(self.standing_bid[market], self.standing_ask[market], round, self.sim_period)
+                if order is not None:
+                    prices[market] = order[2]
+        return prices
+
+    def match(self, arrivals, prices):
+        """
+        Processes each market's order against its standing bid and ask, as
+        DoubleAuction.order does with the 'standing' book.
+        returns:
+            contract, bool array of the markets that traded this round
+                      (the self.contract buffer)
+        """
+        is_bid, is_ask = self.is_bid, self.is_ask
+        bid_contract, ask_contract = self.bid_contract, self.ask_contract
+        bid_standing, ask_standing = self.bid_standing, self.ask_standing
+        contract = self.contract
+        # comparisons with a nan price (no order) are all False
+        np.less(arrivals, self.num_buyers, out=is_bid)
+        np.logical_not(is_bid, out=is_ask)
+        np.greater_equal(prices, self.standing_ask, out=bid_contract)
+        bid_contract &= is_bid
+        np.less_equal(prices, self.standing_bid, out=ask_contract)
+        ask_contract &= is_ask
+        np.less(prices, self.standing_ask, out=contract)     # inside the quotes
+        np.greater(prices, self.standing_bid, out=bid_standing)
+        bid_standing &= contract
+        np.copyto(ask_standing, bid_standing)
+        bid_standing &= is_bid
+        ask_standing &= is_ask
+        np.logical_or(bid_contract, ask_contract, out=contract)
+
+        markets = np.flatnonzero(contract)
+        bid = is_bid[markets]
+        price = np.where(bid, self.standing_ask[markets], self.standing_bid[markets])
+        buyer = np.where(bid, arrivals[markets], self.bid_id[markets])
+        seller = np.where(bid, self.ask_id[markets], arrivals[markets] - self.num_buyers)
+        for seats, tokens, units, surplus, sign in (
+                (buyer, self.values, self.buyer_unit, self.buyer_surplus, 1),
+                (seller, self.costs, self.seller_unit, self.seller_surplus, -1)):
+            traded = seats >= 0
+            m, s = markets[traded], seats[traded]
+            token = tokens[m, s, units[m, s]]
+            surplus[m, s] += np.where(np.isnan(token), 0.0, sign * (token - price[traded]))
+            # strategies such as Ringuette still trade past their last token;
+            # their unit stops on the nan padding
+            units[m, s] = np.minimum(units[m, s] + 1, tokens.shape[2] - 2)
+        self.contracts[markets] += 1
+        self.last_price[markets] = price
+
+        np.copyto(self.standing_bid, prices, where=bid_standing)
+        np.copyto(self.bid_id, arrivals, where=bid_standing)
+        np.copyto(self.standing_ask, prices, where=ask_standing)
+        np.subtract(arrivals, self.num_buyers, out=self.seller_seat)
+        np.copyto(self.ask_id, self.seller_seat, where=ask_standing)
+        np.copyto(self.standing_bid, STARTING_BID, where=contract)
+        np.copyto(self.standing_ask, STARTING_ASK, where=contract)
+        np.copyto(self.bid_id, MARKET, where=contract)
+        np.copyto(self.ask_id, MARKET, where=contract)
+        return contract
+
+    def step(self, round):
+        """
+        Runs one round in every market.
+        """
+        arrivals = self.arrive()
+        return self.match(arrivals, self.decide(arrivals, round))
+
+    def run(self):
+        """
+        Runs a whole period in every market.
+        returns:
+            actual_surplus, efficiency, arrays (markets,)
+            buyer_surplus, seller_surplus, arrays (markets, seats)
+        """
+        for round in range(self.sim_period):
+            self.step(round)
+        actual_surplus = self.buyer_surplus.sum(axis=1) + self.seller_surplus.sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            efficiency = actual_surplus / self.max_surplus * 100.0
+        return actual_surplus, efficiency, self.buyer_surplus, self.seller_surplus
+
+if __name__ == "__main__":
+    import toml
+    markets = BatchMarkets(toml.load("config files/config_test_HorseRace.toml"), 5000, 100)
+    actual_surplus, efficiency, _, _ = markets.run()
+    print(f"Mean Efficiency: {np.nanmean(efficiency):.2f}")
@@ -0,0 +1,247 @@
+import time
+import tracemalloc
+import random as rnd
+import numpy as np
+import toml
+
+import batch_engine
+import double_auction as institution
+import market_simulator_v2 as msim
+import order_trace
+import Simulator.Buyer.buyer as buyer
+import Simulator.Seller.seller as seller
+
+def build_auction(num_traders = 50, book_type = "standing"):
+    """
+    Builds a DoubleAuction with num_traders ZI buyers and num_traders ZI sellers.
+    args:
+        num_traders, number of buyers (and of sellers).
+        book_type, 'standing', 'depth' or 'ladder'.
+    returns:
+        da, the double auction
+    """
+    da = institution.DoubleAuction("bench market", book_type)
+    for k in range(num_traders):
+        da.register(buyer.ZI_Buyer(f"B{k + 1}", [400, 300, 200]))
+    for k in range(num_traders):
+        da.register(seller.ZI_Seller(f"S{k + 1}", [100, 200, 300]))
+    return da
+
+def random_orders(num_orders, num_traders = 50, seed = 0):
+    """
+    Draws random order flow for build_auction(num_traders).
+    returns:
+        traders, sides, prices arrays for submit_batch
+    """
+    rng = np.random.default_rng(seed)
+    traders = rng.integers(0, 2 * num_traders, num_orders)
+    sides = np.where(traders < num_traders, institution.BID, institution.ASK)
+    prices = np.where(sides == institution.BID,
+                      rng.uniform(50, 300, num_orders),
+                      rng.uniform(200, 450, num_orders))
+    return traders, sides, prices
+
+def bench_order_api(num_orders = 200000, num_traders = 50, book_type = "standing"):
+    """
+    Compares orders/sec of DoubleAuction.order against DoubleAuction.submit_batch
+    on the same order flow, and checks that both leave identical books and
+    participants.
+    returns:
+        order_rate, batch_rate in orders per second
+    """
+    traders, sides, prices = random_orders(num_orders, num_traders)
+
+    da = build_auction(num_traders, book_type)
+    names = [p.name for p in da.participants]
+    orders = [(names[t], "bid" if s == institution.BID else "ask", p)
+              for t, s, p in zip(traders.tolist(), sides.tolist(), prices.tolist())]
+    start = time.perf_counter()
+    for order in orders:
+        da.order(order)
+    order_time = time.perf_counter() - start
+
+    da_batch = build_auction(num_traders, book_type)
+    start = time.perf_counter()
+    da_batch.submit_batch(traders, sides, prices)
+    batch_time = time.perf_counter() - start
+
+    assert da.book.book == da_batch.book.book, "book logs differ"
+    assert da.contracts == da_batch.contracts, "contracts differ"
+    for a, b in zip(da.participants, da_batch.participants):
+        assert (a.prices, a.contracts) == (b.prices, b.contracts), f"{a.name} differs"
+    order_rate = num_orders / order_time
+    batch_rate = num_orders / batch_time
+    print(f"{book_type} book, {num_orders} orders: order() {order_rate:,.0f}/s, "
+          f"submit_batch() {batch_rate:,.0f}/s ({batch_rate / order_rate:.1f}x)")
+    return order_rate, batch_rate
+
+def bench_price_ladder(sizes = (50, 500, 5000), num_orders = 100000):
+    """
+    Times order() and best-price lookups on whole-number order flow for
+    the standing-quote book and the depth and ladder books, with sizes
+    buyers and as many sellers.  The depth books hold up to one resting
+    order per trader and side, so they get deeper with size.  Contracts
+    are not broadcast, so the times are those of the books.
+    returns:
+        {(size, book_type): (orders per second, resting orders at the end,
+                             best() lookups per second)}
+    """
+    results = {}
+    for size in sizes:
+        traders, sides, prices = random_orders(num_orders, size)
+        for book_type in ("standing", "depth", "ladder"):
+            da = build_auction(size, book_type)
+            da.broadcast = False
+            names = [p.name for p in da.participants]
+            orders = [(names[t], "bid" if side == institution.BID else "ask", price)
+                      for t, side, price in zip(traders.tolist(), sides.tolist(),
+                                                np.rint(prices).astype(int).tolist())]
+            start = time.perf_counter()
+            for order in orders:
+                da.order(order)
+            order_rate = num_orders / (time.perf_counter() - start)
+            resting = len(getattr(da.book, 'orders', ()))
+            best_rate = 0.0
+            if da.book.continuous:
+                start = time.perf_counter()
+                for _ in range(num_orders):
+                    da.book.best('bid')
+                    da.book.best('ask')
+                best_rate = 2 * num_orders / (time.perf_counter() - start)
+            results[(size, book_type)] = (order_rate, resting, best_rate)
+            print(f"{size:>5} traders a side, {book_type:<8} book: order() {order_rate:10,.0f}/s, "
+                  f"{resting:>5} resting, best() {best_rate:12,.0f}/s")
+    return results
+
+def bench_ringuette_late_round(num_calls = 100000):
+    """
+    Times Ringuette bid/ask calls in the last rounds of a period, where they
+    hand over to their Skeleton delegate, and measures the memory allocated
+    per call.  For reference it also times building a new Skeleton per call.
+    returns:
+        {label: (microseconds per call, bytes allocated per call)}
+    """
+    def measure(call):
+        call()
+        tracemalloc.start()
+        start = time.perf_counter()
+        for _ in range(num_calls):
+            call()
+        elapsed = time.perf_counter() - start
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return 1e6 * elapsed / num_calls, current / num_calls, peak
+
+    ringuette_buyer = buyer.Ringuette_Buyer("B1", [400, 300, 200])
+    ringuette_seller = seller.Ringuette_Seller("S1", [100, 200, 300])
+    values = ringuette_buyer.values.reservation_values
+    costs = ringuette_seller.costs.unit_costs
+    results = {
+        "Ringuette_Buyer.bid": measure(lambda: ringuette_buyer.bid(150, 250, 95, 100)),
+        "Ringuette_Seller.ask": measure(lambda: ringuette_seller.ask(150, 250, 95, 100)),
+        "new Skeleton_Buyer per call": measure(
+            lambda: buyer.Skeleton_Buyer("B1", values).bid(150, 250, 95, 100)),
+        "new Skeleton_Seller per call": measure(
+            lambda: seller.Skeleton_Seller("S1", costs).ask(150, 250, 95, 100)),
+    }
+    for label, (micros, retained, peak) in results.items():
+        print(f"{label:<30} {micros:6.2f} us/call, {retained:5.1f} bytes retained/call, peak {peak} bytes")
+    return results
+
+def bench_large_market(sizes = (100, 1000, 10000), rounds_per_trader = 5, periods = 3):
+    """
+    Times whole periods of population-form markets (see
+    MarketSim.load_population) with sizes buyers and as many sellers, with
+    rounds_per_trader rounds per trader so that the work per trader is the
+    same at every size.  Near-linear scaling shows as a constant
+    microseconds per trader-round.
+    returns:
+        {size: (periods per second, microseconds per trader-round)}
+    """
+    results = {}
+    for size in sizes:
+        config = {'buyers': {'count': size, 'num_units': 3, 'min_value': 200, 'max_value': 400,
+                             'mix': {'Kaplan': 0.4, 'Zero Intelligence': 0.6}},
+                  'sellers': {'count': size, 'num_units': 3, 'min_value': 100, 'max_value': 300,
+                              'mix': {'Kaplan': 0.4, 'Zero Intelligence': 0.6}}}
+        num_rounds = 2 * size * rounds_per_trader
+        start = time.perf_counter()
+        for period in range(periods):
+            rnd.seed(period)
+            sim = msim.MarketSim("bench", f"Market {period}")
+            sim.load_config_dict(config)
+            sim.calc_market()
+            sim.sim_period_silent(num_rounds)
+        elapsed = time.perf_counter() - start
+        results[size] = (periods / elapsed, 1e6 * elapsed / (periods * num_rounds))
+        print(f"{size:>6} buyers + {size:>6} sellers, {num_rounds:>7} rounds: "
+              f"{results[size][0]:8.2f} periods/s, {results[size][1]:6.2f} us per trader-round")
+    return results
+
+def bench_replay(trace, repeat = 5):
+    """
+    Replays a recorded order flow (an order_trace.Trace) through
+    DoubleAuction.order, one order at a time, and through one
+    submit_batch call, with no strategy calls.
+    returns:
+        order_rate, batch_rate in orders per second
+    """
+    orders = trace.orders
+    names = trace.names
+    flow = [(names[t] if t >= 0 else "unknown", "bid" if side == institution.BID else "ask", price)
+            for t, side, price in zip(orders['trader'].tolist(), orders['side'].tolist(),
+                                      orders['price'].tolist())]
+    order_time = batch_time = 0.0
+    for _ in range(repeat):
+        da = order_trace.replay_auction(trace)
+        start = time.perf_counter()
+        for order in flow:
+            da.order(order)
+        order_time += time.perf_counter() - start
+
+        da = order_trace.replay_auction(trace)
+        start = time.perf_counter()
+        da.submit_batch(orders['trader'], orders['side'], orders['price'], orders['quantity'])
+        batch_time += time.perf_counter() - start
+    order_rate = repeat * len(orders) / order_time
+    batch_rate = repeat * len(orders) / batch_time
+    print(f"replay of {len(orders)} recorded orders: order() {order_rate:,.0f}/s, "
+          f"submit_batch() {batch_rate:,.0f}/s")
+    return order_rate, batch_rate
+
+def bench_batch_markets(config, markets = 2000, sim_period = 100, periods = 200):
+    """
+    Times whole periods of a configuration run one market at a time
+    through MarketSim and all at once through batch_engine.BatchMarkets.
+    returns:
+        scalar_rate, batch_rate in market-periods per second
+    """
+    start = time.perf_counter()
+    for period in range(periods):
+        rnd.seed(period)
+        sim = msim.MarketSim("bench", f"Market {period}")
+        sim.load_config_dict(config)
+        sim.calc_market()
+        sim.sim_period_silent(sim_period)
+    scalar_rate = periods / (time.perf_counter() - start)
+    start = time.perf_counter()
+    batch_engine.BatchMarkets(config, markets, sim_period).run()
+    batch_rate = markets / (time.perf_counter() - start)
+    print(f"{sim_period}-round periods: MarketSim {scalar_rate:,.0f}/s, "
+          f"BatchMarkets x{markets} {batch_rate:,.0f}/s")
+    return scalar_rate, batch_rate
+
+if __name__ == "__main__":
+    rnd.seed(0)
+    bench_order_api()
+    bench_order_api(book_type = "depth")
+    bench_order_api(book_type = "ladder")
+    bench_price_ladder()
+    bench_ringuette_late_round()
+    bench_large_market()
+    config = {'buyers': {'count': 500, 'num_units': 3, 'min_value': 200, 'max_value': 400,
+                         'mix': {'Kaplan': 0.4, 'Zero Intelligence': 0.6}},
+              'sellers': {'count': 500, 'num_units': 3, 'min_value': 100, 'max_value': 300,
+                          'mix': {'Kaplan': 0.4, 'Zero Intelligence': 0.6}}}
+    bench_replay(order_trace.record_period(config, 20000, 0)[1])
+    bench_batch_markets(toml.load("config files/config_test_ZI.toml"))
@@ -0,0 +1,286 @@
+import tkinter as tk
+import warnings
+from tkinter import messagebox, ttk
+
+import numpy as np
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from matplotlib.figure import Figure
+
+import double_auction as institution
+
+ACTIONS = ('start', 'standing', 'contract', 'rejected')
+
+class BookLog:
+    """
+    Columnar copy of a DoubleAuction's order log and contracts, built in
+    one pass so that filters are numpy masks rather than loops over the
+    log's dictionaries.
+    seq, side (BID / ASK), amount (nan for none), action (index into
+    ACTIONS), trader (index into names) and filled units for each log
+    entry, and price, buyer and seller for each contract.
+    args:
+        da, the DoubleAuction.
+    """
+    def __init__(self, da):
+        self.continuous = da.book.continuous
+        self.names = []
+        codes = {}
+        log = da.book.book
+        seqs = [seq for seq in range(1, da.book.sequence_number) if seq in log]
+        entries = [log[seq] for seq in seqs]
+        self.seq = np.array(seqs, dtype=np.int64)
+
+        def code(name):
+            if name not in codes:
+                codes[name] = len(self.names)
+                self.names.append(name)
+            return codes[name]
+
+        action_codes = {action: k for k, action in enumerate(ACTIONS)}
+        self.trader = np.array([code(entry['id']) for entry in entries], dtype=np.int32)
+        self.side = np.array([institution.BID if entry['type'] == 'bid' else institution.ASK
+                              for entry in entries], dtype=np.int8)
+        self.amount = np.array([np.nan if entry['amount'] is None else entry['amount']
+                                for entry in entries], dtype=float)
+        self.action = np.array([action_codes.get(entry['action'], -1) for entry in entries], dtype=np.int8)
+        self.filled = np.array([entry.get('filled', 1) for entry in entries], dtype=np.int64)
+        self.price = np.array([contract[0] for contract in da.contracts], dtype=float)
+        self.buyer = np.array([code(contract[1]) for contract in da.contracts], dtype=np.int32)
+        self.seller = np.array([code(contract[2]) for contract in da.contracts], dtype=np.int32)
+
+    def __len__(self):
+        return len(self.seq)
+
+    def select(self, trader = None, actions = None, first = None, last = None):
+        """
+        Returns the rows of the log entries of trader (a name) with an
+        action in actions and a sequence number from first to last.
+        """
+        mask = np.ones(len(self.seq), dtype=bool)
+        if trader is not None:
+            mask &= self.trader == (self.names.index(trader) if trader in self.names else -1)
+        if actions is not None:
+            mask &= np.isin(self.action, [ACTIONS.index(action) for action in actions])
+        if first is not None:
+            mask &= self.seq >= first
+        if last is not None:
+            mask &= self.seq <= last
+        return np.flatnonzero(mask)
+
+    def select_contracts(self, trader = None):
+        """
+        Returns the indices of the contracts of trader (a name), or all.
+        """
+        if trader is None:
+            return np.arange(len(self.price))
+        k = self.names.index(trader) if trader in self.names else -1
+        return np.flatnonzero((self.buyer == k) | (self.seller == k))
+
+    def contract_seq(self):
+        """
+        Returns the sequence number of the order that made each contract
+        """
+        rows = self.action == ACTIONS.index('contract')
+        return np.repeat(self.seq[rows], self.filled[rows])
+
+    def quotes(self):
+        """
+        Returns the bid and ask series, one value per log entry.  For the
+        standing book these are the standing bid and ask after each entry;
+        a depth book's best quotes are not in its log, so for it they are
+        the prices of the bids and asks entered (nan elsewhere).
+        """
+        rows = np.arange(len(self.seq))
+        series = []
+        for side in (institution.BID, institution.ASK):
+            quote = self.side == side
+            if not self.continuous:
+                quote &= (self.action == ACTIONS.index('start')) | (self.action == ACTIONS.index('standing'))
+                last = np.maximum.accumulate(np.where(quote, rows, -1))
+                series.append(np.where(last >= 0, self.amount[np.maximum(last, 0)], np.nan))
+            else:
+                quote &= self.action != ACTIONS.index('rejected')
+                series.append(np.where(quote, self.amount, np.nan))
+        return series[0], series[1]
+
+def downsample(y, buckets = 1000):
+    """
+    Reduces a series to the min and max of each of buckets equal slices,
+    which keeps every spike visible when drawn as a band.
+    returns:
+        x, index of the first point of each slice
+        low, high, min and max of each slice (nan for an all-nan slice)
+    """
+    n = len(y)
+    if n <= 2 * buckets:
+        return np.arange(n), y, y
+    size = -(-n // buckets)
+    slices = np.concatenate([y, np.full(size * buckets - n, np.nan)]).reshape(buckets, size)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return np.arange(buckets) * size, np.nanmin(slices, axis=1), np.nanmax(slices, axis=1)
+
+class VirtualTable(tk.Frame):
+    """
+    Read-only table that only has widgets for the visible_rows rows on
+    screen.  row(k) supplies the values of row k when it scrolls into view.
+    """
+    def __init__(self, parent, columns, visible_rows = 20):
+        super().__init__(parent)
+        self.visible_rows = visible_rows
+        self.count = 0
+        self.row = None
+        self.first_row = 0
+        self.tree = ttk.Treeview(self, columns=columns, show="headings", height=visible_rows)
+        for column in columns:
+            self.tree.heading(column, text=column)
+            self.tree.column(column, width=100, stretch=True)
+        self.items = [self.tree.insert("", "end") for _ in range(visible_rows)]
+        self.tree.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.on_scroll)
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+        self.columnconfigure(0, weight=1)
+        self.tree.bind("<MouseWheel>", lambda event: self.scroll_to(self.first_row - event.delta // 120))
+        self.tree.bind("<Button-4>", lambda event: self.scroll_to(self.first_row - 1))
+        self.tree.bind("<Button-5>", lambda event: self.scroll_to(self.first_row + 1))
+
+    def set_rows(self, count, row):
+        self.count = count
+        self.row = row
+        self.scroll_to(0)
+
+    def scroll_to(self, first_row):
+        self.first_row = max(0, min(first_row, self.count - self.visible_rows))
+        self.render()
+
+    def on_scroll(self, action, amount, unit = None):
+        if action == "moveto":
+            self.scroll_to(int(float(amount) * self.count))
+        elif unit == "pages":
+            self.scroll_to(self.first_row + int(amount) * self.visible_rows)
+        else:
+            self.scroll_to(self.first_row + int(amount))
+
+    def render(self):
+        for k, item in enumerate(self.items):
+            row = self.first_row + k
+            if row < self.count:
+                self.tree.item(item, values=self.row(row))
+                self.tree.move(item, "", k)
+            else:
+                self.tree.detach(item)
+        if self.count:
+            self.scrollbar.set(self.first_row / self.count,
+                               min(1.0, (self.first_row + self.visible_rows) / self.count))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+class BookViewer(tk.Toplevel):
+    """
+    Window for inspecting a period's order log and contracts, in place of
+    printing them.  The log is paged lazily, filtered by trader, action and
+    sequence range, and the bid and ask (see BookLog.quotes) with the
+    contract prices are charted downsampled to the window's width.
+    args:
+        parent, the Tk parent window.
+        da, the DoubleAuction after the period.
+    """
+    def __init__(self, parent, da):
+        super().__init__(parent)
+        self.title(f"Order Book for {da.name}")
+        self.log = BookLog(da)
+        self.rows = np.arange(len(self.log))
+        self.contract_rows = np.arange(len(self.log.price))
+        self.bid, self.ask = self.log.quotes()
+        self.contract_at = self.log.contract_seq()
+
+        filters = tk.LabelFrame(self, text="Filter")
+        filters.grid(row=0, column=0, columnspan=2, padx=3, pady=3, sticky="ew")
+        tk.Label(filters, text="Trader:").grid(row=0, column=0, padx=3)
+        self.trader = ttk.Combobox(filters, values=["All"] + sorted(self.log.names), width=12)
+        self.trader.set("All")
+        self.trader.grid(row=0, column=1, padx=3)
+        self.actions = {}
+        for k, action in enumerate(ACTIONS):
+            self.actions[action] = tk.BooleanVar(value=True)
+            tk.Checkbutton(filters, text=action, variable=self.actions[action]).grid(row=0, column=2 + k)
+        tk.Label(filters, text="Seq from:").grid(row=1, column=0, padx=3)
+        self.first = tk.Entry(filters, width=10)
+        self.first.grid(row=1, column=1, padx=3, sticky="w")
+        tk.Label(filters, text="to:").grid(row=1, column=2, padx=3)
+        self.last = tk.Entry(filters, width=10)
+        self.last.grid(row=1, column=3, padx=3, sticky="w")
+        tk.Button(filters, text="Apply", command=self.apply).grid(row=1, column=5, padx=3)
+        self.count_label = tk.Label(filters, text="")
+        self.count_label.grid(row=1, column=6, padx=3)
+
+        tabs = ttk.Notebook(self)
+        tabs.grid(row=1, column=0, padx=3, pady=3, sticky="nsew")
+        self.orders = VirtualTable(tabs, ("seq", "action", "type", "amount", "trader"))
+        self.contracts = VirtualTable(tabs, ("#", "price", "buyer", "seller"))
+        tabs.add(self.orders, text="Orders")
+        tabs.add(self.contracts, text="Contracts")
+
+        self.figure = Figure(figsize=(6, 4))
+        self.axes = self.figure.add_subplot()
+        self.canvas = FigureCanvasTkAgg(self.figure, master=self)
+        self.canvas.get_tk_widget().grid(row=1, column=1, padx=3, pady=3, sticky="nsew")
+        self.columnconfigure(1, weight=1)
+        self.rowconfigure(1, weight=1)
+        self.apply()
+
+    def order_row(self, k):
+        log = self.log
+        row = self.rows[k]
+        amount = log.amount[row]
+        return (int(log.seq[row]), ACTIONS[log.action[row]] if log.action[row] >= 0 else "",
+                "bid" if log.side[row] == institution.BID else "ask",
+                "" if np.isnan(amount) else f"{amount:.2f}", log.names[log.trader[row]])
+
+    def contract_row(self, k):
+        log = self.log
+        row = self.contract_rows[k]
+        return (int(row) + 1, f"{log.price[row]:.2f}", log.names[log.buyer[row]], log.names[log.seller[row]])
+
+    def apply(self):
+        trader = self.trader.get()
+        trader = None if trader in ("", "All") else trader
+        actions = [action for action, var in self.actions.items() if var.get()]
+        try:
+            first = int(self.first.get()) if self.first.get().strip() else None
+            last = int(self.last.get()) if self.last.get().strip() else None
+        except ValueError:
+            messagebox.showerror("Error", "Seq from and to should be whole numbers", parent=self)
+            return
+        self.rows = self.log.select(trader, actions, first, last)
+        self.contract_rows = self.log.select_contracts(trader)
+        self.orders.set_rows(len(self.rows), self.order_row)
+        self.contracts.set_rows(len(self.contract_rows), self.contract_row)
+        self.count_label.config(text=f"{len(self.rows):,} orders, {len(self.contract_rows):,} contracts")
+        self.draw(first, last)
+
+    def draw(self, first = None, last = None):
+        """
+        Charts the bid and ask over the selected sequence range
+        """
+        log = self.log
+        start = np.searchsorted(log.seq, first) if first is not None else 0
+        stop = np.searchsorted(log.seq, last, side="right") if last is not None else len(log)
+        self.axes.clear()
+        buckets = max(100, self.canvas.get_tk_widget().winfo_width())
+        for series, color, label in ((self.bid[start:stop], "tab:blue", "bid"),
+                                     (self.ask[start:stop], "tab:red", "ask")):
+            x, low, high = downsample(series, buckets)
+            x = log.seq[start:stop][x] if len(x) else x
+            self.axes.fill_between(x, low, high, color=color, alpha=0.4, step="post", label=label)
+        seq = log.seq[start:stop]
+        if len(seq) and len(self.contract_at) == len(log.price):
+            inside = (self.contract_at >= seq[0]) & (self.contract_at <= seq[-1])
+            x, low, high = downsample(log.price[inside], buckets)
+            x = self.contract_at[inside][x] if len(x) else x
+            self.axes.vlines(x, low, high, color="black", linewidth=1)
+            self.axes.plot(x, high, ".", color="black", markersize=3, label="contract")
+        self.axes.set_xlabel("sequence number")
+        self.axes.set_ylabel("price")
+        self.axes.legend(loc="upper right")
+        self.canvas.draw_idle()
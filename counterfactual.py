@@ -0,0 +1,73 @@
+import os
+import random as rnd
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import market_simulator_v2 as msim
+
+_market = None      # (sim, snapshot) of this worker process
+
+def snapshot_at(config, seed, num_rounds, round, book_type = "standing"):
+    """
+    Builds the market of config seeded with seed, as sweep.run_period does,
+    and runs its period up to round.
+    returns:
+        sim, the MarketSim
+        snapshot, its MarketSnapshot at round
+    """
+    rnd.seed(seed)
+    sim = msim.MarketSim("counterfactual", f"Market {seed}", book_type)
+    sim.load_config_dict(config)
+    sim.calc_market()
+    traders = sim.start_period()
+    sim.run_rounds(traders, num_rounds, None, 0, round)
+    return sim, sim.snapshot(round)
+
+def set_market(sim, snapshot):
+    global _market
+    _market = (sim, snapshot)
+
+def run_branch_chunk(tasks):
+    """
+    Runs a list of (num_rounds, orders, seed) branches from this worker's
+    market.  Runs in a worker process.
+    """
+    sim, snapshot = _market
+    return [sim.run_branch(snapshot, num_rounds, orders, seed) for num_rounds, orders, seed in tasks]
+
+def run_branches(sim, snapshot, num_rounds, branches, workers = None, chunk_size = 10):
+    """
+    Runs many counterfactual continuations of one snapshot on a pool of
+    worker processes.  The market and snapshot are sent to each worker
+    once; every branch then restores the snapshot in place, so a branch
+    costs only the rounds it runs.  Results are the same as running each
+    branch with sim.run_branch.
+    args:
+        sim, the MarketSim the snapshot was taken from.
+        snapshot, its MarketSnapshot.
+        num_rounds, number of rounds for simulation period.
+        branches, list of {'orders': {round: order}, 'seed': seed}, both optional.
+        workers, number of worker processes (default: all cores).
+        chunk_size, branches sent to a worker at a time.
+    returns:
+        list of results as sim_period_silent, in branch order
+    """
+    tasks = [(num_rounds, branch.get('orders'), branch.get('seed')) for branch in branches]
+    chunks = [tasks[i:i + chunk_size] for i in range(0, len(tasks), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(),
+                             initializer=set_market, initargs=(sim, snapshot)) as pool:
+        return [result for results in pool.map(run_branch_chunk, chunks) for result in results]
+
+if __name__ == "__main__":
+    import toml
+    config = toml.load("config files/config_test_ZI.toml")
+    sim, snapshot = snapshot_at(config, 0, 100, 40)
+    # what if B3 had bid each of these at round 40, over 50 random futures each
+    bids = [100, 150, 200, 250]
+    branches = [{'orders': {40: ("B3", "bid", bid)}, 'seed': seed} for bid in bids for seed in range(50)]
+    results = run_branches(sim, snapshot, 100, branches)
+    for k, bid in enumerate(bids):
+        block = results[k * 50:(k + 1) * 50]
+        print(f"B3 bids {bid} at round 40: B3 surplus {np.mean([r[5]['B3'] for r in block]):7.2f}, "
+              f"efficiency {np.mean([r[1] for r in block]):6.2f}")
@@ -0,0 +1,239 @@
+import argparse
+import os
+import threading
+import time
+from collections import deque
+from multiprocessing import Process
+from multiprocessing.connection import Client, Listener, wait
+
+import numpy as np
+
+import tournament as tourn
+
+AUTHKEY_ENV = "MARKET895_AUTHKEY"
+
+def load_authkey(authkey = None):
+    """
+    Returns the shared key as bytes: authkey if given, otherwise the
+    MARKET895_AUTHKEY environment variable.  Connections exchange pickles,
+    so there is no default key; raises ValueError when none is set.
+    """
+    if authkey is None:
+        authkey = os.environ.get(AUTHKEY_ENV)
+    if not authkey:
+        raise ValueError(f"no authkey: set {AUTHKEY_ENV} or pass --authkey")
+    return authkey.encode() if isinstance(authkey, str) else authkey
+
+def worker(address, authkey = None):
+    """
+    Runs tournament chunks for a Coordinator until it says stop.
+    Can be started on any machine that reaches address:
+        MARKET895_AUTHKEY=... python distributed.py worker HOST:PORT
+    args:
+        address, (host, port) of the coordinator.
+        authkey, shared key of the coordinator (see load_authkey).
+    returns:
+        number of rounds run
+    """
+    authkey = load_authkey(authkey)
+    rounds = 0
+    with Client(address, authkey=authkey) as conn:
+        try:
+            conn.send(("hello", os.getpid()))
+            _, config, bank, sim_period, book_type, names, seed = conn.recv()
+            while True:
+                message = conn.recv()
+                if message[0] == "stop":
+                    break
+                _, first, last = message
+                summary = np.full((last - first, len(tourn.SUMMARY)), np.nan)
+                surplus = np.full((last - first, len(names)), np.nan)
+                tourn.run_block(config, bank, sim_period, book_type, names, first, last, seed,
+                                summary, surplus)
+                conn.send(("block", first, last, summary, surplus))
+                rounds += last - first
+        except (EOFError, OSError):
+            pass    # the coordinator has finished without us
+    return rounds
+
+class Coordinator:
+    """
+    Hands out chunks of a tournament's rounds to workers that connect over
+    a socket (multiprocessing.connection), and collects their result blocks
+    into one TournamentResults.  Workers may join at any time.  When a
+    worker dies its chunk goes back on the queue for another worker, and
+    with lease set a chunk held longer than lease seconds is handed out
+    again too; whichever copy finishes first is kept.
+    Round r is seeded with seed + r, so results are the same as
+    Tournament.run_tournament_parallel with the same seed.
+    args:
+        tournament, the Tournament to run (its rounds, config or bank,
+                    sim_period and book_type).
+        address, (host, port) to listen on; port 0 picks a free port.
+        authkey, key workers must present (see load_authkey).
+        chunk_size, rounds per chunk.
+        seed, seed of round 0.
+        lease, optional seconds before a chunk is reassigned.
+    """
+    def __init__(self, tournament, address = ("localhost", 0), authkey = None,
+                 chunk_size = 50, seed = 0, lease = None):
+        self.tournament = tournament
+        self.authkey = load_authkey(authkey)
+        self.chunk_size = chunk_size
+        self.seed = seed
+        self.lease = lease
+        self.listener = Listener(address, authkey=self.authkey)
+        self.address = self.listener.address
+        self.connections = deque()      # accepted, not yet greeted
+        self.lock = threading.Lock()
+        self.reassigned = 0
+
+    def accept(self):
+        while True:
+            try:
+                conn = self.listener.accept()
+            except OSError:
+                return
+            with self.lock:
+                self.connections.append(conn)
+
+    def start_workers(self, count):
+        """
+        Starts count worker processes on this machine.
+        returns:
+            list of the worker Processes
+        """
+        processes = [Process(target=worker, args=(self.address, self.authkey), daemon=True)
+                     for _ in range(count)]
+        for process in processes:
+            process.start()
+        return processes
+
+    def run(self):
+        """
+        Runs every chunk on the connected workers.
+        returns:
+            results, a TournamentResults
+        """
+        t = self.tournament
+        rounds = t.tournament_rounds
+        names = list(t.strategies())
+        job = ("job", t.load(), t.bank, t.sim_period, t.book_type, names, self.seed)
+        results = tourn.TournamentResults(np.full((rounds, len(tourn.SUMMARY)), np.nan),
+                                          np.full((rounds, len(names)), np.nan), names)
+        pending = deque((first, min(first + self.chunk_size, rounds))
+                        for first in range(0, rounds, self.chunk_size))
+        done = set()
+        held = {}       # connection -> (chunk, time handed out)
+        idle = []
+        threading.Thread(target=self.accept, daemon=True).start()
+
+        def hand_out(conn):
+            while pending and pending[0] in done:
+                pending.popleft()
+            if not pending:
+                idle.append(conn)
+                return
+            chunk = pending.popleft()
+            try:
+                conn.send(("chunk",) + chunk)
+            except OSError:
+                pending.appendleft(chunk)
+                conn.close()
+                return
+            held[conn] = (chunk, time.monotonic())
+
+        def drop(conn):
+            if conn in held:
+                chunk, _ = held.pop(conn)
+                if chunk not in done:
+                    pending.appendleft(chunk)
+                    self.reassigned += 1
+            if conn in idle:
+                idle.remove(conn)
+            conn.close()
+
+        with t.phase("run_tournament"):
+            while len(done) < len(range(0, rounds, self.chunk_size)):
+                with self.lock:
+                    new = list(self.connections)
+                    self.connections.clear()
+                for conn in new:
+                    try:
+                        conn.recv()
+                        conn.send(job)
+                    except (EOFError, OSError):
+                        conn.close()
+                        continue
+                    hand_out(conn)
+                while pending and idle:
+                    hand_out(idle.pop())
+
+                if self.lease is not None:
+                    now = time.monotonic()
+                    for conn, (chunk, start) in list(held.items()):
+                        if now - start > self.lease and chunk not in done and chunk not in pending:
+                            pending.append(chunk)
+                            self.reassigned += 1
+                            held[conn] = (chunk, now)
+
+                for conn in wait(list(held), timeout=0.1):
+                    try:
+                        _, first, last, summary, surplus = conn.recv()
+                    except (EOFError, OSError):
+                        drop(conn)
+                        continue
+                    if (first, last) not in done:
+                        results.summary[first:last] = summary
+                        results.surplus[first:last] = surplus
+                        done.add((first, last))
+                    del held[conn]
+                    hand_out(conn)
+
+        for conn in list(held) + idle:
+            try:
+                conn.send(("stop",))
+            except OSError:
+                pass
+            conn.close()
+        self.listener.close()
+        return results
+
+def parse_address(text):
+    host, port = text.rsplit(":", 1)
+    return host, int(port)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distributed tournament coordinator and worker")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("coordinator")
+    serve.add_argument("config")
+    serve.add_argument("rounds", type=int)
+    serve.add_argument("sim_period", type=int)
+    serve.add_argument("--address", default="localhost:6000")
+    serve.add_argument("--workers", type=int, default=0, help="local workers to start")
+    serve.add_argument("--chunk-size", type=int, default=50)
+    serve.add_argument("--seed", type=int, default=0)
+    serve.add_argument("--lease", type=float, default=None)
+    work = commands.add_parser("worker")
+    work.add_argument("address")
+    for command in (serve, work):
+        command.add_argument("--authkey", default=None, help=f"shared key (default: ${AUTHKEY_ENV})")
+    args = parser.parse_args()
+    try:
+        authkey = load_authkey(args.authkey)
+    except ValueError as error:
+        parser.error(str(error))
+
+    if args.command == "worker":
+        print(f"ran {worker(parse_address(args.address), authkey)} rounds")
+    else:
+        t = tourn.Tournament("distributed", args.rounds, args.sim_period, args.config)
+        coordinator = Coordinator(t, parse_address(args.address), authkey, chunk_size=args.chunk_size,
+                                  seed=args.seed, lease=args.lease)
+        print(f"coordinator listening on {coordinator.address[0]}:{coordinator.address[1]}")
+        coordinator.start_workers(args.workers)
+        results = coordinator.run()
+        for strategy, mean in results.strategy_means(t.strategies()).items():
+            print(f"{strategy}: Average Surplus = {mean:.2f}")
+        print(f"Mean Efficiency: {np.nanmean(results.column('efficiency')):.2f}")
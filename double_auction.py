@@ -3,11 +3,31 @@ import numpy as np
 from dataclasses import dataclass
 from typing import List
 from operator import itemgetter
+from collections import deque
+import heapq
 import random as rnd
+import time
 
 import Simulator.Buyer.buyer as buyer
 import Simulator.Seller.seller as seller
 
+# sides and outcome codes used by DoubleAuction.submit_batch
+BID, ASK = 0, 1
+CONTRACT = 2
+STANDING = 1
+REJECTED = 0
+INVALID_NAME = -1
+WRONG_SIDE = -2
+INVALID_SIDE = -3
+# outcome code of each result of DoubleAuction.order
+OUTCOME_CODES = {"contract": CONTRACT, "standing": STANDING, "rejected": REJECTED,
+                 "Error: invalid name": INVALID_NAME,
+                 "Error: seller cannon make bid": WRONG_SIDE,
+                 "Error: buyer cannon make ask": WRONG_SIDE,
+                 "Error: invalid side": INVALID_SIDE,
+                 None: INVALID_SIDE}
+OUTCOMES = {CONTRACT: "contract", STANDING: "standing", REJECTED: "rejected"}
+
 @dataclass
 class LimitOrderBook:
     """ 
@@ -22,6 +42,7 @@ class LimitOrderBook:
     sequence_number = order of offers in book   
     """
     owner: str
+    continuous = False
 
     def __post_init__(self):
         self.initialize()
@@ -71,14 +92,289 @@ class LimitOrderBook:
             pt = f"{seq} {action} {type} {amount}:{id}"
             print(pt)
 
+class DepthOrderBook(LimitOrderBook):
+    """
+    maintains a continuous limit-order-book with price-time priority
+    levels = {'bid': {price: deque([order, ...])}, 'ask': {...}}
+         order = [seq_number, 'id', quantity]
+    heaps hold the level prices (bids negated) so the best price is
+    always at the top; emptied levels are dropped lazily.
+    Resting orders survive contracts, and standing['bid'] / standing['ask']
+    always hold the best quotes (or the starting quotes when a side is empty).
+    Each trader keeps at most one resting order per side, a new order
+    replaces the old one.
+    """
+    continuous = True
+
+    def initialize(self):
+        super().initialize()
+        self.levels = {'bid': {}, 'ask': {}}
+        self.level_qty = {'bid': {}, 'ask': {}}
+        self.heaps = {'bid': [], 'ask': []}
+        self.orders = {}        # seq_number -> (type, price, order)
+        self.owner_orders = {}  # (type, id) -> seq_number
+
+    def quote(self, type, amount):
+        """
+        Returns the price at which a type order for amount is booked,
+        or None if it cannot be booked (the order is then rejected)
+        """
+        return amount
+
+    def best(self, type):
+        """
+        Returns the best price on the type side of the book,
+        or None if that side is empty.
+        """
+        heap = self.heaps[type]
+        level_qty = self.level_qty[type]
+        while heap:
+            price = -heap[0] if type == 'bid' else heap[0]
+            if price in level_qty:
+                return price
+            heapq.heappop(heap)
+        return None
+
+    def front(self, type):
+        """
+        Returns (price, order) for the oldest live order at the best price,
+        or None if the type side of the book is empty.
+        """
+        price = self.best(type)
+        if price is None:
+            return None
+        queue = self.levels[type][price]
+        while queue[0][2] == 0:
+            queue.popleft()
+        return price, queue[0]
+
+    def rest(self, type, price, name, quantity, seq):
+        """
+        Places quantity units at price in the queue for that price level
+        """
+        levels = self.levels[type]
+        if price not in levels:
+            levels[price] = deque()
+            self.level_qty[type][price] = 0
+            heapq.heappush(self.heaps[type], -price if type == 'bid' else price)
+        order = [seq, name, quantity]
+        levels[price].append(order)
+        self.level_qty[type][price] += quantity
+        self.orders[seq] = (type, price, order)
+        self.owner_orders[(type, name)] = seq
+
+    def fill(self, type, price, order, quantity):
+        """
+        Takes quantity units from a resting order at price.
+        Removes the order, and the level, once they are used up.
+        """
+        order[2] -= quantity
+        if order[2] == 0:
+            self.levels[type][price].popleft()
+            self._forget(order)
+        self._reduce_level(type, price, quantity)
+
+    def cancel(self, seq):
+        """
+        Cancels the resting order with sequence number seq.
+        Returns True if an order was cancelled.
+        """
+        try:
+            type, price, order = self.orders[seq]
+        except KeyError:
+            return False
+        self._reduce_level(type, price, order[2])
+        order[2] = 0   # left in its queue, skipped by front()
+        self._forget(order)
+        return True
+
+    def cancel_owner(self, type, name):
+        """
+        Cancels the resting type order of trader name, if there is one.
+        """
+        seq = self.owner_orders.get((type, name))
+        if seq is not None:
+            self.cancel(seq)
+
+    def depth(self, type):
+        """
+        Returns [(price, quantity), ...] for the type side, best price first
+        """
+        prices = sorted(self.level_qty[type], reverse=(type == 'bid'))
+        return [(price, self.level_qty[type][price]) for price in prices]
+
+    def refresh_standing(self, starting):
+        """
+        Sets the standing bid and ask to the best resting orders,
+        falling back to the starting quotes for an empty side.
+        """
+        for type in ('bid', 'ask'):
+            best = self.front(type)
+            if best is None:
+                self.standing[type] = starting[type]
+                self.standing[type + '_id'] = starting[type + '_id']
+            else:
+                self.standing[type] = best[0]
+                self.standing[type + '_id'] = best[1][1]
+
+    def _reduce_level(self, type, price, quantity):
+        level_qty = self.level_qty[type]
+        level_qty[price] -= quantity
+        if level_qty[price] == 0:
+            del level_qty[price]
+            del self.levels[type][price]
+
+    def _forget(self, order):
+        seq, name = order[0], order[1]
+        type = self.orders.pop(seq)[0]
+        if self.owner_orders.get((type, name)) == seq:
+            del self.owner_orders[(type, name)]
+
+@dataclass
+class LadderOrderBook(DepthOrderBook):
+    """
+    maintains a continuous limit-order-book on an integer tick grid, with
+    the same price-time priority as DepthOrderBook
+    levels = {'bid': [deque | None, ...], 'ask': [...]} indexed by tick
+    level_qty = {'bid': [quantity, ...], 'ask': [...]} indexed by tick
+    bits = {'bid': int, 'ask': int}, bit k is set while tick k holds orders
+    Prices are tick * k for k = 0 .. max_price // tick.  Bids are rounded
+    down and asks up to the grid, so rounding never moves an order past its
+    trader's limit: a bid above the grid is booked at its top, and an ask
+    below it at 0, but a bid below 0 or an ask that rounds above the top
+    is rejected.  The best bid is the highest
+    set bit and the best ask the lowest, so finding either, and adding or
+    emptying a level, takes a few integer operations at any book depth.
+    top = {'bid': tick or None, 'ask': ...} caches the best tick of each
+    side, so best() and front() are a lookup; rest() moves it up to a
+    better level and the bitmap is searched only when the top level empties.
+    """
+    tick: float = 1
+    max_price: float = 999
+
+    def initialize(self):
+        super().initialize()
+        self.num_ticks = int(self.max_price // self.tick) + 1
+        self.levels = {'bid': [None] * self.num_ticks, 'ask': [None] * self.num_ticks}
+        self.level_qty = {'bid': [0] * self.num_ticks, 'ask': [0] * self.num_ticks}
+        self.bits = {'bid': 0, 'ask': 0}
+        self.top = {'bid': None, 'ask': None}
+
+    def quote(self, type, amount):
+        """
+        Returns amount rounded to the grid, down for a bid and up for an
+        ask, or None if that is off the grid past the trader's limit
+        """
+        if type == 'bid':
+            k = int(amount // self.tick)
+            if k < 0:
+                return None
+            return min(k, self.num_ticks - 1) * self.tick
+        k = -int(-amount // self.tick)
+        if k >= self.num_ticks:
+            return None
+        return max(k, 0) * self.tick
+
+    def best(self, type):
+        k = self.top[type]
+        return None if k is None else k * self.tick
+
+    def front(self, type):
+        k = self.top[type]
+        if k is None:
+            return None
+        queue = self.levels[type][k]
+        while queue[0][2] == 0:
+            queue.popleft()
+        return k * self.tick, queue[0]
+
+    def rest(self, type, price, name, quantity, seq):
+        k = round(price / self.tick)
+        queue = self.levels[type][k]
+        if queue is None:
+            queue = self.levels[type][k] = deque()
+            self.bits[type] |= 1 << k
+            top = self.top[type]
+            if top is None or (k > top if type == 'bid' else k < top):
+                self.top[type] = k
+        order = [seq, name, quantity]
+        queue.append(order)
+        self.level_qty[type][k] += quantity
+        self.orders[seq] = (type, price, order)
+        self.owner_orders[(type, name)] = seq
+
+    def fill(self, type, price, order, quantity):
+        order[2] -= quantity
+        if order[2] == 0:
+            self.levels[type][round(price / self.tick)].popleft()
+            self._forget(order)
+        self._reduce_level(type, price, quantity)
+
+    def depth(self, type):
+        level_qty = self.level_qty[type]
+        ticks = []
+        bits = self.bits[type]
+        while bits:
+            lowest = bits & -bits
+            ticks.append(lowest.bit_length() - 1)
+            bits ^= lowest
+        if type == 'bid':
+            ticks.reverse()
+        return [(k * self.tick, level_qty[k]) for k in ticks]
+
+    def _reduce_level(self, type, price, quantity):
+        k = round(price / self.tick)
+        level_qty = self.level_qty[type]
+        level_qty[k] -= quantity
+        if level_qty[k] == 0:
+            self.levels[type][k] = None
+            bits = self.bits[type] = self.bits[type] & ~(1 << k)
+            if k == self.top[type]:
+                if not bits:
+                    self.top[type] = None
+                elif type == 'bid':
+                    self.top[type] = bits.bit_length() - 1
+                else:
+                    self.top[type] = (bits & -bits).bit_length() - 1
+
 class DoubleAuction:
     """
     Implements a double auction
+    book_type = 'standing' keeps a single standing bid and ask that are
+                cleared after every contract,
+                'depth' keeps every resting order in a price-time
+                priority book (see DepthOrderBook),
+                'ladder' keeps the same book on an integer tick grid with
+                bitmap best-price search (see LadderOrderBook).
+    tick = price step of a 'ladder' book.
+    broadcast = True tells every participant about every contract,
+                False tells only the buyer and seller, so a contract
+                costs the same in a market of any size.  Every price
+                is kept in self.prices either way.
+    Setting self.recorder to an order_trace.Trace records every order and its
+    outcome.
+    Observers in self.observers (e.g. a shout_history.ShoutHistory) are told
+    about every accepted order with observer.order(type, amount, outcome,
+    fills), fills being the contract prices it made.  A registered trader
+    with an attach(da) method is given the auction, to add an observer.
     """
-    def __init__(self, name):
+    book_types = {'standing': LimitOrderBook, 'depth': DepthOrderBook, 'ladder': LadderOrderBook}
+
+    def __init__(self, name, book_type = 'standing', broadcast = True, tick = 1):
         self.name = name
         self.participants = []
-        self.book = LimitOrderBook(name)
+        self.index = {}     # name -> first registered trader with that name
+        self.profiler = None
+        self.recorder = None
+        self.observers = []
+        self.deferred = None    # contracts not yet told to participants, during submit_batch
+        self.broadcast = broadcast
+        self.prices = []    # every contract price, in order
+        self.book_type = book_type
+        if book_type == 'ladder':
+            self.book = LadderOrderBook(name, tick)
+        else:
+            self.book = self.book_types[book_type](name)
         self.contracts = []
         self.starting = {'bid': 0, 'bid_id': self.name,
                     'ask':999, 'ask_id': self.name}
@@ -87,18 +383,15 @@ class DoubleAuction:
     def register(self, trader):
         """ make a random ask between the current unit cost and the standing_ask"""
         self.participants.append(trader)
+        self.index.setdefault(trader.name, trader)
+        if hasattr(trader, 'attach'):
+            trader.attach(self)
 
     def check_name(self, name):
-        for participant in self.participants:
-            if participant.name == name:
-                return True
-        return False
+        return name in self.index
 
     def get_trader(self, name):
-        for participant in self.participants:
-            if participant.name == name:
-                return participant
-        return None  
+        return self.index.get(name)
 
     def order(self, order):
         """
@@ -106,8 +399,14 @@ class DoubleAuction:
         name is the name of the trader, 
         type is 'bid' or 'ask', and 
         amount is an integer amount of money for the type
+        A depth book also takes (name, type, amount, quantity) 
+        for multi-unit orders.
         """        
-        name, type, amount = order
+        if self.recorder is not None:
+            return self.recorder.order(self, order)
+        if self.observers:
+            return self.observe(order)
+        name, type, amount = order[:3]
         order_info = {}
         order_info["id"] = name  
         order_info["type"] = type  
@@ -120,6 +419,11 @@ class DoubleAuction:
             return "Error: invalid name"
         trader = self.get_trader(name)
 
+        if type != 'bid' and type != 'ask':
+            order_info["action"] = "rejected"
+            self.book.add(order_info)
+            return "Error: invalid side"
+
         if type == 'bid' and trader.type == "S":
             order_info["action"] = "rejected"
             self.book.add(order_info)
@@ -131,6 +435,10 @@ class DoubleAuction:
             return "Error: buyer cannon make ask"
         
         # Process order
+        if self.book.continuous:
+            quantity = order[3] if len(order) > 3 else 1
+            return self.match(order_info, quantity)
+
         standing_bid = self.book.standing['bid']
         standing_bid_id = self.book.standing['bid_id']
         standing_ask = self.book.standing['ask']
@@ -177,6 +485,220 @@ class DoubleAuction:
             order_info["action"] = "rejected"
             self.book.add(order_info)
             return "rejected"
+
+    def observe(self, order):
+        """
+        Processes an order, as order() does, and tells the observers.
+        """
+        observers, self.observers = self.observers, []
+        start = len(self.prices)
+        try:
+            outcome = self.order(order)
+        finally:
+            self.observers = observers
+        if outcome in ("contract", "standing", "rejected"):
+            self.notify(order[1], order[2], outcome, start)
+        return outcome
+
+    def notify(self, type, amount, outcome, start):
+        """
+        Tells the observers about an order and the contracts it made
+        (the prices from index start on).
+        """
+        if self.book.continuous and outcome != "rejected":
+            amount = self.book.quote(type, amount)
+        fills = self.prices[start:]
+        for observer in self.observers:
+            observer.order(type, amount, outcome, fills)
+
+    def match(self, order_info, quantity):
+        """
+        Matches an order against a depth book.  The order trades with the
+        best resting orders at their prices, oldest first, for as many
+        units as cross, and any remaining units rest in the book.
+        Returns "contract" if at least one unit traded, "rejected" if the
+        book cannot take its price (see quote), otherwise "standing".
+        """
+        name = order_info["id"]
+        type = order_info["type"]
+        book = self.book
+        amount = book.quote(type, order_info["amount"])
+        if amount is None:
+            order_info["action"] = "rejected"
+            book.add(order_info)
+            return "rejected"
+        order_info["amount"] = amount
+        other = 'ask' if type == 'bid' else 'bid'
+        book.cancel_owner(type, name)
+
+        filled = 0
+        while filled < quantity:
+            best = book.front(other)
+            if best is None:
+                break
+            price, resting = best
+            if (type == 'bid' and amount < price) or (type == 'ask' and amount > price):
+                break
+            units = min(resting[2], quantity - filled)
+            book.fill(other, price, resting, units)
+            filled += units
+            for _ in range(units):
+                if type == 'bid':
+                    self.contract(price, name, resting[1])
+                else:
+                    self.contract(price, resting[1], name)
+
+        order_info["quantity"] = quantity
+        order_info["filled"] = filled
+        order_info["action"] = "contract" if filled else "standing"
+        seq = book.sequence_number
+        book.add(order_info)
+        if filled < quantity:
+            book.rest(type, amount, name, quantity - filled, seq)
+            book.refresh_standing(self.starting)
+        return order_info["action"]
+
+    def submit_batch(self, traders, sides, prices, quantities = None):
+        """
+        Processes a batch of orders, in sequence, with the same results
+        (book log, contracts, outcomes and participants' prices, contracts
+        and units) as calling order() for each of them.  Participants are
+        told about the batch's contracts once at the end (see deliver), not
+        per contract, so observers see participants as they were before
+        the batch until it returns.
+        args:
+            traders, array of indices into self.participants.
+            sides, array of BID or ASK.
+            prices, array of order amounts.
+            quantities, optional array of units per order (depth book only).
+        returns:
+            codes, int8 array of CONTRACT, STANDING, REJECTED,
+                   INVALID_NAME, WRONG_SIDE or INVALID_SIDE for each order.
+        """
+        traders = np.asarray(traders, dtype=np.int64)
+        sides = np.asarray(sides, dtype=np.int64)
+        num_orders = len(traders)
+        num_participants = len(self.participants)
+
+        # Check all orders at once
+        is_buyer = np.array([p.type == "B" for p in self.participants], dtype=bool)
+        known = (traders >= 0) & (traders < num_participants)
+        buyer_order = np.zeros(num_orders, dtype=bool)
+        buyer_order[known] = is_buyer[traders[known]]
+        codes = np.zeros(num_orders, dtype=np.int8)
+        codes[known & (sides == BID) & ~buyer_order] = WRONG_SIDE
+        codes[known & (sides == ASK) & buyer_order] = WRONG_SIDE
+        codes[known & (sides != BID) & (sides != ASK)] = INVALID_SIDE
+        codes[~known] = INVALID_NAME
+
+        # Process orders
+        names = [p.name for p in self.participants]
+        if quantities is None:
+            quantities = np.ones(num_orders, dtype=np.int64)
+        outcomes = codes.tolist()
+        rows = zip(traders.tolist(), sides.tolist(), np.asarray(prices).tolist(),
+                   np.asarray(quantities).tolist(), outcomes)
+        self.deferred = []
+        try:
+            self.run_batch(rows, outcomes, names)
+        finally:
+            deferred, self.deferred = self.deferred, None
+            self.deliver(deferred)
+        codes = np.array(outcomes, dtype=np.int8)
+        if self.recorder is not None:
+            self.recorder.batch(traders, sides, prices, quantities, codes)
+        return codes
+
+    def run_batch(self, rows, outcomes, names):
+        """
+        Processes the checked orders of submit_batch, writing outcome codes
+        into outcomes.
+        """
+        observers = self.observers
+        book = self.book
+        continuous = book.continuous
+        contract = self.contract
+        side_names = ('bid', 'ask')
+        for k, (trader, side, amount, quantity, code) in enumerate(rows):
+            if code < 0:
+                name = names[trader] if code != INVALID_NAME else trader
+                type = side_names[side] if code != INVALID_SIDE else side
+                book.add({"id": name, "type": type, "amount": amount, "action": "rejected"})
+                continue
+            name = names[trader]
+            start = len(self.prices)
+            standing = book.standing
+            if continuous:
+                order_info = {"id": name, "type": side_names[side], "amount": amount}
+                outcomes[k] = OUTCOME_CODES[self.match(order_info, quantity)]
+            elif side == BID:
+                if amount >= standing['ask']:
+                    book.add({"id": name, "type": "bid", "amount": amount, "action": "contract"})
+                    contract(standing['ask'], name, standing['ask_id'])
+                    outcomes[k] = CONTRACT
+                elif amount > standing['bid']:
+                    book.add({"id": name, "type": "bid", "amount": amount, "action": "standing"})
+                    standing['bid'] = amount
+                    standing['bid_id'] = name
+                    outcomes[k] = STANDING
+                else:
+                    book.add({"id": name, "type": "bid", "amount": amount, "action": "rejected"})
+            else:
+                if amount <= standing['bid']:
+                    book.add({"id": name, "type": "ask", "amount": amount, "action": "contract"})
+                    contract(standing['bid'], standing['bid_id'], name)
+                    outcomes[k] = CONTRACT
+                elif amount < standing['ask']:
+                    book.add({"id": name, "type": "ask", "amount": amount, "action": "standing"})
+                    standing['ask'] = amount
+                    standing['ask_id'] = name
+                    outcomes[k] = STANDING
+                else:
+                    book.add({"id": name, "type": "ask", "amount": amount, "action": "rejected"})
+            if observers:
+                self.notify(side_names[side], amount, OUTCOMES[outcomes[k]], start)
+
+    def deliver(self, contracts):
+        """
+        Tells participants about a list of (price, buyer, seller) contracts
+        at once, as contract() would have one by one: one contract_batch call
+        per participant told, or a contract call per price for traders
+        without contract_batch.
+        """
+        if not contracts:
+            return
+        prices = [price for price, _, _ in contracts]
+        yours = {}
+        for price, buyer, seller in contracts:
+            yours.setdefault(buyer, []).append(price)
+            if seller != buyer:
+                yours.setdefault(seller, []).append(price)
+        if self.broadcast:
+            told = [(participant, prices) for participant in self.participants]
+        else:
+            told = [(self.index[name], own) for name, own in yours.items() if name in self.index]
+        for participant, seen in told:
+            own = yours.get(participant.name, [])
+            if hasattr(participant, 'contract_batch'):
+                participant.contract_batch(seen, own)
+            elif not self.broadcast:
+                for price in own:
+                    participant.contract(price, True)
+            else:
+                name = participant.name
+                for price, buyer, seller in contracts:
+                    participant.contract(price, name == buyer or name == seller)
+
+    def cancel(self, seq):
+        """
+        Cancels the resting order with sequence number seq in a depth book
+        and updates the standing bid and ask.
+        Returns True if an order was cancelled.
+        """
+        cancelled = self.book.cancel(seq)
+        if cancelled:
+            self.book.refresh_standing(self.starting)
+        return cancelled
                 
     def contract(self, price, buyer, seller):
         """
@@ -185,10 +707,24 @@ class DoubleAuction:
         contract is appended to self.contracts
         """
         self.contracts.append((price, buyer, seller))
+        self.prices.append(price)
         #print(self.contracts)
-        for participant in self.participants:
-            if participant.name == buyer or participant.name == seller:
-                participant.contract(price, True)
-            else:
-                participant.contract(price, False)
-        self.book.start_new_contract(self.starting)
\ No newline at end of file
+        if self.profiler is not None:
+            start = time.perf_counter()
+        if self.deferred is not None:
+            self.deferred.append((price, buyer, seller))
+        elif self.broadcast:
+            for participant in self.participants:
+                name = participant.name
+                participant.contract(price, name == buyer or name == seller)
+        else:
+            for name in {buyer, seller}:
+                participant = self.index.get(name)
+                if participant is not None:
+                    participant.contract(price, True)
+        if self.profiler is not None:
+            self.profiler.add(("order", "contract broadcast"), time.perf_counter() - start)
+        if self.book.continuous:
+            self.book.refresh_standing(self.starting)
+        else:
+            self.book.start_new_contract(self.starting)
\ No newline at end of file
@@ -0,0 +1,157 @@
+import os
+import random as rnd
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import toml
+
+import sweep
+from spot_market_environment import apportion
+
+def replicator(counts, fitness):
+    """
+    One step of discrete replicator dynamics: each strategy's share grows
+    in proportion to its fitness relative to the population mean.
+    Negative fitness (a net loss) counts as zero.
+    returns:
+        new integer counts with the same total
+    """
+    counts = np.asarray(counts, dtype=float)
+    fitness = np.maximum(np.asarray(fitness, dtype=float), 0.0)
+    weights = counts * fitness
+    if weights.sum() <= 0:
+        return counts.astype(int)
+    return apportion(weights, int(counts.sum()))
+
+def tournament_selection(counts, fitness, size = 2, rng = rnd):
+    """
+    Tournament selection: each seat of the next generation goes to the
+    fittest of size seats drawn at random from the current population.
+    returns:
+        new integer counts with the same total
+    """
+    population = [k for k, count in enumerate(counts) for _ in range(int(count))]
+    new_counts = np.zeros(len(counts), dtype=int)
+    for _ in range(len(population)):
+        contestants = [rng.choice(population) for _ in range(size)]
+        new_counts[max(contestants, key=lambda k: fitness[k])] += 1
+    return new_counts
+
+class EvolutionaryTournament:
+    """
+    Evolves the mix of strategies in a market.
+    Each generation runs periods parallel periods with the current
+    population of buyer and seller strategies, measures each strategy's
+    fitness as its mean surplus per seat and period, and updates the
+    counts of each strategy by replicator dynamics or tournament selection.
+    Population and fitness of each generation are written to a ResultStore.
+    args:
+        file_path, path to the base TOML file (units and value/cost ranges).
+        buyers, {strategy: count} of the first generation of buyers.
+        sellers, {strategy: count} of the first generation of sellers.
+        generations, number of generations.
+        periods, periods per generation.
+        sim_period, number of rounds within simulation period.
+        store_path, SQLite file for the per-generation results.
+        selection, 'replicator' or 'tournament'.
+        seed, seed of the first period.
+        workers, number of worker processes (default: all cores).
+    """
+    def __init__(self, file_path, buyers, sellers, generations, periods, sim_period,
+                 store_path, selection = "replicator", seed = 0, workers = None):
+        self.base = toml.load(file_path)
+        self.buyer_strategies = list(buyers)
+        self.seller_strategies = list(sellers)
+        self.buyers = np.array([buyers[s] for s in self.buyer_strategies], dtype=int)
+        self.sellers = np.array([sellers[s] for s in self.seller_strategies], dtype=int)
+        self.generations = generations
+        self.periods = periods
+        self.sim_period = sim_period
+        self.store_path = store_path
+        self.selection = selection
+        self.seed = seed
+        self.workers = workers or os.cpu_count()
+        # keyed on the loaded base config, so editing the file starts a new run
+        self.run_key = sweep.cell_key({'file': str(file_path), 'buyers': buyers, 'sellers': sellers,
+                                       'selection': selection, 'periods': periods,
+                                       'sim_period': sim_period, 'seed': seed},
+                                      {'base': self.base})
+        self.rng = rnd.Random(seed)
+
+    def population_config(self):
+        """
+        Returns the config of the current population, one seat per trader.
+        """
+        mix = {'buyers': [s for s, count in zip(self.buyer_strategies, self.buyers) for _ in range(count)],
+               'sellers': [s for s, count in zip(self.seller_strategies, self.sellers) for _ in range(count)]}
+        return sweep.make_config(self.base, {'strategy_mix': mix,
+                                             'num_buyers': len(mix['buyers']),
+                                             'num_sellers': len(mix['sellers'])})
+
+    def fitness(self, config, results):
+        """
+        Returns buyer and seller fitness arrays: mean surplus per seat and
+        period for each strategy (0 for strategies that have died out).
+        """
+        fitness = {}
+        for prefix, strategies, count_key in (('B', self.buyer_strategies, 'num_buyers'),
+                                              ('S', self.seller_strategies, 'num_sellers')):
+            totals = np.zeros(len(strategies))
+            seats = np.zeros(len(strategies))
+            for k in range(config[count_key]):
+                seat = config[f"{prefix}{k + 1}"]
+                column = strategies.index(seat['trader_type'])
+                totals[column] += sum(result[5][seat['name']] for result in results)
+                seats[column] += len(results)
+            fitness[prefix] = np.divide(totals, seats, out=np.zeros_like(totals), where=seats > 0)
+        return fitness['B'], fitness['S']
+
+    def select(self, counts, fitness):
+        if self.selection == "replicator":
+            return replicator(counts, fitness)
+        if self.selection == "tournament":
+            return tournament_selection(counts, fitness, rng=self.rng)
+        raise ValueError(f"unknown selection {self.selection}")
+
+    def run(self):
+        """
+        Runs every generation on one pool of worker processes.
+        returns:
+            store, the ResultStore holding the per-generation results
+        """
+        store = sweep.ResultStore(self.store_path)
+        chunk_size = max(1, self.periods // self.workers)
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            for generation in range(self.generations):
+                config = self.population_config()
+                first = self.seed + generation * self.periods
+                tasks = [(config, self.sim_period, first + k) for k in range(self.periods)]
+                chunks = [tasks[i:i + chunk_size] for i in range(0, len(tasks), chunk_size)]
+                results = [result for chunk in pool.map(sweep.run_periods, chunks) for result in chunk]
+
+                buyer_fitness, seller_fitness = self.fitness(config, results)
+                for side, strategies, counts, fitness in (
+                        ('B', self.buyer_strategies, self.buyers, buyer_fitness),
+                        ('S', self.seller_strategies, self.sellers, seller_fitness)):
+                    for strategy, count, fit in zip(strategies, counts, fitness):
+                        store.add_generation(self.run_key, generation, side, strategy, int(count), float(fit))
+                store.commit()
+
+                self.buyers = self.select(self.buyers, buyer_fitness)
+                self.sellers = self.select(self.sellers, seller_fitness)
+        return store
+
+    def report(self, store = None):
+        """
+        Neatly prints the population and fitness of each generation.
+        """
+        store = store or sweep.ResultStore(self.store_path)
+        for generation, side, strategy, count, fitness in store.generations(self.run_key):
+            print(f"generation {generation:>3} {side} {strategy:<20} count {count:>3} fitness {fitness:8.2f}")
+
+if __name__ == "__main__":
+    strategies = {"Zero Intelligence": 2, "Kaplan": 2, "Ringuette": 2, "Persistent Shout": 2, "Skeleton": 2}
+    evolution = EvolutionaryTournament("config files/config_test_HorseRace.toml", strategies, strategies,
+                                       generations=20, periods=200, sim_period=100,
+                                       store_path="evolution_results.sqlite")
+    evolution.report(evolution.run())
@@ -0,0 +1,146 @@
+import copy
+import math
+import random as rnd
+
+import numpy as np
+import scipy.stats
+import toml
+
+import market_simulator_v2 as msim
+
+def rotate_config(config, shift):
+    """
+    Returns a copy of config with the strategies moved shift seats along,
+    buyers among buyer seats and sellers among seller seats.  Seat names,
+    units and value/cost ranges stay where they are.
+    """
+    rotated = copy.deepcopy(config)
+    for prefix, count_key in (('B', 'num_buyers'), ('S', 'num_sellers')):
+        count = config[count_key]
+        for k in range(count):
+            source = config[f"{prefix}{(k - shift) % count + 1}"]
+            rotated[f"{prefix}{k + 1}"]['trader_type'] = source['trader_type']
+    return rotated
+
+def seat_labels(config):
+    """
+    Returns {trader name: strategy label}, e.g. {'B2': 'Kaplan (B)'}.
+    """
+    labels = {}
+    for prefix, count_key in (('B', 'num_buyers'), ('S', 'num_sellers')):
+        for k in range(config[count_key]):
+            seat = config[f"{prefix}{k + 1}"]
+            labels[seat['name']] = f"{seat['trader_type']} ({prefix})"
+    return labels
+
+def num_rotations(config):
+    """
+    Returns lcm(num_buyers, num_sellers): over that many shifts each side
+    goes through all of its own rotations the same number of times.
+    """
+    return math.lcm(config['num_buyers'], config['num_sellers'])
+
+def rotations(config):
+    """
+    Returns the rotated configs for shifts 0 .. num_rotations(config) - 1,
+    which put every strategy in every seat of its side equally often.
+    """
+    return [rotate_config(config, shift) for shift in range(num_rotations(config))]
+
+class HorseRace:
+    """
+    Paired (common random numbers) comparison of the strategies in a config.
+    Every round draws one set of tokens and one arrival sequence, then
+    replays them for each rotation of the strategies over the seats.
+    Each strategy therefore meets exactly the same draws as every other
+    strategy, so differences between strategies are measured within rounds
+    and need far fewer rounds than independent tournaments.
+    args:
+        file_path, path to TOML file.
+        rounds, number of token / arrival draws.
+        sim_period, number of rounds within simulation period.
+        seed, seed of the first round.
+    """
+    def __init__(self, file_path, rounds, sim_period, seed = 0):
+        self.file_path = file_path
+        self.rounds = rounds
+        self.sim_period = sim_period
+        self.seed = seed
+        self.config = toml.load(file_path)
+
+    def labels(self):
+        """
+        Returns the strategy labels in seat order of the config.
+        """
+        return list(dict.fromkeys(seat_labels(self.config).values()))
+
+    def run_round(self, round_seed, shift):
+        """
+        Runs one period of rotation shift on the draws of round_seed.
+        returns:
+            results of MarketSim.sim_period_silent, config used
+        """
+        config = rotate_config(self.config, shift)
+        num_traders = config['num_buyers'] + config['num_sellers']
+        arrivals = rnd.Random(round_seed).choices(range(num_traders), k=self.sim_period)
+        rnd.seed(round_seed)
+        sim = msim.MarketSim("horse race", f"Market {round_seed}")
+        sim.load_config_dict(config)
+        sim.calc_market()
+        return sim.sim_period_silent(self.sim_period, arrivals), config
+
+    def run(self):
+        """
+        Runs every rotation on every round's draws.
+        returns:
+            surplus, array (rounds, strategies) of each strategy's surplus per
+                     seat, averaged over the rotations of that round
+            efficiency, array (rounds, rotations)
+        """
+        labels = self.labels()
+        column = {label: k for k, label in enumerate(labels)}
+        rotations = num_rotations(self.config)
+        seats = np.zeros(len(labels))
+        for label in seat_labels(self.config).values():
+            seats[column[label]] += 1
+        surplus = np.zeros((self.rounds, len(labels)))
+        efficiency = np.zeros((self.rounds, rotations))
+        for r in range(self.rounds):
+            for shift in range(rotations):
+                results, config = self.run_round(self.seed + r, shift)
+                efficiency[r, shift] = results[1]
+                labels_now = seat_labels(config)
+                for name, trader_surplus in results[5].items():
+                    surplus[r, column[labels_now[name]]] += trader_surplus
+        surplus /= rotations * seats
+        self.surplus = surplus
+        self.efficiency = efficiency
+        return surplus, efficiency
+
+    def report(self, confidence = 0.95):
+        """
+        Neatly prints each strategy's mean surplus and the paired difference
+        to the best strategy on its side, with confidence half-widths.
+        """
+        labels = self.labels()
+        n = self.surplus.shape[0]
+        t = scipy.stats.t.ppf((1 + confidence) / 2, n - 1)
+        means = self.surplus.mean(axis=0)
+        half_widths = t * self.surplus.std(axis=0, ddof=1) / np.sqrt(n)
+        print(f"{'strategy':<28} {'mean':>9} {'+/-':>7} {'vs best':>9} {'+/-':>7}")
+        print("-" * 64)
+        for side in ('(B)', '(S)'):
+            index = [k for k, label in enumerate(labels) if label.endswith(side)]
+            best = max(index, key=lambda k: means[k])
+            for k in sorted(index, key=lambda k: -means[k]):
+                diff = self.surplus[:, k] - self.surplus[:, best]
+                diff_hw = t * diff.std(ddof=1) / np.sqrt(n)
+                print(f"{labels[k]:<28} {means[k]:>9.2f} {half_widths[k]:>7.2f} "
+                      f"{diff.mean():>9.2f} {diff_hw:>7.2f}")
+        print()
+        print(f"Mean Efficiency: {self.efficiency.mean():.2f}")
+
+if __name__ == "__main__":
+    race = HorseRace("config files/config_test_HorseRace.toml", 200, 100)
+    race.run()
+    race.report()
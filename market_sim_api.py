@@ -3,11 +3,181 @@ from tkinter import filedialog, messagebox, ttk
 import market_simulator_v2 as sim
 import tournament as tourn
 import double_auction as da
+import book_viewer
 from pathlib import Path
 import os
 import toml
 import csv
 
+STRATEGIES = ["Zero Intelligence", "Kaplan", "Ringuette", "Persistent Shout", "Skeleton", "Gjerstad Dickhaut"]
+
+def parse_rows(text, count):
+    """
+    Returns the row indices of a range text such as "1-250, 400",
+    numbered from 1, that lie within count rows.
+    """
+    rows = set()
+    for part in text.replace(" ", "").split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        first = int(first)
+        last = int(last) if last else first
+        rows.update(range(max(first, 1) - 1, min(last, count)))
+    return sorted(rows)
+
+class TraderTable(tk.Frame):
+    """
+    Virtualized table of buyer and seller strategies.  The strategies are
+    kept in two lists, and the table only has widgets for the visible_rows
+    rows on screen, which are refilled as it scrolls, so it costs the same
+    with 10 traders as with 10,000.  Double-click a cell to pick its
+    strategy; the bulk controls assign one strategy to the selected rows,
+    to a range of rows such as "1-250, 400", or to every row.
+    """
+    def __init__(self, parent, visible_rows = 15):
+        super().__init__(parent)
+        self.visible_rows = visible_rows
+        self.rows = {"B": [], "S": []}
+        self.first_row = 0
+        self.selected = set()
+        self.rendering = False
+
+        self.tree = ttk.Treeview(self, columns=("trader", "B", "S"), show="headings",
+                                 height=visible_rows, selectmode="extended")
+        for column, heading, width in (("trader", "#", 60), ("B", "Buyer", 150), ("S", "Seller", 150)):
+            self.tree.heading(column, text=heading)
+            self.tree.column(column, width=width, stretch=False)
+        self.items = [self.tree.insert("", "end") for _ in range(visible_rows)]
+        self.tree.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.on_scroll)
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+        self.tree.bind("<<TreeviewSelect>>", self.on_select)
+        self.tree.bind("<Double-1>", self.edit_cell)
+        self.tree.bind("<MouseWheel>", lambda event: self.scroll_to(self.first_row - event.delta // 120))
+        self.tree.bind("<Button-4>", lambda event: self.scroll_to(self.first_row - 1))
+        self.tree.bind("<Button-5>", lambda event: self.scroll_to(self.first_row + 1))
+        self.editor = ttk.Combobox(self.tree, values=STRATEGIES, state="readonly")
+        self.editor.bind("<<ComboboxSelected>>", self.finish_edit)
+        self.editor.bind("<Escape>", lambda event: self.editor.place_forget())
+
+        bulk = tk.Frame(self)
+        bulk.grid(row=1, column=0, columnspan=2, sticky="ew")
+        self.bulk_side = ttk.Combobox(bulk, values=["Buyers", "Sellers", "Both"], state="readonly", width=8)
+        self.bulk_side.set("Both")
+        self.bulk_side.grid(row=0, column=0, padx=2, pady=4)
+        self.bulk_strategy = ttk.Combobox(bulk, values=STRATEGIES, state="readonly", width=18)
+        self.bulk_strategy.set(STRATEGIES[0])
+        self.bulk_strategy.grid(row=0, column=1, padx=2, pady=4)
+        tk.Button(bulk, text="Apply to Selected",
+                  command=lambda: self.assign(sorted(self.selected))).grid(row=0, column=2, padx=2, pady=4)
+        tk.Button(bulk, text="Apply to All",
+                  command=lambda: self.assign(range(self.count()))).grid(row=0, column=3, padx=2, pady=4)
+        self.bulk_rows = tk.Entry(bulk, width=12)
+        self.bulk_rows.grid(row=1, column=0, columnspan=2, padx=2, pady=4, sticky="ew")
+        tk.Button(bulk, text="Apply to Rows",
+                  command=self.assign_rows).grid(row=1, column=2, padx=2, pady=4)
+
+    def count(self):
+        return len(self.rows["B"])
+
+    def resize(self, count):
+        """
+        Sets the number of buyers (and of sellers), keeping the strategies
+        of rows that remain.  Raises ValueError for a negative count.
+        """
+        if count < 0:
+            raise ValueError(f"number of traders must be at least 0, not {count}")
+        for side in ("B", "S"):
+            del self.rows[side][count:]
+            self.rows[side].extend([""] * (count - len(self.rows[side])))
+        self.selected = {k for k in self.selected if k < count}
+        self.scroll_to(self.first_row)
+
+    def scroll_to(self, first_row):
+        self.first_row = max(0, min(first_row, self.count() - self.visible_rows))
+        self.render()
+
+    def on_scroll(self, action, amount, unit = None):
+        if action == "moveto":
+            self.scroll_to(int(float(amount) * self.count()))
+        elif unit == "pages":
+            self.scroll_to(self.first_row + int(amount) * self.visible_rows)
+        else:
+            self.scroll_to(self.first_row + int(amount))
+
+    def render(self):
+        """
+        Refills the visible rows from the strategy lists
+        """
+        self.rendering = True
+        self.editor.place_forget()
+        count = self.count()
+        selection = []
+        for k, item in enumerate(self.items):
+            row = self.first_row + k
+            if row < count:
+                self.tree.item(item, values=(row + 1, self.rows["B"][row], self.rows["S"][row]))
+                self.tree.move(item, "", k)
+                if row in self.selected:
+                    selection.append(item)
+            else:
+                self.tree.detach(item)
+        self.tree.selection_set(selection)
+        if count:
+            self.scrollbar.set(self.first_row / count, min(1.0, (self.first_row + self.visible_rows) / count))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+        self.rendering = False
+
+    def on_select(self, event):
+        """
+        Keeps selections from other pages when the visible selection changes
+        """
+        if self.rendering:
+            return
+        visible = range(self.first_row, self.first_row + self.visible_rows)
+        self.selected = {k for k in self.selected if k not in visible}
+        self.selected.update(self.first_row + self.items.index(item) for item in self.tree.selection())
+
+    def edit_cell(self, event):
+        item = self.tree.identify_row(event.y)
+        column = self.tree.identify_column(event.x)
+        if not item or column == "#1":
+            return
+        side = "B" if column == "#2" else "S"
+        x, y, width, height = self.tree.bbox(item, column)
+        self.editing = (side, self.first_row + self.items.index(item))
+        self.editor.set(self.rows[side][self.editing[1]])
+        self.editor.place(x=x, y=y, width=width, height=height)
+        self.editor.focus_set()
+
+    def finish_edit(self, event):
+        side, row = self.editing
+        self.rows[side][row] = self.editor.get()
+        self.editor.place_forget()
+        self.render()
+
+    def assign(self, rows):
+        """
+        Gives the bulk strategy to the bulk side of rows
+        """
+        strategy = self.bulk_strategy.get()
+        sides = {"Buyers": ("B",), "Sellers": ("S",)}.get(self.bulk_side.get(), ("B", "S"))
+        for side in sides:
+            column = self.rows[side]
+            for row in rows:
+                column[row] = strategy
+        self.render()
+
+    def assign_rows(self):
+        try:
+            rows = parse_rows(self.bulk_rows.get(), self.count())
+        except ValueError:
+            messagebox.showerror("Error", "Rows should look like 1-250, 400")
+            return
+        self.assign(rows)
+
 class MktSimGui:
     def __init__(self, top_window, simulator):
         """
@@ -58,14 +228,21 @@ class MktSimGui:
         trader_num_label.grid(row=0, column=0, padx=self.padx, pady=self.pady, sticky="w")
 
         self.trader_num = tk.IntVar(value=0)
-        self.trader_num.trace("w", lambda *args: self.update_traders())
+        self.trader_num.trace("w", lambda *args: self.schedule_update())
 
         self.trader_num_entry = tk.Entry(self.trader_frame, textvariable=self.trader_num, width=10)
         self.trader_num_entry.grid(row=0, column=1, padx=self.padx, pady=self.pady, sticky="w")
 
-        # Placeholder for trader rows
-        self.trader_rows_frame = tk.Frame(self.trader_frame)
-        self.trader_rows_frame.grid(row=1, column=0, columnspan=2, padx=self.padx, pady=self.pady, sticky="ew")
+        # Trader table
+        self.trader_table = TraderTable(self.trader_frame)
+        self.trader_table.grid(row=1, column=0, columnspan=2, padx=self.padx, pady=self.pady, sticky="ew")
+        self.save_button = tk.Button(
+            self.trader_frame,
+            text="Save Config to TOML and Load It",
+            command=self.save_to_toml,
+        )
+        self.save_button.grid(row=2, column=0, pady=10, columnspan=2)
+        self.pending_update = None
 
         self.file_path = None
         self.load_button = tk.Button(self.config_frame, text="Select File", command=self.load_config_file)
@@ -98,8 +275,6 @@ class MktSimGui:
         self.quit_button = tk.Button(self.main_frame, text="Quit", command=self.top_window.quit)
         self.quit_button.grid(row=6, column=0, padx=self.padx, pady=self.pady, sticky="ew")
 
-        self.traders = []
-
         # Toggle Frames
         self.toggle_frames()
 
@@ -114,45 +289,26 @@ class MktSimGui:
             self.trader_frame.grid(row=2, column=0, pady=5, sticky="ew")
             self.config_frame.grid_forget()
 
+    def schedule_update(self, delay = 300):
+        """
+        Updates the trader table once typing in the trader-count entry has
+        paused for delay milliseconds.
+        """
+        if self.pending_update is not None:
+            self.top_window.after_cancel(self.pending_update)
+        self.pending_update = self.top_window.after(delay, self.update_traders)
+
     def update_traders(self):
         """
         Updates the number of traders selected by user-input.
         """
-        # Clears existing rows
-        for widget in self.trader_rows_frame.winfo_children():
-            widget.destroy()
-        self.traders.clear()
-
-        # Adds new rows for buyers and sellers
+        self.pending_update = None
         try:
-            for i in range(self.trader_num.get()):
-                buyer_label = tk.Label(self.trader_rows_frame, text=f"Buyer {i + 1}")
-                buyer_label.grid(row=i, column=0, pady=5, sticky="ew")
-
-                buyer_strat = ttk.Combobox(self.trader_rows_frame)
-                buyer_strat["values"] = ["Zero Intelligence", "Kaplan", "Ringuette", "Persistent Shout", "Skeleton"]
-                buyer_strat.state(["readonly"])
-                buyer_strat.grid(row=i, column=1, pady=5, sticky="ew")
-                self.traders.append(("B", f"B{i + 1}", buyer_strat))
-
-                seller_label = tk.Label(self.trader_rows_frame, text=f"Seller {i + 1}")
-                seller_label.grid(row=i, column=2, pady=5, sticky="ew")
-
-                seller_strat = ttk.Combobox(self.trader_rows_frame)
-                seller_strat["values"] = ["Zero Intelligence", "Kaplan", "Ringuette", "Persistent Shout", "Skeleton"]
-                seller_strat.state(["readonly"])
-                seller_strat.grid(row=i, column=3, pady=5, sticky="ew")
-                self.traders.append(("S", f"S{i + 1}", seller_strat))
-
-            self.save_button = tk.Button(
-            self.trader_rows_frame,
-            text="Save Config to TOML and Load It",
-            command=self.save_to_toml,
-        )
-            self.save_button.grid(row=self.trader_num.get(), column=0, pady=10, columnspan=4)
+            self.trader_table.resize(self.trader_num.get())
         except tk.TclError:
             print("Blank Field")
-
+        except ValueError as error:
+            print(error)
 
     def load_config_file(self):
         """
@@ -185,7 +341,8 @@ class MktSimGui:
         """
         self.sim.calc_market()
         self.sim.show_market()
-        self.sim.sim_period(100)
+        self.sim.sim_period(100, print_book=False)
+        book_viewer.BookViewer(self.top_window, self.sim.da)
 
     def run_tournament(self):
         """
@@ -205,20 +362,23 @@ class MktSimGui:
         config = {
             "title": "MarketSim Config",
             "message": "File Loaded",
-            "num_buyers": self.trader_num.get(),
-            "num_sellers": self.trader_num.get(),
+            "num_buyers": self.trader_table.count(),
+            "num_sellers": self.trader_table.count(),
         }
 
-        for trader_type, name, combobox in self.traders:
-            selected_strategy = combobox.get() or "Not Selected"
-            config[name] = {
-                "name": name,
-                "type": trader_type,
-                "num_units": 3,
-                "min_value": 200 if trader_type == "B" else 100,
-                "max_value": 400 if trader_type == "B" else 300,
-                "trader_type": selected_strategy,
-            }
+        rows = self.trader_table.rows
+        for k in range(self.trader_table.count()):
+            for trader_type in ("B", "S"):
+                name = f"{trader_type}{k + 1}"
+                selected_strategy = rows[trader_type][k] or "Not Selected"
+                config[name] = {
+                    "name": name,
+                    "type": trader_type,
+                    "num_units": 3,
+                    "min_value": 200 if trader_type == "B" else 100,
+                    "max_value": 400 if trader_type == "B" else 300,
+                    "trader_type": selected_strategy,
+                }
 
         # ask the user for a file name
         file_path = filedialog.asksaveasfilename(
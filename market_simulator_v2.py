@@ -1,3 +1,4 @@
+import copy
 import matplotlib.pyplot as plt
 import numpy as np     
 from dataclasses import dataclass
@@ -5,22 +6,64 @@ from tkinter import messagebox
 from typing import List
 from operator import itemgetter
 import random as rnd
+import time
 import toml
 
 import double_auction as institution
 import spot_market_environment as environment
 
+@dataclass
+class MarketSnapshot:
+    """
+    Compact state of a market part way through a period, taken by
+    MarketSim.snapshot.  The order log, contracts and every trader's price
+    and contract lists only grow during a period, so they are kept as
+    lengths and restored by truncation; nothing is copied except the
+    standing quotes and, for a depth or ladder book, the book itself.
+    round = next round to run
+    rng_state = random.getstate() at that round
+    standing = copy of the standing bid and ask
+    sequence_number = next order sequence number
+    num_contracts = number of contracts so far
+    traders = int array (traders, 3) of current_unit, len(prices), len(contracts)
+    book = copy of a continuous book, None for the standing book
+    strategy_states = {trader name: snapshot_state()} for traders that keep more state
+    """
+    round: int
+    rng_state: tuple
+    standing: dict
+    sequence_number: int
+    num_contracts: int
+    traders: np.ndarray
+    book: object = None
+    strategy_states: dict = None
+
 class MarketSim():
     """
     Runs Market Simulations
+    args:
+        book_type, 'standing' (single standing bid and ask),
+                   'depth' (continuous limit order book) or
+                   'ladder' (the same book on a whole-number price grid).
+        profiler, optional profiling.SimProfiler to time each phase.
+        metrics, optional profiling.StrategyMetrics to record each decision.
+        tape, optional quote_tape.QuoteTape to record the quotes after each round.
     """
     def __init__(self, sim_name = "temp_sim_name", 
-                       market_name  ="temp_market_name"):
+                       market_name  ="temp_market_name",
+                       book_type = "standing",
+                       profiler = None,
+                       metrics = None,
+                       tape = None):
         self.sim_name = sim_name
         self.market_name = market_name
         self.trader_list = []
         self.env = environment.MarketEnvironment(self.market_name)
-        self.da = institution.DoubleAuction(self.market_name)
+        self.da = institution.DoubleAuction(self.market_name, book_type)
+        self.profiler = profiler
+        self.metrics = metrics
+        self.tape = tape
+        self.da.profiler = profiler
     
     def build_a_buyer(self, name, trader_type, num_units, low_v, high_v):
         """
@@ -137,10 +180,23 @@ class MarketSim():
         args:
             file_path, path to TOML file.
         """
+        self.load_config_dict(toml.load(file_path))
+
+    def load_config_dict(self, config):
+        """
+        Builds the market from an already loaded configuration dictionary,
+        laid out as in the TOML files.
+        args:
+            config, configuration dictionary.
+        """
         self.da.contracts = []
         self.env.reset(self.market_name)
 
-        self.config = toml.load(file_path)
+        self.config = config
+        if 'buyers' in self.config:
+            self.load_population(self.config)
+            return
+        self.da.broadcast = self.config.get('broadcast', True)
         
         # Update the UI with the loaded configuration
         self.num_buyers = self.config['num_buyers']
@@ -162,6 +218,86 @@ class MarketSim():
             trader_type = self.config[seller_id]['trader_type']
             self.build_a_seller(name, trader_type, units, min_value, max_value)
 
+    def contract_prices(self):
+        """
+        Returns the prices of each trader's contracts, in contract order, in
+        one pass over the contracts.
+        returns:
+            buyer_prices, {buyer name: [price, ...]}
+            seller_prices, {seller name: [price, ...]}
+        """
+        buyer_prices = {}
+        seller_prices = {}
+        for price, buyer_name, seller_name in self.da.contracts:
+            buyer_prices.setdefault(buyer_name, []).append(price)
+            seller_prices.setdefault(seller_name, []).append(price)
+        return buyer_prices, seller_prices
+
+    def trader_surpluses(self, trader, buyer_prices, seller_prices):
+        """
+        Returns the surplus of each of trader's contracts, in contract order.
+        A seller's contracts beyond their last unit earn nothing.
+        """
+        if trader.type == "B":
+            res = trader.values.reservation_values
+            return [res[unit] - price for unit, price in enumerate(buyer_prices.get(trader.name, ()))]
+        res = trader.costs.unit_costs
+        prices = seller_prices.get(trader.name, ())[:len(res)]
+        return [price - res[unit] for unit, price in enumerate(prices)]
+
+    def load_bank(self, bank, round):
+        """
+        Builds the market of one round of a token_bank.TokenBank: the traders
+        of the bank's configuration with that round's pre-drawn tokens, and
+        its precomputed equilibrium, so calc_market is not needed.
+        args:
+            bank, token_bank.TokenBank.
+            round, round of the bank.
+        """
+        self.da.contracts = []
+        self.env.reset(self.market_name)
+
+        self.config = bank.config
+        self.da.broadcast = self.config.get('broadcast', True)
+        self.num_buyers = self.config['num_buyers']
+        self.num_sellers = self.config['num_sellers']
+        for k in range(self.num_buyers):
+            seat = self.config[f"B{k + 1}"]
+            trader_class = environment.buyer_types[seat['trader_type']]
+            self.env.add_buyer(trader_class(seat['name'], bank.buyer_tokens(round, k)))
+        for k in range(self.num_sellers):
+            seat = self.config[f"S{k + 1}"]
+            trader_class = environment.seller_types[seat['trader_type']]
+            self.env.add_seller(trader_class(seat['name'], bank.seller_tokens(round, k)))
+        self.env.set_equilibrium(*bank.equilibrium(round))
+
+    def load_population(self, config):
+        """
+        Builds a large market from the population form of the configuration:
+            [buyers]
+            count = 2000
+            num_units = 3
+            min_value = 200
+            max_value = 400
+            [buyers.mix]
+            "Kaplan" = 0.4
+            "Zero Intelligence" = 0.6
+        and the same for [sellers].  Traders are named B1, B2, ... and
+        S1, S2, ..., with strategies assigned in proportion to the mix.
+        Contracts are only sent to their buyer and seller unless
+        broadcast = true is set.
+        args:
+            config, configuration dictionary.
+        """
+        self.da.broadcast = config.get('broadcast', False)
+        for prefix, side in (('B', 'buyers'), ('S', 'sellers')):
+            population = config[side]
+            self.env.build_population(prefix, population['count'], population['mix'],
+                                      population['num_units'],
+                                      population['min_value'], population['max_value'])
+        self.num_buyers = config['buyers']['count']
+        self.num_sellers = config['sellers']['count']
+
     def calc_efficiency(self, trader_list, max_surplus):
         """
         Calculates efficiency from actual Double Auction trades
@@ -178,41 +314,102 @@ class MarketSim():
         actual_surplus = 0
         efficiency = 0
 
+        buyer_prices, seller_prices = self.contract_prices()
         for trader in trader_list:
-            trader_surplus = 0
-            unit = 0
-            if trader.type == "B":
-                res = trader.values.reservation_values
-            else:
-                res = trader.costs.unit_costs
-            for contract in self.da.contracts:
-                price, buyer_name, seller_name = contract
+            for surplus in self.trader_surpluses(trader, buyer_prices, seller_prices):
                 if trader.type == "B":
-                    if trader.name == buyer_name:
-                        surplus = res[unit] - price
-                        unit = unit + 1
-                        trader_surplus = trader_surplus + surplus
-                        buyer_surplus = buyer_surplus + surplus
+                    buyer_surplus = buyer_surplus + surplus
                 else:
-                    if trader.name == seller_name:
-                        try: 
-                            surplus = price - res[unit]
-                            unit = unit + 1
-                            trader_surplus = trader_surplus + surplus
-                            seller_surplus = seller_surplus + surplus
-                        except IndexError:
-                            pass
-                        
+                    seller_surplus = seller_surplus + surplus
                                 
         actual_surplus = buyer_surplus + seller_surplus
         efficiency = (actual_surplus/max_surplus)*100.0
         return actual_surplus, efficiency
 
-    def sim_period(self, num_rounds):
+    def run_rounds(self, traders, num_rounds, arrivals = None, start = 0, stop = None):
+        """
+        Runs num_rounds of trading.  Each round a randomly chosen trader
+        may submit a bid or ask given the standing bid and ask.
+        args:
+            traders, list of traders (both buyers and sellers).
+            num_rounds, number of rounds for simulation period.
+            arrivals, optional sequence of indices into traders giving the
+                      trader of each round, instead of random draws.
+            start, stop, optional range of rounds to run, for running a
+                         period in parts.
+        """
+        stop = num_rounds if stop is None else stop
+        if (self.profiler is not None or self.metrics is not None or self.da.recorder is not None
+                or self.tape is not None):
+            return self.run_rounds_profiled(traders, num_rounds, arrivals, start, stop)
+
+        for round in range(start, stop):
+            trader = rnd.choice(traders) if arrivals is None else traders[arrivals[round]]
+            standing_bid = self.da.book.standing['bid']
+            standing_ask = self.da.book.standing['ask']
+            if trader.type == "B": 
+                bid = trader.bid(standing_bid, standing_ask, round, num_rounds)
+                #print(f"standing bid = {standing_bid}, bid = {bid}")
+                if bid != None: self.da.order(bid)
+            if trader.type == "S": 
+                ask = trader.ask(standing_bid, standing_ask, round, num_rounds)
+                #print(f"standing ask = {standing_ask}, ask = {ask}")
+                if ask != None: self.da.order(ask)
+
+    def run_rounds_profiled(self, traders, num_rounds, arrivals = None, start = 0, stop = None):
+        """
+        Same as run_rounds, timing the trader draw, each strategy call and 
+        each order with self.profiler, recording each decision and its
+        outcome in self.metrics, each round's trader in self.da.recorder,
+        and the quotes after each round in self.tape.
+        """
+        prof = self.profiler
+        metrics = self.metrics
+        recorder = self.da.recorder
+        tape = self.tape
+        book = self.da.book
+        prices = self.da.prices
+        clock = time.perf_counter
+        stop = num_rounds if stop is None else stop
+        for round in range(start, stop):
+            began = clock()
+            trader = rnd.choice(traders) if arrivals is None else traders[arrivals[round]]
+            if recorder is not None:
+                recorder.arrival(trader.name)
+            standing_bid = self.da.book.standing['bid']
+            standing_ask = self.da.book.standing['ask']
+            decided = clock()
+            if trader.type == "B": 
+                order = trader.bid(standing_bid, standing_ask, round, num_rounds)
+                action = "bid"
+            else:
+                order = trader.ask(standing_bid, standing_ask, round, num_rounds)
+                action = "ask"
+            ordered = clock()
+            outcome = None
+            if order != None: 
+                outcome = self.da.order(order)
+            strategy = trader.__class__.__name__
+            if prof is not None:
+                prof.add(("choose trader",), decided - began)
+                prof.add(("strategy", strategy, action), ordered - decided)
+                if order != None:
+                    prof.add(("order",), clock() - ordered)
+            if metrics is not None:
+                metrics.record(strategy, ordered - decided, outcome)
+            if tape is not None:
+                standing = book.standing
+                tape.record(round, np.nan if standing['bid_id'] == self.da.name else standing['bid'],
+                            np.nan if standing['ask_id'] == self.da.name else standing['ask'],
+                            prices[-1] if prices else np.nan)
+
+    def sim_period(self, num_rounds, print_book = True):
         """
         Simulates a period of trading lasting num_rounds.
         args:
             num_rounds, number of rounds for simulation period.
+            print_book, False to skip printing the order book and contracts,
+                        e.g. when they are shown in a book_viewer.BookViewer.
         """
         # Registers buyers and sellers
         for buyer in self.env.buyers:
@@ -225,34 +422,25 @@ class MarketSim():
         traders.extend(self.env.buyers)
         traders.extend(self.env.sellers)
 
-        for round in range(0, num_rounds):
-            trader = rnd.choice(traders)
-            standing_bid = self.da.book.standing['bid']
-            standing_ask = self.da.book.standing['ask']
-            if trader.type == "B": 
-                bid = trader.bid(standing_bid, standing_ask, round, num_rounds)
-                #print(f"standing bid = {standing_bid}, bid = {bid}")
-                if bid != None: self.da.order(bid)
-            if trader.type == "S": 
-                ask = trader.ask(standing_bid, standing_ask, round, num_rounds)
-                #print(f"standing ask = {standing_ask}, ask = {ask}")
-                if ask != None: self.da.order(ask)
-        print()
-        self.da.book.print_book()
-        print()
-        print("Contracts")
-        for contract in self.da.contracts:
-            print(contract)
-        print()
+        self.run_rounds(traders, num_rounds)
+        if print_book:
+            print()
+            self.da.book.print_book()
+            print()
+            print("Contracts")
+            for contract in self.da.contracts:
+                print(contract)
+            print()
         eq_units, eq_price_low, eq_price_high, max_surplus = self.env.get_equilibrium()
         actual_surplus, efficiency = self.calc_efficiency(traders, max_surplus)
         print(f"actual surplus = {actual_surplus}, efficiency = {efficiency}")
 
-    def sim_period_silent(self, num_rounds):
+    def sim_period_silent(self, num_rounds, arrivals = None):
         """
         Simulates a period of trading lasting num_rounds without print statements.
         args:
             num_rounds, number of rounds for simulation period.
+            arrivals, optional trader index (buyers then sellers) for each round.
         returns:
             actual_surplus, actual surplus for the simulation
             efficiency, how much of maximum surplus was captured by actual surplus
@@ -261,35 +449,112 @@ class MarketSim():
             eq_price_high, the high equilibirum price
             individual_surplus, a dictionary of individual traders and their respective surpluses.
         """
-        # Registers buyers and sellers
+        traders = self.start_period()
+        self.run_rounds(traders, num_rounds, arrivals)
+        return self.finish_period(traders)
+
+    def start_period(self):
+        """
+        Registers buyers and sellers with the double auction.
+        returns:
+            traders, list of buyers then sellers
+        """
         for buyer in self.env.buyers:
             self.da.register(buyer)
         for seller in self.env.sellers:
             self.da.register(seller)
 
-        # Runs simulation
         traders = []
         traders.extend(self.env.buyers)
         traders.extend(self.env.sellers)
+        return traders
 
-        for round in range(0, num_rounds):
-            trader = rnd.choice(traders)
-            standing_bid = self.da.book.standing['bid']
-            standing_ask = self.da.book.standing['ask']
-            if trader.type == "B": 
-                bid = trader.bid(standing_bid, standing_ask, round, num_rounds)
-                #print(f"standing bid = {standing_bid}, bid = {bid}")
-                if bid != None: self.da.order(bid)
-            if trader.type == "S": 
-                ask = trader.ask(standing_bid, standing_ask, round, num_rounds)
-                #print(f"standing ask = {standing_ask}, ask = {ask}")
-                if ask != None: self.da.order(ask)
-        
+    def finish_period(self, traders):
+        """
+        Returns the results of the period, as sim_period_silent.
+        """
         eq_units, eq_price_low, eq_price_high, max_surplus = self.env.get_equilibrium()
-        actual_surplus, efficiency = self.calc_efficiency(traders, max_surplus)
-        individual_surplus = self.sim_trader_surplus(traders)
+        if self.profiler is None:
+            actual_surplus, efficiency = self.calc_efficiency(traders, max_surplus)
+            individual_surplus = self.sim_trader_surplus(traders)
+        else:
+            with self.profiler.phase("surplus"):
+                actual_surplus, efficiency = self.calc_efficiency(traders, max_surplus)
+                individual_surplus = self.sim_trader_surplus(traders)
         return actual_surplus, efficiency, eq_units, eq_price_low, eq_price_high, individual_surplus
 
+    def snapshot(self, round):
+        """
+        Takes a MarketSnapshot of a period started with start_period and run
+        up to (not including) round, to continue from with run_branch.
+        """
+        book = self.da.book
+        traders = self.env.buyers + self.env.sellers
+        positions = np.array([((t.values if t.type == "B" else t.costs).current_unit,
+                               len(t.prices), len(t.contracts)) for t in traders], dtype=np.int64)
+        strategy_states = {t.name: t.snapshot_state() for t in traders if hasattr(t, 'snapshot_state')}
+        return MarketSnapshot(round, rnd.getstate(), dict(book.standing), book.sequence_number,
+                              len(self.da.contracts), positions,
+                              copy.deepcopy(book) if book.continuous else None, strategy_states)
+
+    def restore(self, snapshot):
+        """
+        Puts the market back in the state of snapshot by truncating
+        everything added since it was taken.
+        returns:
+            traders, list of buyers then sellers
+        """
+        da = self.da
+        if snapshot.book is not None:
+            da.book = copy.deepcopy(snapshot.book)
+        else:
+            book = da.book
+            for seq in range(snapshot.sequence_number, book.sequence_number):
+                del book.book[seq]
+            book.sequence_number = snapshot.sequence_number
+            book.standing = dict(snapshot.standing)
+        del da.contracts[snapshot.num_contracts:]
+        del da.prices[snapshot.num_contracts:]
+        traders = self.env.buyers + self.env.sellers
+        for trader, (unit, num_prices, num_contracts) in zip(traders, snapshot.traders.tolist()):
+            (trader.values if trader.type == "B" else trader.costs).current_unit = unit
+            del trader.prices[num_prices:]
+            del trader.contracts[num_contracts:]
+        for name, state in (snapshot.strategy_states or {}).items():
+            da.get_trader(name).restore_state(state)
+        rnd.setstate(snapshot.rng_state)
+        return traders
+
+    def run_branch(self, snapshot, num_rounds, orders = None, seed = None):
+        """
+        Runs the rest of the period from snapshot as one counterfactual
+        branch.  The market can be restored and branched again afterwards.
+        args:
+            snapshot, MarketSnapshot to continue from.
+            num_rounds, number of rounds for simulation period.
+            orders, optional {round: order} replacing the decision of that
+                    round's trader with a fixed order, e.g.
+                    {40: ("B3", "bid", 180)}.  An order from a trader with
+                    no units left is dropped.
+            seed, optional seed of a new random future, instead of the
+                  snapshot's random state.
+        returns:
+            results as sim_period_silent
+        """
+        traders = self.restore(snapshot)
+        if seed is not None:
+            rnd.seed(seed)
+        round = snapshot.round
+        for fixed in sorted(orders or {}):
+            self.run_rounds(traders, num_rounds, None, round, fixed)
+            rnd.choice(traders)     # the arrival the fixed order replaces
+            trader = self.da.get_trader(orders[fixed][0])
+            if trader is None or (trader.values if trader.type == "B" else trader.costs).current is not None:
+                self.da.order(orders[fixed])
+            round = fixed + 1
+        self.run_rounds(traders, num_rounds, None, round)
+        return self.finish_period(traders)
+
     def sim_trader_surplus(self, trader_list):
         """
         Calculates and stores individual surpluses for each buyer and seller.
@@ -302,29 +567,11 @@ class MarketSim():
         individual_surplus = {}
 
         # loop through all traders
+        buyer_prices, seller_prices = self.contract_prices()
         for trader in trader_list:
             trader_surplus = 0
-            unit = 0
-            if trader.type == "B":
-                res = trader.values.reservation_values
-            else:
-                res = trader.costs.unit_costs
-            
-            for contract in self.da.contracts:
-                price, buyer_name, seller_name = contract
-                if trader.type == "B":
-                    if trader.name == buyer_name:
-                        surplus = res[unit] - price
-                        unit += 1
-                        trader_surplus += surplus  # total buyer surplus
-                else:
-                    if trader.name == seller_name:
-                        try: 
-                            surplus = price - res[unit]
-                            unit += 1
-                            trader_surplus += surplus
-                        except IndexError:
-                            pass
+            for surplus in self.trader_surpluses(trader, buyer_prices, seller_prices):
+                trader_surplus += surplus
 
             # store the trader's individual surplus in the dictionary
             individual_surplus[trader.name] = trader_surplus
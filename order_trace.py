@@ -0,0 +1,190 @@
+import random as rnd
+from array import array
+
+import numpy as np
+
+import double_auction as institution
+import market_simulator_v2 as msim
+
+VERSION = 1
+ORDER = np.dtype([('round', np.int32), ('trader', np.int32), ('side', np.int8),
+                  ('price', np.float64), ('quantity', np.int32), ('code', np.int8)])
+
+class Trace:
+    """
+    Compact record of the order flow of a DoubleAuction:
+        book_type, tick, the auction's book (tick of a 'ladder' book)
+        names, types, the participants, in registration order
+        arrivals, index of the trader drawn in each round
+        orders, structured array of (round, trader, side, price, quantity, code)
+                with side BID / ASK and code as returned by submit_batch
+    Record a period by attaching the trace before it runs:
+        sim.da.recorder = Trace(sim.da)
+    args:
+        da, the DoubleAuction to record (None for a loaded trace).
+    """
+    def __init__(self, da = None):
+        self.da = da
+        self.book_type = da.book_type if da is not None else "standing"
+        self.tick = da.book.tick if da is not None and da.book_type == 'ladder' else 1
+        self.names = []
+        self.types = []
+        self.index = {}
+        self.arrivals = array('i')
+        self.columns = {field: array(code) for field, code in
+                        (('round', 'i'), ('trader', 'i'), ('side', 'b'),
+                         ('price', 'd'), ('quantity', 'i'), ('code', 'b'))}
+        self.loaded = None
+
+    def sync(self):
+        """
+        Picks up participants registered since the last record (nothing
+        for a loaded trace).
+        """
+        if self.da is None:
+            return
+        for trader in self.da.participants[len(self.names):]:
+            self.index.setdefault(trader.name, len(self.names))
+            self.names.append(trader.name)
+            self.types.append(trader.type)
+
+    def trader_index(self, name):
+        if name not in self.index:
+            self.sync()
+        return self.index.get(name, -1)
+
+    def arrival(self, name):
+        """
+        Records the trader drawn for a round.
+        """
+        self.arrivals.append(self.trader_index(name))
+
+    def add(self, trader, side, price, quantity, code):
+        columns = self.columns
+        columns['round'].append(len(self.arrivals) - 1)
+        columns['trader'].append(trader)
+        columns['side'].append(side)
+        columns['price'].append(price)
+        columns['quantity'].append(quantity)
+        columns['code'].append(code)
+
+    def order(self, da, order):
+        """
+        Processes an order on da, as DoubleAuction.order does, and records it.
+        """
+        da.recorder = None
+        try:
+            outcome = da.order(order)
+        finally:
+            da.recorder = self
+        name, type, amount = order[:3]
+        side = institution.BID if type == 'bid' else institution.ASK if type == 'ask' else -1
+        quantity = order[3] if len(order) > 3 else 1
+        self.add(self.trader_index(name), side, amount, quantity, institution.OUTCOME_CODES[outcome])
+        return outcome
+
+    def batch(self, traders, sides, prices, quantities, codes):
+        """
+        Records a batch processed by DoubleAuction.submit_batch.
+        """
+        self.sync()
+        columns = self.columns
+        columns['round'].extend([len(self.arrivals) - 1] * len(codes))
+        columns['trader'].extend(np.asarray(traders, dtype=np.int32).tolist())
+        columns['side'].extend(np.asarray(sides, dtype=np.int8).tolist())
+        columns['price'].extend(np.asarray(prices, dtype=np.float64).tolist())
+        columns['quantity'].extend(np.asarray(quantities, dtype=np.int32).tolist())
+        columns['code'].extend(codes.tolist())
+
+    @property
+    def orders(self):
+        if self.loaded is not None:
+            return self.loaded
+        orders = np.empty(len(self.columns['code']), dtype=ORDER)
+        for field, column in self.columns.items():
+            orders[field] = np.frombuffer(column, dtype=ORDER[field]) if len(column) else []
+        return orders
+
+    def save(self, file_path, compress = True):
+        """
+        Writes the trace to file_path as a NumPy .npz archive,
+        zlib-compressed unless compress is False.
+        """
+        self.sync()
+        save = np.savez_compressed if compress else np.savez
+        save(file_path, version=VERSION, book_type=self.book_type, tick=self.tick,
+             names=np.array(self.names, dtype=str), types=np.array(self.types, dtype=str),
+             arrivals=np.frombuffer(self.arrivals, dtype=np.int32) if len(self.arrivals) else np.zeros(0, np.int32),
+             orders=self.orders)
+
+    @classmethod
+    def load(cls, file_path):
+        """
+        Reads a trace written by save.
+        """
+        with np.load(file_path) as data:
+            assert int(data['version']) == VERSION, f"{file_path} is trace version {int(data['version'])}"
+            trace = cls()
+            trace.book_type = str(data['book_type'])
+            trace.tick = float(data['tick']) if 'tick' in data else 1
+            trace.names = data['names'].tolist()
+            trace.types = data['types'].tolist()
+            trace.arrivals = array('i', data['arrivals'].tolist())
+            trace.loaded = data['orders']
+        return trace
+
+class ReplayTrader:
+    """
+    Stand-in for a recorded trader: takes part in contracts but makes no
+    decisions, so a replay never calls a strategy.
+    """
+    def __init__(self, name, type):
+        self.name = name
+        self.type = type
+
+    def contract(self, price, your_contract):
+        pass
+
+def replay_auction(trace, book_type = None):
+    """
+    Returns a DoubleAuction with a ReplayTrader for each recorded participant.
+    """
+    da = institution.DoubleAuction("replay", book_type or trace.book_type, broadcast=False, tick=trace.tick)
+    for name, type in zip(trace.names, trace.types):
+        da.register(ReplayTrader(name, type))
+    return da
+
+def replay(trace, book_type = None):
+    """
+    Pushes the recorded orders back through a fresh book in one
+    submit_batch call.  Replaying on another book_type, or after changing
+    the matching code, shows which orders now end differently.
+    returns:
+        da, the DoubleAuction after the replay
+        changed, indices of the orders whose outcome differs from the trace
+    """
+    orders = trace.orders
+    da = replay_auction(trace, book_type)
+    codes = da.submit_batch(orders['trader'], orders['side'], orders['price'], orders['quantity'])
+    return da, np.flatnonzero(codes != orders['code'])
+
+def record_period(config, sim_period, seed, book_type = "standing"):
+    """
+    Reruns one seeded period of a configuration with a trace attached,
+    e.g. tournament round r with seed + r as in tournament.run_block.
+    returns:
+        results of MarketSim.sim_period_silent, the Trace
+    """
+    rnd.seed(seed)
+    sim = msim.MarketSim("trace", f"Market {seed}", book_type)
+    sim.load_config_dict(config)
+    sim.calc_market()
+    sim.da.recorder = Trace(sim.da)
+    return sim.sim_period_silent(sim_period), sim.da.recorder
+
+if __name__ == "__main__":
+    import toml
+    results, trace = record_period(toml.load("config files/config_test_HorseRace.toml"), 100, 0)
+    trace.save("order_trace.npz")
+    da, changed = replay(Trace.load("order_trace.npz"))
+    print(f"{len(trace.orders)} orders, {len(da.contracts)} contracts, {len(changed)} changed outcomes")
@@ -0,0 +1,253 @@
+import sys
+import time
+import threading
+from array import array
+from contextlib import contextmanager
+import numpy as np
+
+class SimProfiler:
+    """
+    Collects timers and call counters for the phases of a simulation.
+    Timings are keyed by a stack of phase names, e.g.
+        ('run_tournament', 'sim_period_silent', 'strategy', 'Kaplan_Buyer', 'bid')
+    so they can be reported per phase and per strategy class, or exported
+    in the collapsed-stack format read by flame-graph tools.
+    A MarketSim, DoubleAuction or Tournament only times itself when its
+    profiler attribute is set, so there is no cost when profiling is off.
+    """
+    def __init__(self):
+        self.stack = ()
+        self.times = {}
+        self.counts = {}
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Times the enclosed block as phase name, nested under the current phase.
+        """
+        outer = self.stack
+        self.stack = outer + (name,)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stack = outer
+            self.add((name,), elapsed, outer)
+
+    def add(self, path, seconds, stack = None):
+        """
+        Adds seconds and one call to path, relative to the current phase.
+        args:
+            path, tuple of phase names below the current phase.
+            seconds, elapsed time.
+            stack, phase stack to use instead of the current one.
+        """
+        key = (self.stack if stack is None else stack) + path
+        self.times[key] = self.times.get(key, 0.0) + seconds
+        self.counts[key] = self.counts.get(key, 0) + 1
+
+    def self_times(self):
+        """
+        Returns {path: seconds} with the time of nested phases taken out
+        of their nearest recorded ancestor (e.g. ('strategy', cls, action)
+        out of the phase it ran in, as there is no ('strategy', cls) entry).
+        """
+        own = dict(self.times)
+        for key, seconds in self.times.items():
+            for depth in range(len(key) - 1, 0, -1):
+                if key[:depth] in own:
+                    own[key[:depth]] -= seconds
+                    break
+        return own
+
+    def strategy_times(self):
+        """
+        Returns {strategy class: (calls, seconds)} for bid and ask decisions.
+        """
+        strategies = {}
+        for key, seconds in self.times.items():
+            if len(key) >= 3 and key[-3] == 'strategy':
+                calls, total = strategies.get(key[-2], (0, 0.0))
+                strategies[key[-2]] = (calls + self.counts[key], total + seconds)
+        return strategies
+
+    def report(self):
+        """
+        Neatly prints the time spent in each phase and each strategy class.
+        """
+        total = sum(seconds for key, seconds in self.times.items() if len(key) == 1)
+        total = total or sum(self.times.values()) or 1.0
+        print(f"{'phase':<60} {'calls':>10} {'total s':>10} {'mean us':>10} {'%':>6}")
+        print("-" * 100)
+        for key in sorted(self.times):
+            seconds = self.times[key]
+            calls = self.counts[key]
+            depth = len(key) - 1
+            while depth > 0 and key[:depth] not in self.times:
+                depth -= 1
+            label = "  " * depth + " ".join(key[depth:])
+            print(f"{label:<60} {calls:>10} {seconds:>10.4f} "
+                  f"{1e6 * seconds / calls:>10.2f} {100 * seconds / total:>6.1f}")
+        print()
+        print(f"{'strategy':<30} {'calls':>10} {'total s':>10} {'mean us':>10}")
+        print("-" * 64)
+        ranked = sorted(self.strategy_times().items(), key=lambda item: -item[1][1])
+        for strategy, (calls, seconds) in ranked:
+            print(f"{strategy:<30} {calls:>10} {seconds:>10.4f} {1e6 * seconds / calls:>10.2f}")
+        print()
+
+    def export_collapsed(self, file_path):
+        """
+        Writes the timings in collapsed-stack format, one line per stack
+        'phase;phase;phase microseconds', for flamegraph.pl or speedscope.
+        """
+        with open(file_path, "w") as out:
+            for key, seconds in sorted(self.self_times().items()):
+                micros = int(round(seconds * 1e6))
+                if micros > 0:
+                    out.write(f"{';'.join(key)} {micros}\n")
+
+class StrategyMetrics:
+    """
+    Decision metrics per strategy class, aggregated over every period
+    that shares this object (e.g. a whole tournament):
+        calls, number of bid / ask decisions
+        latency, time per decision (mean and 99th percentile)
+        none rate, share of decisions that made no order
+        reject rate, share of orders the auction rejected
+        contract rate, share of orders that ended in a contract
+    """
+    def __init__(self):
+        self.latencies = {}
+        self.nones = {}
+        self.outcomes = {}
+
+    def record(self, strategy, seconds, outcome):
+        """
+        Records one decision by strategy that took seconds, where outcome is
+        None (no order) or the result returned by DoubleAuction.order.
+        """
+        try:
+            self.latencies[strategy].append(seconds)
+        except KeyError:
+            self.latencies[strategy] = array('d', [seconds])
+            self.nones[strategy] = 0
+            self.outcomes[strategy] = {}
+        if outcome is None:
+            self.nones[strategy] += 1
+        else:
+            outcomes = self.outcomes[strategy]
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    def summary(self):
+        """
+        Returns {strategy: {'calls', 'mean_us', 'p99_us', 'none_rate',
+                            'reject_rate', 'contract_rate'}}
+        """
+        summary = {}
+        for strategy, latencies in self.latencies.items():
+            micros = np.frombuffer(latencies, dtype=np.float64) * 1e6
+            calls = len(micros)
+            outcomes = self.outcomes[strategy]
+            orders = sum(outcomes.values())
+            rejected = sum(count for outcome, count in outcomes.items() if outcome != "contract" and outcome != "standing")
+            summary[strategy] = {
+                'calls': calls,
+                'mean_us': float(micros.mean()),
+                'p99_us': float(np.percentile(micros, 99)),
+                'none_rate': self.nones[strategy] / calls,
+                'reject_rate': rejected / orders if orders else 0.0,
+                'contract_rate': outcomes.get("contract", 0) / orders if orders else 0.0,
+            }
+        return summary
+
+    def report(self):
+        """
+        Neatly prints the metrics, slowest strategy first.
+        """
+        summary = self.summary()
+        print(f"{'strategy':<20} {'calls':>8} {'mean us':>8} {'p99 us':>8} "
+              f"{'none %':>7} {'reject %':>9} {'contract %':>11}")
+        print("-" * 77)
+        for strategy, m in sorted(summary.items(), key=lambda item: -item[1]['mean_us'] * item[1]['calls']):
+            print(f"{strategy:<20} {m['calls']:>8} {m['mean_us']:>8.2f} {m['p99_us']:>8.2f} "
+                  f"{100 * m['none_rate']:>7.1f} {100 * m['reject_rate']:>9.1f} {100 * m['contract_rate']:>11.1f}")
+        print()
+
+class StackSampler:
+    """
+    Sampling profiler for a running simulation.
+    A background thread records the call stack of the profiled thread
+    every interval seconds; the interpreter switch interval is lowered
+    while sampling so the sampler thread gets to run.  Use as a context manager:
+        with StackSampler() as sampler:
+            tournament.run_tournament()
+        sampler.export_collapsed("tournament.folded")
+    """
+    def __init__(self, interval = 0.001):
+        self.interval = interval
+        self.samples = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self, thread_id = None):
+        """
+        Starts sampling thread_id (default: the calling thread).
+        """
+        self._target = thread_id if thread_id is not None else threading.get_ident()
+        self._stop.clear()
+        self._switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self._switch_interval, self.interval / 2))
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+            sys.setswitchinterval(self._switch_interval)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(getattr(code, 'co_qualname', code.co_name))
+                frame = frame.f_back
+            key = ";".join(reversed(stack))
+            self.samples[key] = self.samples.get(key, 0) + 1
+
+    def report(self, top = 20):
+        """
+        Neatly prints the functions seen most often at the top of the stack.
+        """
+        leaves = {}
+        for key, count in self.samples.items():
+            leaf = key.rsplit(";", 1)[-1]
+            leaves[leaf] = leaves.get(leaf, 0) + count
+        total = sum(leaves.values()) or 1
+        print(f"{'function':<50} {'samples':>8} {'%':>6}")
+        print("-" * 66)
+        for leaf, count in sorted(leaves.items(), key=lambda item: -item[1])[:top]:
+            print(f"{leaf:<50} {count:>8} {100 * count / total:>6.1f}")
+        print()
+
+    def export_collapsed(self, file_path):
+        """
+        Writes the samples in collapsed-stack format, 'frame;frame;frame count'.
+        """
+        with open(file_path, "w") as out:
+            for key, count in sorted(self.samples.items()):
+                out.write(f"{key} {count}\n")
@@ -0,0 +1,74 @@
+import numpy as np
+
+class QuoteTape:
+    """
+    Records the standing bid, standing ask and last contract price after
+    each round of a period into arrays allocated up front.  Set
+    MarketSim.tape (or Tournament(..., tape_every=k)) to turn it on; with
+    no tape the round loop is unchanged.
+    step = round number of each record
+    bid, ask = standing quotes after the round (nan while a side holds only
+               the starting book's 0 / 999 placeholder, i.e. no trader's quote)
+    last = last contract price so far (nan before the first contract)
+    args:
+        num_steps, rounds in the period (sets the preallocated size).
+        every, record only every k-th round.
+        on_change, record only rounds whose quotes or last price differ
+                   from the previous record.
+    """
+    def __init__(self, num_steps, every = 1, on_change = False):
+        self.every = every
+        self.on_change = on_change
+        size = max(1, -(-num_steps // every))
+        self.step = np.empty(size, dtype=np.int32)
+        self.bid = np.empty(size, dtype=np.float64)
+        self.ask = np.empty(size, dtype=np.float64)
+        self.last = np.empty(size, dtype=np.float64)
+        self.count = 0
+
+    def record(self, step, bid, ask, last):
+        if step % self.every:
+            return
+        k = self.count
+        if self.on_change and k and same(last, self.last[k - 1]) and same(bid, self.bid[k - 1]) \
+                and same(ask, self.ask[k - 1]):
+            return
+        if k == len(self.step):
+            for name in ('step', 'bid', 'ask', 'last'):
+                setattr(self, name, np.resize(getattr(self, name), 2 * k))
+        self.step[k] = step
+        self.bid[k] = bid
+        self.ask[k] = ask
+        self.last[k] = last
+        self.count = k + 1
+
+    def dense(self, num_steps):
+        """
+        Returns bid, ask and last as arrays of num_steps rounds, each round
+        holding the latest record at or before it (nan before the first).
+        """
+        index = np.searchsorted(self.step[:self.count], np.arange(num_steps), side="right") - 1
+        missing = index < 0
+        index[missing] = 0
+        series = []
+        for values in (self.bid, self.ask, self.last):
+            column = values[:self.count][index] if self.count else np.full(num_steps, np.nan)
+            column[missing] = np.nan
+            series.append(column)
+        return series
+
+def same(a, b):
+    return a == b or (a != a and b != b)    # nan == nan
+
+def stack(tapes, num_steps):
+    """
+    Stacks the tapes of many periods on a common grid of num_steps rounds.
+    returns:
+        bid, ask, last, arrays (len(tapes), num_steps)
+    """
+    bid = np.full((len(tapes), num_steps), np.nan)
+    ask = np.full((len(tapes), num_steps), np.nan)
+    last = np.full((len(tapes), num_steps), np.nan)
+    for row, tape in enumerate(tapes):
+        bid[row], ask[row], last[row] = tape.dense(num_steps)
+    return bid, ask, last
@@ -0,0 +1,121 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import scipy.stats
+import toml
+
+import horse_race
+import sweep
+
+class RunningStats:
+    """
+    Incremental mean and variance (Welford's method), so statistics can be
+    updated as each result arrives without keeping the results.
+    """
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def half_width(self, confidence = 0.95):
+        """
+        Returns the half-width of the confidence interval for the mean.
+        """
+        if self.count < 2:
+            return float("inf")
+        t = scipy.stats.t.ppf((1 + confidence) / 2, self.count - 1)
+        return t * np.sqrt(self.variance / self.count)
+
+class RotationTournament:
+    """
+    Round-robin seat rotation tournament.
+    Each round is played once for every rotation of the strategies over the
+    seats (see horse_race.rotations), so every strategy holds every token
+    position equally often.  All rounds x rotations run as one job on a
+    pool of worker processes, and results are folded into per-strategy
+    running statistics as they come back.
+    args:
+        file_path, path to TOML file.
+        rounds, number of rounds; each is played once per rotation.
+        sim_period, number of rounds within simulation period.
+        seed, seed of the first round, shared by all its rotations.
+        workers, number of worker processes (default: all cores).
+        chunk_size, periods sent to a worker at a time.
+    """
+    def __init__(self, file_path, rounds, sim_period, seed = 0, workers = None, chunk_size = 50):
+        self.file_path = file_path
+        self.rounds = rounds
+        self.sim_period = sim_period
+        self.seed = seed
+        self.workers = workers or os.cpu_count()
+        self.chunk_size = chunk_size
+        self.config = toml.load(file_path)
+        self.stats = {}         # strategy label -> RunningStats of surplus per seat
+        self.seat_stats = {}    # (strategy label, seat) -> RunningStats
+        self.efficiency = RunningStats()
+
+    def schedule(self):
+        """
+        Returns the list of (config, sim_period, seed) periods to run.
+        """
+        configs = horse_race.rotations(self.config)
+        return [(config, self.sim_period, self.seed + r)
+                for r in range(self.rounds) for config in configs]
+
+    def update(self, config, result):
+        """
+        Folds one period's results into the running statistics.
+        """
+        labels = horse_race.seat_labels(config)
+        self.efficiency.update(result[1])
+        for name, surplus in result[5].items():
+            label = labels[name]
+            self.stats.setdefault(label, RunningStats()).update(surplus)
+            self.seat_stats.setdefault((label, name), RunningStats()).update(surplus)
+
+    def run(self):
+        """
+        Runs every scheduled period on the worker pool.
+        returns:
+            stats, {strategy label: RunningStats of surplus per seat}
+        """
+        tasks = self.schedule()
+        chunks = [tasks[i:i + self.chunk_size] for i in range(0, len(tasks), self.chunk_size)]
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            for chunk, results in zip(chunks, pool.map(sweep.run_periods, chunks)):
+                for (config, _, _), result in zip(chunk, results):
+                    self.update(config, result)
+        return self.stats
+
+    def report(self, confidence = 0.95):
+        """
+        Neatly prints mean surplus per seat of each strategy, best first,
+        with its mean in each seat.
+        """
+        seats = sorted({seat for _, seat in self.seat_stats})
+        if all(seat[1:].isdigit() for seat in seats):
+            seats.sort(key=lambda seat: (seat[0], int(seat[1:])))
+        print(f"{'strategy':<26} {'n':>6} {'mean':>8} {'+/-':>7}  " + " ".join(f"{seat:>7}" for seat in seats))
+        print("-" * (52 + 8 * len(seats)))
+        for label, stats in sorted(self.stats.items(), key=lambda item: -item[1].mean):
+            by_seat = " ".join(f"{self.seat_stats[(label, seat)].mean:>7.1f}" if (label, seat) in self.seat_stats
+                               else f"{'':>7}" for seat in seats)
+            print(f"{label:<26} {stats.count:>6} {stats.mean:>8.2f} {stats.half_width(confidence):>7.2f}  {by_seat}")
+        print()
+        print(f"Mean Efficiency: {self.efficiency.mean:.2f} +/- {self.efficiency.half_width(confidence):.2f}")
+
+if __name__ == "__main__":
+    tournament = RotationTournament("config files/config_test_HorseRace.toml", 200, 100)
+    tournament.run()
+    tournament.report()
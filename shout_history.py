@@ -0,0 +1,179 @@
+import copy
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+
+BID, ASK = 0, 1
+
+class ShoutHistory:
+    """
+    Windowed index of the bids and asks entered in a DoubleAuction, for
+    belief-based strategies (Gjerstad & Dickhaut, 1998).  It is a
+    DoubleAuction observer: order() is called after every order with the
+    order's outcome and the contract prices it made.  Taken and untaken
+    shouts of each side are kept in sorted price lists, so each belief
+    is a few bisections instead of a pass over the whole history.
+    A shout that rests and is later hit moves from untaken to taken.  For
+    a standing book (continuous False) only the standing bid and ask rest,
+    and neither survives a contract, as in LimitOrderBook.
+    As in Gjerstad & Dickhaut, beliefs are counted at the prices shouted
+    and interpolated linearly between them, with a bid belief of 0 at
+    price 0 and 1 at max_price (the reverse for asks).
+    args:
+        memory, shouts are forgotten once memory more contracts have
+                occurred after them.
+        max_price, highest price in the market.
+        continuous, True for a depth or ladder book, where every unfilled
+                    shout rests until hit.
+    """
+    def __init__(self, memory = 5, max_price = 999, continuous = False):
+        self.memory = memory
+        self.max_price = max_price
+        self.continuous = continuous
+        self.trades = 0
+        self.entries = deque()      # [trade count, side, price, taken, resting] in order entered
+        self.taken = ([], [])       # sorted prices of taken bids, taken asks
+        self.untaken = ([], [])     # sorted prices of bids, asks not (yet) taken
+        self.prices = []            # sorted prices of all shouts
+        self.resting = {}           # (side, price) -> entries that may still be hit
+
+    def __len__(self):
+        return len(self.entries)
+
+    def order(self, type, amount, outcome, fills):
+        """
+        Records an order.
+        args:
+            type, 'bid' or 'ask'.
+            amount, price of the order.
+            outcome, 'contract', 'standing' or 'rejected'.
+            fills, prices of the contracts the order made; each one takes
+                   a resting shout of the other side at that price.
+        """
+        side = BID if type == 'bid' else ASK
+        other = 1 - side
+        for price in fills:
+            resting = self.resting.get((other, price))
+            if resting:
+                self.take(resting.pop())
+                if not resting:
+                    del self.resting[(other, price)]
+            self.trades += 1
+        if fills and not self.continuous:
+            self.clear_resting(lambda key: True)    # the standing book starts over
+        taken = outcome == 'contract'
+        resting = outcome == 'standing'
+        entry = [self.trades, side, amount, taken, resting]
+        self.entries.append(entry)
+        insort((self.taken if taken else self.untaken)[side], amount)
+        insort(self.prices, amount)
+        if resting:
+            if not self.continuous:
+                self.clear_resting(lambda key: key[0] == side)     # replaces the standing shout
+            self.resting.setdefault((side, amount), []).append(entry)
+        self.forget()
+
+    def take(self, entry):
+        prices = self.untaken[entry[1]]
+        del prices[bisect_left(prices, entry[2])]
+        insort(self.taken[entry[1]], entry[2])
+        entry[3] = True
+        entry[4] = False
+
+    def clear_resting(self, matches):
+        """
+        Marks the resting shouts whose (side, price) matches as no longer resting.
+        """
+        for key in [key for key in self.resting if matches(key)]:
+            for entry in self.resting.pop(key):
+                entry[4] = False
+
+    def forget(self):
+        """
+        Drops the shouts older than the last memory contracts.
+        """
+        oldest = self.trades - self.memory
+        entries = self.entries
+        while entries and entries[0][0] <= oldest:
+            entry = entries.popleft()
+            _, side, price, taken, resting = entry
+            prices = (self.taken if taken else self.untaken)[side]
+            del prices[bisect_left(prices, price)]
+            del self.prices[bisect_left(self.prices, price)]
+            if resting:
+                shouts = self.resting[(side, price)]
+                del shouts[next(k for k, shout in enumerate(shouts) if shout is entry)]
+                if not shouts:
+                    del self.resting[(side, price)]
+
+    def bid_belief(self, price):
+        """
+        Returns the belief that a bid of price is accepted.
+        """
+        return self.interpolate(self.bid_count, price, 0.0, 1.0)
+
+    def ask_belief(self, price):
+        """
+        Returns the belief that an ask of price is accepted.
+        """
+        return self.interpolate(self.ask_count, price, 1.0, 0.0)
+
+    def interpolate(self, belief, price, low, high):
+        """
+        Interpolates belief (counted at shouted prices) at price between
+        the nearest prices shouted, or the beliefs low at 0 and high at
+        max_price beyond them.
+        """
+        prices = self.prices
+        k = bisect_right(prices, price)
+        if k and prices[k - 1] == price:
+            return belief(price)
+        below, at_below = (prices[k - 1], belief(prices[k - 1])) if k else (0, low)
+        above, at_above = (prices[k], belief(prices[k])) if k < len(prices) else (self.max_price, high)
+        if above <= below:
+            return at_below
+        return at_below + (at_above - at_below) * (price - below) / (above - below)
+
+    def bid_count(self, price):
+        """
+        Taken bids and all asks at or below price, over those plus
+        untaken bids at or above price.
+        """
+        taken_bids, taken_asks = self.taken
+        untaken_bids, untaken_asks = self.untaken
+        accepted = (bisect_right(taken_bids, price) + bisect_right(taken_asks, price)
+                    + bisect_right(untaken_asks, price))
+        rejected = len(untaken_bids) - bisect_left(untaken_bids, price)
+        total = accepted + rejected
+        return accepted / total if total else 0.0
+
+    def ask_count(self, price):
+        """
+        Taken asks and all bids at or above price, over those plus
+        untaken asks at or below price.
+        """
+        taken_bids, taken_asks = self.taken
+        untaken_bids, untaken_asks = self.untaken
+        accepted = (len(taken_asks) - bisect_left(taken_asks, price)
+                    + len(taken_bids) - bisect_left(taken_bids, price)
+                    + len(untaken_bids) - bisect_left(untaken_bids, price))
+        rejected = bisect_right(untaken_asks, price)
+        total = accepted + rejected
+        return accepted / total if total else 0.0
+
+    def snapshot(self):
+        return copy.deepcopy(self.__dict__)
+
+    def restore(self, state):
+        self.__dict__.update(copy.deepcopy(state))
+
+def shared(da, memory = 5):
+    """
+    Returns the ShoutHistory observing da with this memory, adding one
+    if there is none, so traders of a market share one index.
+    """
+    for observer in da.observers:
+        if isinstance(observer, ShoutHistory) and observer.memory == memory:
+            return observer
+    history = ShoutHistory(memory, da.starting['ask'], da.book.continuous)
+    da.observers.append(history)
+    return history
@@ -8,6 +8,112 @@ import random as rnd
 import Simulator.Buyer.buyer as buyer
 import Simulator.Seller.seller as seller
 
+# trader_type in the config files -> strategy class
+buyer_types = {'Zero Intelligence': buyer.ZI_Buyer,
+               'Kaplan': buyer.Kaplan_Buyer,
+               'Ringuette': buyer.Ringuette_Buyer,
+               'Persistent Shout': buyer.PS_Buyer,
+               'Skeleton': buyer.Skeleton_Buyer,
+               'Gjerstad Dickhaut': buyer.GD_Buyer}
+seller_types = {'Zero Intelligence': seller.ZI_Seller,
+                'Kaplan': seller.Kaplan_Seller,
+                'Ringuette': seller.Ringuette_Seller,
+                'Persistent Shout': seller.PS_Seller,
+                'Skeleton': seller.Skeleton_Seller,
+                'Gjerstad Dickhaut': seller.GD_Seller}
+
+def apportion(shares, total):
+    """
+    Rounds shares to integer counts summing to total (largest remainder).
+    """
+    shares = np.asarray(shares, dtype=float)
+    exact = total * shares / shares.sum()
+    counts = np.floor(exact).astype(int)
+    remainders = exact - counts
+    for k in np.argsort(-remainders, kind="stable")[:total - counts.sum()]:
+        counts[k] += 1
+    return counts
+
+def trader_tokens(trader):
+    """
+    Returns a buyer's reservation values or a seller's unit costs.
+    """
+    if trader.type == "B":
+        return trader.values.reservation_values
+    return trader.costs.unit_costs
+
+class Curve:
+    """
+    A demand (descending) or supply (ascending) curve kept as sorted arrays:
+        values, the token values
+        ids, the name of the trader holding each token
+        items, the curve as a list of (name, value)
+    Equal values are ordered by trader, then by token, as a stable sort of
+    the traders' tokens would order them.  Tokens are found by binary
+    search on (value, seat), so a trader's tokens can be replaced without
+    sorting the curve again.  The search is O(log n) but the update is not:
+    replace shifts the arrays and items, O(n) in the number of tokens, which
+    is no more than calc_equilibrium spends reading the curve.
+    """
+    UNIT_BITS = 20      # seat = trader index << UNIT_BITS | token index
+
+    def __init__(self, traders, descending = False):
+        self.sign = -1 if descending else 1
+        self.trader_index = {}
+        names = []
+        values = []
+        seats = []
+        for k, trader in enumerate(traders):
+            self.trader_index[id(trader)] = k
+            tokens = trader_tokens(trader)
+            names.extend([trader.name] * len(tokens))
+            values.extend(tokens)
+            seats.extend((k << self.UNIT_BITS) + unit for unit in range(len(tokens)))
+        values = np.array(values, dtype=np.int64)
+        order = np.argsort(self.sign * values, kind="stable")
+        self.values = values[order]
+        self.keys = self.sign * self.values
+        self.seats = np.array(seats, dtype=np.int64)[order]
+        self.ids = np.array(names, dtype=object)[order]
+        self.items = list(zip(self.ids.tolist(), self.values.tolist()))
+
+    def locate(self, value, seat):
+        """
+        Returns the position of (value, seat) on the curve.
+        """
+        key = self.sign * value
+        low = np.searchsorted(self.keys, key, side='left')
+        high = np.searchsorted(self.keys, key, side='right')
+        return int(low + np.searchsorted(self.seats[low:high], seat))
+
+    def replace(self, trader, old_tokens):
+        """
+        Moves trader's tokens from old_tokens to their current values.
+        Finding them is a binary search; moving them is O(n) (np.delete,
+        np.insert and list shifts), far cheaper than a re-sort but linear.
+        """
+        k = self.trader_index[id(trader)]
+        old = [self.locate(value, (k << self.UNIT_BITS) + unit) for unit, value in enumerate(old_tokens)]
+        for unit, pos in enumerate(old):
+            assert self.seats[pos] == (k << self.UNIT_BITS) + unit, \
+                f"token {unit} of {trader.name} is not on the curve"
+        self.values = np.delete(self.values, old)
+        self.keys = np.delete(self.keys, old)
+        self.seats = np.delete(self.seats, old)
+        self.ids = np.delete(self.ids, old)
+        for pos in sorted(old, reverse=True):
+            del self.items[pos]
+
+        tokens = trader_tokens(trader)
+        seats = [(k << self.UNIT_BITS) + unit for unit in range(len(tokens))]
+        new = [self.locate(value, seat) for value, seat in zip(tokens, seats)]
+        self.values = np.insert(self.values, new, tokens)
+        self.keys = np.insert(self.keys, new, [self.sign * value for value in tokens])
+        self.seats = np.insert(self.seats, new, seats)
+        self.ids = np.insert(self.ids, new, [trader.name] * len(tokens))
+        for shift, (pos, value) in enumerate(zip(new, tokens)):
+            self.items.insert(pos + shift, (trader.name, value))
+
 @dataclass
 class MarketEnvironment:
     name: str
@@ -15,6 +121,8 @@ class MarketEnvironment:
     sellers = []
     demand = []
     supply = []
+    demand_curve = None     # Curve, built by make_demand until tokens change
+    supply_curve = None
 
     def add_buyer(self, buyer):
         """
@@ -23,6 +131,7 @@ class MarketEnvironment:
             buyer, the buyer to be appended
         """
         self.buyers.append(buyer)
+        self.demand_curve = None
 
     def add_seller(self, seller):
         """
@@ -31,6 +140,7 @@ class MarketEnvironment:
             seller, the seller to be appended
         """
         self.sellers.append(seller)
+        self.supply_curve = None
 
     def reset(self, name):
         """
@@ -40,8 +150,37 @@ class MarketEnvironment:
         self.sellers = []
         self.demand = []
         self.supply = []
+        self.demand_curve = None
+        self.supply_curve = None
         self.name = name
 
+    def invalidate_curves(self):
+        """
+        Drops the cached demand and supply curves.  Call after changing
+        tokens directly rather than through redraw_tokens.
+        """
+        self.demand_curve = None
+        self.supply_curve = None
+
+    def redraw_tokens(self, trader, units = 3, low = 10, high = 200):
+        """
+        Draws new tokens for one registered trader and moves them on the
+        cached curves, without rebuilding the curves.
+        args:
+            trader, a buyer or seller of this market.
+            units, number of tokens to draw.
+            low, high, range of the Uniform draws.
+        """
+        old_tokens = list(trader_tokens(trader))
+        if trader.type == "B":
+            trader.values.build_reservation_values(units, low, high)
+            curve = self.demand_curve
+        else:
+            trader.costs.build_unit_costs(units, low, high)
+            curve = self.supply_curve
+        if curve is not None:
+            curve.replace(trader, old_tokens)
+
     def build_buyer(self, name, trader_type, units = 3, low = 10, high = 200):
         """
         Returns a sorted list of reservation values between low and high from a Uniform distribution.
@@ -52,16 +191,7 @@ class MarketEnvironment:
             low_v, lowest possible valuation.
             high_v, highest possible valuation
         """
-        if trader_type == 'Zero Intelligence':
-            new_buyer = buyer.ZI_Buyer(name, [0])
-        elif trader_type == 'Kaplan':
-            new_buyer = buyer.Kaplan_Buyer(name, [0])
-        elif trader_type == 'Ringuette':
-            new_buyer = buyer.Ringuette_Buyer(name, [0])
-        elif trader_type == "Persistent Shout":
-            new_buyer = buyer.PS_Buyer(name, [0])
-        elif trader_type == "Skeleton":
-            new_buyer = buyer.Skeleton_Buyer(name, [0])
+        new_buyer = buyer_types[trader_type](name, [0])
         new_buyer.reservation_values = \
             new_buyer.values.build_reservation_values(units, low, high)
         self.add_buyer(new_buyer)
@@ -76,42 +206,62 @@ class MarketEnvironment:
             low_c, lowest possible cost.
             high_c, highest possible cost
         """
-        if trader_type == 'Zero Intelligence':
-            new_seller = seller.ZI_Seller(name, [0])
-        elif trader_type == 'Kaplan':
-            new_seller = seller.Kaplan_Seller(name, [0])
-        elif trader_type == 'Ringuette':
-            new_seller = seller.Ringuette_Seller(name, [0])
-        elif trader_type == "Persistent Shout":
-            new_seller = seller.PS_Seller(name, [0])
-        elif trader_type == "Skeleton":
-            new_seller = seller.Skeleton_Seller(name, [0])
+        new_seller = seller_types[trader_type](name, [0])
         new_seller.unit_costs = new_seller.costs.build_unit_costs(units, low, high)
         self.add_seller(new_seller)
             
+    def build_population(self, prefix, count, mix, units = 3, low = 10, high = 200):
+        """
+        Builds count buyers (prefix 'B') or sellers (prefix 'S') at once.
+        All tokens are drawn in one array, so large markets are built in
+        time linear in count.  The array is kept in self.buyer_tokens or
+        self.seller_tokens, one row per trader.
+        args:
+            prefix, 'B' or 'S'; traders are named B1, B2, ... or S1, S2, ...
+            count, number of traders.
+            mix, {trader_type: share} of the population.
+            units, number of tokens per trader.
+            low, high, range of the Uniform token draws.
+        """
+        self.invalidate_curves()
+        rng = np.random.default_rng(rnd.getrandbits(64))
+        tokens = rng.integers(low, high + 1, size=(count, units))
+        tokens.sort(axis=1)
+        types = np.repeat(list(mix), apportion(list(mix.values()), count))
+        types = rng.permutation(types)
+        if prefix == 'B':
+            tokens = tokens[:, ::-1]
+            self.buyer_tokens = tokens
+            for k, (trader_type, row) in enumerate(zip(types.tolist(), tokens.tolist())):
+                new_buyer = buyer_types[trader_type](f"B{k + 1}", [0])
+                new_buyer.values.reservation_values = row
+                self.buyers.append(new_buyer)
+        else:
+            self.seller_tokens = tokens
+            for k, (trader_type, row) in enumerate(zip(types.tolist(), tokens.tolist())):
+                new_seller = seller_types[trader_type](f"S{k + 1}", [0])
+                new_seller.costs.unit_costs = row
+                self.sellers.append(new_seller)
+
     def make_demand(self):
         """
         Creates a demand curve for simulation.
+        The curve is kept in self.demand_curve and only rebuilt after the 
+        buyers change; self.demand is the curve as a list of (name, value).
         """
-        temp_demand = []
-        for buyer in self.buyers:
-            name = buyer.name
-            values = buyer.values.reservation_values
-            buyer_demand = [(name, value) for value in values]
-            temp_demand.extend(buyer_demand)
-        self.demand = sorted(temp_demand, key=itemgetter(1), reverse=True)
+        if self.demand_curve is None:
+            self.demand_curve = Curve(self.buyers, descending=True)
+        self.demand = self.demand_curve.items
 
     def make_supply(self):
         """
         Creates a supply curve for simulation.
+        The curve is kept in self.supply_curve and only rebuilt after the 
+        sellers change; self.supply is the curve as a list of (name, cost).
         """
-        temp_supply = []
-        for seller in self.sellers:
-            name = seller.name
-            costs = seller.costs.unit_costs
-            seller_supply = [(name, cost) for cost in costs]
-            temp_supply.extend(seller_supply)
-        self.supply = sorted(temp_supply, key=itemgetter(1))
+        if self.supply_curve is None:
+            self.supply_curve = Curve(self.sellers)
+        self.supply = self.supply_curve.items
     
     def show_participants(self):
         """
@@ -135,8 +285,9 @@ class MarketEnvironment:
         Neatly prints the supply and demand curves for the simulation.
         """
 
-        dem = self.demand
-        sup = self.supply
+        # pad copies, the curves themselves are cached
+        dem = list(self.demand)
+        sup = list(self.supply)
         k = len(dem) - len(sup)
         if k > 0:
             for index in range(0, k):
@@ -157,7 +308,7 @@ class MarketEnvironment:
                 first_crossing = False
             print(f"  {k:^2} {small_tab} {s_unit[0]:^3}    {s_unit[1]:^3} |", end = "")
             print(f"  {d_unit[1]:^3}      {d_unit[0]:^3}")
-        k += 1
+            k += 1
         print()
 
     def plot_supply_demand(self):
@@ -222,29 +373,20 @@ class MarketEnvironment:
         """
         Finds competitive equilibirum price (low and high), equilibrium units, and maximum surplus
         """
+        demand = self.demand_curve.values
+        supply = self.supply_curve.values
+        n = min(len(demand), len(supply))
+        rejected = np.flatnonzero(demand[:n] < supply[:n])
+        self.eq_units = int(rejected[0]) if len(rejected) else n
+        k = self.eq_units
+        self.max_surplus = (demand[:k] - supply[:k]).sum().item()
 
-        self.max_surplus = 0
-        self.eq_units = 0
-        last_accepted_value = 0
-        last_accepted_cost = 0
-        first_rejected_value = 0
-        first_rejected_cost = 999999999  # big number > max cost ever
-
-        for buy_unit, sell_unit in zip(self.demand, self.supply):
-            buyid, value = buy_unit
-            sellid, cost = sell_unit
-            if value >= cost:
-                self.eq_units += 1
-                self.max_surplus += value - cost
-                last_accepted_value = value
-                last_accepted_cost = cost
-            else:
-                first_rejected_value = value
-                first_rejected_cost = cost
-                break
-        
         #  Now caluclate equilibrium price range
         if self.eq_units >= 1:
+            last_accepted_value = demand[k - 1].item()
+            last_accepted_cost = supply[k - 1].item()
+            first_rejected_value = demand[k].item() if k < n else 0
+            first_rejected_cost = supply[k].item() if k < n else 999999999  # big number > max cost ever
             self.eq_price_high = min(last_accepted_value, first_rejected_cost)
             self.eq_price_low = max(last_accepted_cost, first_rejected_value)
         else:
@@ -266,6 +408,15 @@ class MarketEnvironment:
         print(f"maximum surplus      = {self.max_surplus}")
         print()
 
+    def set_equilibrium(self, eq_units, eq_price_low, eq_price_high, max_surplus):
+        """
+        Sets an equilibrium computed elsewhere, e.g. by a token_bank.TokenBank.
+        """
+        self.eq_units = eq_units
+        self.eq_price_low = eq_price_low
+        self.eq_price_high = eq_price_high
+        self.max_surplus = max_surplus
+
     def get_equilibrium(self):
         try:
             return self.eq_units, self.eq_price_low, self.eq_price_high, self.max_surplus
@@ -0,0 +1,335 @@
+import copy
+import hashlib
+import itertools
+import json
+import os
+import random as rnd
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import scipy.stats
+import toml
+
+import market_simulator_v2 as msim
+
+AXES = ('strategy_mix', 'num_units', 'value_range', 'cost_range', 'sim_period', 'num_traders',
+        'num_buyers', 'num_sellers')
+
+def expand_grid(axes):
+    """
+    Returns the full factorial design over axes.
+    args:
+        axes, {axis: [level, ...]}
+    returns:
+        cells, list of {axis: level}
+    """
+    names = list(axes)
+    return [dict(zip(names, levels)) for levels in itertools.product(*(axes[name] for name in names))]
+
+def expand_lhs(axes, samples, seed = 0):
+    """
+    Returns a Latin-hypercube design over axes: each axis' levels are
+    covered in equal shares across samples, in a random pairing.
+    args:
+        axes, {axis: [level, ...]}
+        samples, number of cells.
+        seed, seed of the design.
+    returns:
+        cells, list of {axis: level}
+    """
+    names = list(axes)
+    points = scipy.stats.qmc.LatinHypercube(d=len(names), seed=seed).random(samples)
+    cells = []
+    for point in points:
+        cell = {}
+        for name, u in zip(names, point):
+            levels = axes[name]
+            cell[name] = levels[min(int(u * len(levels)), len(levels) - 1)]
+        cells.append(cell)
+    return cells
+
+def cell_key(cell, context = None):
+    """
+    Returns a stable key for a cell, the same for equal cells in any run.
+    args:
+        cell, {axis: level}
+        context, anything else the results depend on (the base
+                 configuration, sim_period, seed origin); a change in it
+                 gives a new key, so stored rows are never reused for it.
+    """
+    key = cell if context is None else {'cell': cell, 'context': context}
+    text = json.dumps(key, sort_keys=True, default=list)
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+def make_config(base, cell):
+    """
+    Applies a cell to a base configuration dictionary.
+    args:
+        base, configuration dictionary laid out as in the TOML files.
+        cell, {axis: level} for the axes in AXES:
+            strategy_mix, a trader_type for everyone, or
+                          {'buyers': [...], 'sellers': [...]} cycled over the seats.
+            num_units, units for every trader.
+            value_range, (min_value, max_value) for buyers.
+            cost_range, (min_value, max_value) for sellers.
+            sim_period, rounds per period (used by the runner, not the config).
+            num_traders, number of buyers and of sellers; new seats copy
+                         the last seat of the base configuration.
+            num_buyers, num_sellers, the same for one side only.
+        A population-form base ([buyers] / [sellers]) takes the same axes:
+        the counts set each side's count, and a strategy_mix list becomes
+        the population mix, in proportion to how often each type appears.
+    returns:
+        config, a new configuration dictionary
+    """
+    config = copy.deepcopy(base)
+    if 'buyers' in config:
+        return make_population_config(config, cell)
+    for prefix, count_key in (('B', 'num_buyers'), ('S', 'num_sellers')):
+        count = cell.get(count_key, cell.get('num_traders', config[count_key]))
+        template = config[f"{prefix}{config[count_key]}"]
+        for k in range(config[count_key] + 1, count + 1):
+            seat = dict(template)
+            seat['name'] = f"{prefix}{k}"
+            config[f"{prefix}{k}"] = seat
+        config[count_key] = count
+
+        mix = cell.get('strategy_mix')
+        if isinstance(mix, dict):
+            mix = mix['buyers' if prefix == 'B' else 'sellers']
+        elif mix is not None:
+            mix = [mix]
+        trader_range = cell.get('value_range' if prefix == 'B' else 'cost_range')
+        for k in range(count):
+            seat = config[f"{prefix}{k + 1}"]
+            if mix is not None:
+                seat['trader_type'] = mix[k % len(mix)]
+            if 'num_units' in cell:
+                seat['num_units'] = cell['num_units']
+            if trader_range is not None:
+                seat['min_value'], seat['max_value'] = trader_range
+    return config
+
+def make_population_config(config, cell):
+    """
+    Applies a cell to a copy of a population-form configuration (see make_config).
+    """
+    for prefix, side, count_key in (('B', 'buyers', 'num_buyers'), ('S', 'sellers', 'num_sellers')):
+        population = config[side]
+        population['count'] = cell.get(count_key, cell.get('num_traders', population['count']))
+        mix = cell.get('strategy_mix')
+        if isinstance(mix, dict):
+            mix = mix[side]
+        elif mix is not None:
+            mix = [mix]
+        if mix is not None:
+            population['mix'] = {trader_type: mix.count(trader_type) / len(mix) for trader_type in dict.fromkeys(mix)}
+        if 'num_units' in cell:
+            population['num_units'] = cell['num_units']
+        trader_range = cell.get('value_range' if prefix == 'B' else 'cost_range')
+        if trader_range is not None:
+            population['min_value'], population['max_value'] = trader_range
+    return config
+
+def run_period(config, sim_period, seed):
+    """
+    Runs one seeded period of a configuration.  Runs in a worker process.
+    returns:
+        results of MarketSim.sim_period_silent
+    """
+    rnd.seed(seed)
+    sim = msim.MarketSim("sweep", f"Market {seed}")
+    sim.load_config_dict(config)
+    sim.calc_market()
+    return sim.sim_period_silent(sim_period)
+
+def run_periods(tasks):
+    """
+    Runs a list of (config, sim_period, seed) tasks in one worker call.
+    """
+    return [run_period(config, sim_period, seed) for config, sim_period, seed in tasks]
+
+class ResultStore:
+    """
+    SQLite store for sweep results, one row per (cell_key, seed).
+    A row that is already stored is never recomputed.
+    Evolutionary runs store one row per (generation, side, strategy).
+    """
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.db = sqlite3.connect(file_path)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS cells (
+                cell_key TEXT PRIMARY KEY, cell TEXT);
+            CREATE TABLE IF NOT EXISTS periods (
+                cell_key TEXT, seed INTEGER,
+                actual_surplus REAL, efficiency REAL, eq_units INTEGER,
+                eq_price_low REAL, eq_price_high REAL, trader_surplus TEXT,
+                PRIMARY KEY (cell_key, seed));
+            CREATE TABLE IF NOT EXISTS generations (
+                run_key TEXT, generation INTEGER, side TEXT, strategy TEXT,
+                count INTEGER, fitness REAL,
+                PRIMARY KEY (run_key, generation, side, strategy));
+        """)
+
+    def close(self):
+        self.db.close()
+
+    def add_cell(self, key, cell):
+        self.db.execute("INSERT OR IGNORE INTO cells VALUES (?, ?)",
+                        (key, json.dumps(cell, sort_keys=True, default=list)))
+
+    def done(self, key):
+        """
+        Returns the set of seeds already stored for cell key.
+        """
+        rows = self.db.execute("SELECT seed FROM periods WHERE cell_key = ?", (key,))
+        return {seed for (seed,) in rows}
+
+    def add_period(self, key, seed, result):
+        actual_surplus, efficiency, eq_units, eq_price_low, eq_price_high, trader_surplus = result
+        self.db.execute("INSERT OR IGNORE INTO periods VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (key, seed, actual_surplus, efficiency, eq_units,
+                         eq_price_low, eq_price_high, json.dumps(trader_surplus)))
+
+    def add_generation(self, run_key, generation, side, strategy, count, fitness):
+        """
+        Stores the count and fitness of one strategy in one generation of
+        an evolutionary run.
+        """
+        self.db.execute("INSERT OR REPLACE INTO generations VALUES (?, ?, ?, ?, ?, ?)",
+                        (run_key, generation, side, strategy, count, fitness))
+
+    def generations(self, run_key):
+        """
+        Returns [(generation, side, strategy, count, fitness), ...] of an evolutionary run.
+        """
+        return self.db.execute(
+            "SELECT generation, side, strategy, count, fitness FROM generations "
+            "WHERE run_key = ? ORDER BY generation, side, strategy", (run_key,)).fetchall()
+
+    def commit(self):
+        self.db.commit()
+
+    def cells(self):
+        """
+        Returns {cell_key: cell}
+        """
+        return {key: json.loads(cell) for key, cell in self.db.execute("SELECT * FROM cells")}
+
+    def periods(self, key):
+        """
+        Returns the stored periods of cell key as
+        (seeds, efficiency, actual_surplus, trader_surplus list) ordered by seed.
+        """
+        rows = self.db.execute(
+            "SELECT seed, efficiency, actual_surplus, trader_surplus FROM periods "
+            "WHERE cell_key = ? ORDER BY seed", (key,)).fetchall()
+        seeds = np.array([row[0] for row in rows], dtype=np.int64)
+        efficiency = np.array([row[1] for row in rows], dtype=float)
+        actual_surplus = np.array([row[2] for row in rows], dtype=float)
+        trader_surplus = [json.loads(row[3]) for row in rows]
+        return seeds, efficiency, actual_surplus, trader_surplus
+
+class Sweep:
+    """
+    Runs a parameter sweep over variants of a base configuration.
+    args:
+        base_path, path to the base TOML file.
+        axes, {axis: [level, ...]} over the axes in AXES (see make_config).
+        rounds, number of seeded periods per cell.
+        sim_period, rounds per period unless the cell sets sim_period.
+        store_path, SQLite file the results are written to.
+        design, 'grid' for the full factorial or 'lhs' for a Latin hypercube.
+        samples, number of cells of an 'lhs' design.
+        seed, seed of the first period; period r of every cell uses seed + r.
+        workers, number of worker processes (default: all cores).
+        chunk_size, periods sent to a worker at a time.
+    """
+    def __init__(self, base_path, axes, rounds, sim_period, store_path,
+                 design = "grid", samples = 20, seed = 0, workers = None, chunk_size = 50):
+        unknown = set(axes) - set(AXES)
+        assert not unknown, f"unknown sweep axes {sorted(unknown)}"
+        self.base = toml.load(base_path)
+        self.axes = axes
+        self.rounds = rounds
+        self.sim_period = sim_period
+        self.store_path = store_path
+        self.design = design
+        self.samples = samples
+        self.seed = seed
+        self.workers = workers or os.cpu_count()
+        self.chunk_size = chunk_size
+
+    def cells(self):
+        """
+        Returns {cell_key: cell} for the design, with duplicate cells merged.
+        Keys also cover the base configuration, the cell's sim_period and
+        the seed origin.
+        """
+        if self.design == "grid":
+            cells = expand_grid(self.axes)
+        elif self.design == "lhs":
+            cells = expand_lhs(self.axes, self.samples, self.seed)
+        else:
+            raise ValueError(f"unknown design {self.design}")
+        return {cell_key(cell, {'base': self.base, 'sim_period': cell.get('sim_period', self.sim_period),
+                                'seed': self.seed}): cell for cell in cells}
+
+    def run(self):
+        """
+        Runs every period of every cell that is not already in the store,
+        on one shared pool of worker processes.
+        returns:
+            store, the ResultStore holding all results
+        """
+        store = ResultStore(self.store_path)
+        tasks = []
+        for key, cell in self.cells().items():
+            store.add_cell(key, cell)
+            config = make_config(self.base, cell)
+            sim_period = cell.get('sim_period', self.sim_period)
+            done = store.done(key)
+            for r in range(self.rounds):
+                seed = self.seed + r
+                if seed not in done:
+                    tasks.append((key, config, sim_period, seed))
+        store.commit()
+
+        chunks = [tasks[i:i + self.chunk_size] for i in range(0, len(tasks), self.chunk_size)]
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            jobs = [[(config, sim_period, seed) for _, config, sim_period, seed in chunk] for chunk in chunks]
+            for chunk, results in zip(chunks, pool.map(run_periods, jobs)):
+                for (key, _, _, seed), result in zip(chunk, results):
+                    store.add_period(key, seed, result)
+                store.commit()
+        return store
+
+    def summary(self, store = None):
+        """
+        Neatly prints mean and standard deviation of efficiency for each cell.
+        returns:
+            {cell_key: (cell, periods, mean efficiency, std efficiency)}
+        """
+        store = store or ResultStore(self.store_path)
+        summary = {}
+        for key, cell in self.cells().items():
+            _, efficiency, _, _ = store.periods(key)
+            if len(efficiency) == 0:
+                continue
+            summary[key] = (cell, len(efficiency), efficiency.mean(), efficiency.std())
+            print(f"{key}  n={len(efficiency):<5} efficiency {efficiency.mean():6.2f} "
+                  f"+/- {efficiency.std():5.2f}  {json.dumps(cell, default=list)}")
+        return summary
+
+if __name__ == "__main__":
+    sweep = Sweep("config files/config_test_ZI.toml",
+                  {'strategy_mix': ["Zero Intelligence", "Kaplan",
+                                    {'buyers': ["Zero Intelligence", "Kaplan"],
+                                     'sellers': ["Zero Intelligence", "Kaplan"]}],
+                   'num_units': [1, 3, 5],
+                   'num_traders': [5, 10]},
+                  rounds=100, sim_period=100, store_path="sweep_results.sqlite")
+    store = sweep.run()
+    sweep.summary(store)
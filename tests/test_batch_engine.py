@@ -0,0 +1,10 @@
+import toml
+
+import batch_engine
+
+def test_trading_past_last_token_keeps_units_on_padding():
+    config = toml.load("config files/config_test_HorseRace.toml")
+    markets = batch_engine.BatchMarkets(config, 2000, 100)
+    markets.run()
+    assert markets.seller_unit.max() <= markets.costs.shape[2] - 2
+    assert markets.buyer_unit.max() <= markets.values.shape[2] - 2
@@ -0,0 +1,17 @@
+import shutil
+
+import evolution
+
+def make(file_path, store_path):
+    return evolution.EvolutionaryTournament(file_path, {"Kaplan": 2}, {"Zero Intelligence": 2},
+                                            1, 2, 10, store_path)
+
+def test_run_key_follows_base_config(tmp_path):
+    file_path = tmp_path / "base.toml"
+    shutil.copy("config files/config_test_ZI.toml", file_path)
+    store_path = tmp_path / "store.db"
+    first = make(file_path, store_path).run_key
+    assert make(file_path, store_path).run_key == first
+    with open(file_path, "a") as file:
+        file.write("\n[extra]\nnote = 1\n")
+    assert make(file_path, store_path).run_key != first
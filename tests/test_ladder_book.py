@@ -0,0 +1,19 @@
+import random as rnd
+
+import benchmarks
+
+def test_cached_top_follows_depth_book():
+    r = rnd.Random(0)
+    depth = benchmarks.build_auction(20, "depth")
+    ladder = benchmarks.build_auction(20, "ladder")
+    names = [p.name for p in depth.participants]
+    for _ in range(3000):
+        name = r.choice(names)
+        order = (name, 'bid' if name.startswith('B') else 'ask', r.randint(0, 999), r.randint(1, 3))
+        assert depth.order(order) == ladder.order(order)
+        if r.random() < 0.05 and depth.book.orders:
+            seq = r.choice(list(depth.book.orders))
+            assert depth.cancel(seq) == ladder.cancel(seq)
+        for type in ('bid', 'ask'):
+            assert depth.book.best(type) == ladder.book.best(type)
+    assert depth.contracts == ladder.contracts
@@ -0,0 +1,26 @@
+import numpy as np
+import toml
+
+import order_trace
+
+CONFIG = toml.load("config files/config_test_ZI.toml")
+
+def test_loaded_trace_saves_again(tmp_path):
+    _, trace = order_trace.record_period(CONFIG, 100, 0)
+    trace.save(tmp_path / "first.npz")
+    loaded = order_trace.Trace.load(tmp_path / "first.npz")
+    loaded.save(tmp_path / "second.npz")
+    again = order_trace.Trace.load(tmp_path / "second.npz")
+    assert again.names == trace.names
+    assert again.types == trace.types
+    assert list(again.arrivals) == list(trace.arrivals)
+    assert np.array_equal(again.orders, trace.orders)
+
+def test_ladder_tick_survives_save_and_replay(tmp_path):
+    _, trace = order_trace.record_period(CONFIG, 100, 0, "ladder")
+    trace.tick = 5
+    trace.save(tmp_path / "ladder.npz")
+    loaded = order_trace.Trace.load(tmp_path / "ladder.npz")
+    assert loaded.tick == 5
+    da = order_trace.replay_auction(loaded)
+    assert da.book.tick == 5
@@ -0,0 +1,34 @@
+import pytest
+import toml
+
+import sweep
+import tournament
+
+LARGE = "config files/config_test_Large.toml"
+
+def test_make_config_sets_population_axes():
+    base = toml.load(LARGE)
+    config = sweep.make_config(base, {'num_traders': 30, 'num_units': 2, 'value_range': (250, 350),
+                                      'strategy_mix': {'buyers': ["Kaplan", "Kaplan", "Zero Intelligence", "Kaplan"],
+                                                       'sellers': ["Skeleton"]}})
+    assert config['buyers']['count'] == config['sellers']['count'] == 30
+    assert config['buyers']['mix'] == {"Kaplan": 0.75, "Zero Intelligence": 0.25}
+    assert config['sellers']['mix'] == {"Skeleton": 1.0}
+    assert config['buyers']['num_units'] == config['sellers']['num_units'] == 2
+    assert (config['buyers']['min_value'], config['buyers']['max_value']) == (250, 350)
+    assert config['sellers']['max_value'] == base['sellers']['max_value']
+    assert base['buyers']['count'] == 2000
+    result = sweep.run_period(config, 20, 0)
+    assert len(result[5]) == 60
+
+def test_tournament_names_population_seats_and_rejects_strategies():
+    race = tournament.Tournament("test", 3, 20, LARGE)
+    race.config = sweep.make_config(toml.load(LARGE), {'num_buyers': 4, 'num_sellers': 3})
+    assert race.trader_names() == ["B1", "B2", "B3", "B4", "S1", "S2", "S3"]
+    with pytest.raises(ValueError, match="population-form"):
+        race.strategies()
+    results = race.run_tournament()
+    widths = race.half_widths(results)
+    assert widths['strategy_means'] == {}
+    with pytest.raises(ValueError, match="population-form"):
+        race.run_tournament_adaptive({'ranking': 1.0})
@@ -0,0 +1,27 @@
+import shout_history
+
+def test_forget_keeps_later_resting_shout_at_same_price():
+    history = shout_history.ShoutHistory(memory=2)
+    history.order('bid', 100, 'standing', [])
+    history.order('bid', 100, 'rejected', [])
+    history.order('ask', 100, 'contract', [100])
+    history.order('bid', 100, 'standing', [])
+    history.order('ask', 150, 'standing', [])
+    history.order('bid', 150, 'contract', [150])
+    assert history.trades == 2
+    assert all(entry[4] is False or entry in history.resting[(entry[1], entry[2])]
+               for entry in history.entries)
+
+def test_standing_book_contract_clears_resting_shouts():
+    history = shout_history.ShoutHistory(memory=10)
+    history.order('bid', 120, 'standing', [])
+    history.order('ask', 90, 'contract', [120])      # takes the standing bid, book resets
+    history.order('bid', 100, 'standing', [])
+    history.order('ask', 140, 'standing', [])
+    history.order('bid', 110, 'standing', [])       # replaces the standing bid of 100
+    assert history.resting == {(shout_history.BID, 110): [history.entries[-1]],
+                               (shout_history.ASK, 140): [history.entries[-2]]}
+    history.order('ask', 100, 'contract', [110])
+    assert history.taken[shout_history.BID] == [110, 120]
+    assert history.untaken[shout_history.BID] == [100]
+    assert history.resting == {}
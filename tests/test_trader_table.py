@@ -0,0 +1,24 @@
+from types import SimpleNamespace
+
+import pytest
+
+from market_sim_api import TraderTable
+
+def make_table(count):
+    # the rows logic of TraderTable without its Tk widgets
+    return SimpleNamespace(rows={"B": ["Kaplan"] * count, "S": ["Skeleton"] * count},
+                           selected={0, count - 1}, first_row=0, scroll_to=lambda first_row: None)
+
+def test_resize_keeps_remaining_rows():
+    table = make_table(4)
+    TraderTable.resize(table, 2)
+    assert table.rows == {"B": ["Kaplan"] * 2, "S": ["Skeleton"] * 2}
+    assert table.selected == {0}
+    TraderTable.resize(table, 3)
+    assert table.rows["B"] == ["Kaplan", "Kaplan", ""]
+
+def test_resize_rejects_negative_count():
+    table = make_table(4)
+    with pytest.raises(ValueError):
+        TraderTable.resize(table, -1)
+    assert len(table.rows["B"]) == len(table.rows["S"]) == 4
@@ -0,0 +1,193 @@
+import os
+import random as rnd
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import toml
+
+import market_simulator_v2 as msim
+
+BUYER_PAD = -1                          # fills the unused token slots of a buyer
+SELLER_PAD = np.iinfo(np.int32).max     # and of a seller
+NO_COST = 999999999                     # first rejected cost when supply runs out
+
+_banks = {}     # path -> TokenBank opened in this process
+
+def seats(config, prefix):
+    """
+    Returns the seat tables of one side of a configuration, in seat order.
+    """
+    count = config['num_buyers' if prefix == 'B' else 'num_sellers']
+    return [config[f"{prefix}{k + 1}"] for k in range(count)]
+
+def draw_tokens(rng, rounds, side, descending):
+    """
+    Draws every round's tokens for the seats of one side at once.
+    returns:
+        tokens, int32 array (rounds, seats, max units), each seat's tokens
+                sorted (descending for buyers) and padded at the end
+    """
+    units = np.array([seat['num_units'] for seat in side])
+    low = np.array([seat['min_value'] for seat in side])
+    high = np.array([seat['max_value'] for seat in side])
+    shape = (rounds, len(side), units.max())
+    tokens = rng.integers(low[:, None], high[:, None] + 1, size=shape).astype(np.int32)
+    unused = np.arange(units.max())[None, :] >= units[:, None]
+    if descending:
+        tokens[:, unused] = BUYER_PAD
+        return -np.sort(-tokens, axis=2)
+    tokens[:, unused] = SELLER_PAD
+    return np.sort(tokens, axis=2)
+
+def equilibria(values, costs, num_values, num_costs):
+    """
+    Computes the competitive equilibrium of every round at once, with the
+    same results as MarketEnvironment.calc_equilibrium.
+    args:
+        values, costs, token arrays (rounds, seats, units) from draw_tokens.
+        num_values, num_costs, number of real tokens on each side.
+    returns:
+        int64 array (rounds, 4) of eq_units, eq_price_low, eq_price_high,
+        max_surplus; the prices are -1 when there is no equilibrium
+    """
+    rounds = values.shape[0]
+    demand = -np.sort(-values.reshape(rounds, -1).astype(np.int64), axis=1)[:, :num_values]
+    supply = np.sort(costs.reshape(rounds, -1).astype(np.int64), axis=1)[:, :num_costs]
+    n = min(num_values, num_costs)
+    accepted = demand[:, :n] >= supply[:, :n]
+    eq_units = np.where(accepted.all(axis=1), n, accepted.argmin(axis=1))
+    traded = np.arange(n)[None, :] < eq_units[:, None]
+    max_surplus = ((demand[:, :n] - supply[:, :n]) * traded).sum(axis=1)
+
+    rows = np.arange(rounds)
+    last = np.maximum(eq_units - 1, 0)
+    beyond = eq_units >= n
+    first = np.minimum(eq_units, max(n - 1, 0))
+    first_rejected_value = np.where(beyond, 0, demand[rows, first])
+    first_rejected_cost = np.where(beyond, NO_COST, supply[rows, first])
+    eq_price_high = np.minimum(demand[rows, last], first_rejected_cost)
+    eq_price_low = np.maximum(supply[rows, last], first_rejected_value)
+    none = eq_units == 0
+    eq_price_high[none] = -1
+    eq_price_low[none] = -1
+    max_surplus[none] = 0
+    return np.column_stack([eq_units, eq_price_low, eq_price_high, max_surplus])
+
+def create_bank(path, config, rounds, seed = 0):
+    """
+    Draws the tokens of every round of a configuration in one vectorized
+    step, computes each round's equilibrium in the same pass, and saves
+    both as .npy files in directory path to be memory-mapped by TokenBank.
+    args:
+        path, directory of the bank (created if needed).
+        config, per-seat configuration dictionary laid out as in the TOML files.
+        rounds, number of rounds.
+        seed, seed of the draws.
+    returns:
+        the opened TokenBank
+    """
+    os.makedirs(path, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    buyers = seats(config, 'B')
+    sellers = seats(config, 'S')
+    values = draw_tokens(rng, rounds, buyers, descending=True)
+    costs = draw_tokens(rng, rounds, sellers, descending=False)
+    table = equilibria(values, costs,
+                       sum(seat['num_units'] for seat in buyers),
+                       sum(seat['num_units'] for seat in sellers))
+    for name, array in (('values', values), ('costs', costs), ('equilibrium', table)):
+        out = np.lib.format.open_memmap(os.path.join(path, f"{name}.npy"), mode="w+",
+                                        dtype=array.dtype, shape=array.shape)
+        out[:] = array
+        out.flush()
+        del out
+    with open(os.path.join(path, "bank.toml"), "w") as f:
+        toml.dump({'rounds': rounds, 'seed': seed, 'config': config}, f)
+    _banks.pop(os.path.abspath(path), None)
+    return open_bank(path)
+
+def open_bank(path):
+    """
+    Returns the TokenBank at path, opened once per process.
+    """
+    path = os.path.abspath(path)
+    if path not in _banks:
+        _banks[path] = TokenBank(path)
+    return _banks[path]
+
+class TokenBank:
+    """
+    Read-only, memory-mapped bank of pre-drawn tokens and equilibria:
+        values, (rounds, buyers, units) reservation values
+        costs, (rounds, sellers, units) unit costs
+        equilibrium, (rounds, 4) eq_units, eq_price_low, eq_price_high, max_surplus
+    Every process that opens the bank maps the same files, so the pages
+    are shared rather than copied.  A TokenBank pickles as its path, so it
+    can be passed to worker processes without sending any tokens.
+    args:
+        path, directory written by create_bank.
+    """
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        meta = toml.load(os.path.join(self.path, "bank.toml"))
+        self.config = meta['config']
+        self.rounds = meta['rounds']
+        self.seed = meta['seed']
+        self.values = np.load(os.path.join(self.path, "values.npy"), mmap_mode='r')
+        self.costs = np.load(os.path.join(self.path, "costs.npy"), mmap_mode='r')
+        self.equilibrium_table = np.load(os.path.join(self.path, "equilibrium.npy"), mmap_mode='r')
+        self.buyer_units = [seat['num_units'] for seat in seats(self.config, 'B')]
+        self.seller_units = [seat['num_units'] for seat in seats(self.config, 'S')]
+
+    def __reduce__(self):
+        return open_bank, (self.path,)
+
+    def buyer_tokens(self, round, k):
+        return self.values[round, k, :self.buyer_units[k]].tolist()
+
+    def seller_tokens(self, round, k):
+        return self.costs[round, k, :self.seller_units[k]].tolist()
+
+    def equilibrium(self, round):
+        """
+        Returns eq_units, eq_price_low, eq_price_high, max_surplus of round,
+        as MarketEnvironment.get_equilibrium does.
+        """
+        eq_units, eq_price_low, eq_price_high, max_surplus = self.equilibrium_table[round].tolist()
+        if eq_units == 0:
+            return 0, None, None, 0
+        return eq_units, eq_price_low, eq_price_high, max_surplus
+
+def run_period(bank, round, sim_period, seed):
+    """
+    Runs one period on round of bank.  Runs in a worker process.
+    returns:
+        results of MarketSim.sim_period_silent
+    """
+    rnd.seed(seed)
+    sim = msim.MarketSim("token bank", f"Market {round}")
+    sim.load_bank(bank, round)
+    return sim.sim_period_silent(sim_period)
+
+def run_periods(tasks):
+    """
+    Runs a list of (bank, round, sim_period, seed) tasks in one worker call.
+    """
+    return [run_period(*task) for task in tasks]
+
+def run_bank(bank, sim_period, seed = 0, workers = None, chunk_size = 50):
+    """
+    Runs one period on every round of bank on a pool of worker processes.
+    Round r uses strategy seed seed + r.
+    returns:
+        list of results of MarketSim.sim_period_silent, in round order
+    """
+    tasks = [(bank, r, sim_period, seed + r) for r in range(bank.rounds)]
+    chunks = [tasks[i:i + chunk_size] for i in range(0, len(tasks), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        return [result for results in pool.map(run_periods, chunks) for result in results]
+
+if __name__ == "__main__":
+    bank = create_bank("token_bank", toml.load("config files/config_test_ZI.toml"), 10000)
+    results = run_bank(bank, 100)
+    print(f"Mean Efficiency: {np.mean([result[1] for result in results]):.2f}")
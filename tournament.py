@@ -1,10 +1,162 @@
 import scipy.ndimage
 import scipy.stats
 import market_simulator_v2 as msim
+import profiling
+import quote_tape
+import analytics
+import os
+import random as rnd
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 from dataclasses import dataclass
+from multiprocessing import shared_memory
 import scipy
 import numpy as np
 import matplotlib.pyplot as plt
+import toml
+
+SUMMARY = ('actual_surplus', 'efficiency', 'eq_units', 'eq_price_low', 'eq_price_high')
+
+def run_block(config, bank, sim_period, book_type, names, first, last, seed, summary, surplus):
+    """
+    Runs rounds first .. last - 1 of a tournament, round r seeded with
+    seed + r, writing round r into row r - first of summary and surplus.
+    args:
+        config, configuration dictionary (ignored when bank is given).
+        bank, optional token_bank.TokenBank.
+        sim_period, number of rounds within simulation period.
+        book_type, 'standing', 'depth' or 'ladder'.
+        names, trader names in column order of surplus.
+        first, last, range of tournament rounds.
+        seed, seed of round 0.
+        summary, array (rounds, len(SUMMARY)); a missing equilibrium price is nan.
+        surplus, array (rounds, len(names)) of each trader's surplus.
+    """
+    column = {name: k for k, name in enumerate(names)}
+    for row, sim_num in enumerate(range(first, last)):
+        rnd.seed(seed + sim_num)
+        sim = msim.MarketSim("tournament", f"Market {sim_num}", book_type)
+        if bank is not None:
+            sim.load_bank(bank, sim_num % bank.rounds)
+        else:
+            sim.load_config_dict(config)
+            sim.calc_market()
+        result = sim.sim_period_silent(sim_period)
+        summary[row] = [np.nan if value is None else value for value in result[:5]]
+        for name, value in result[5].items():
+            surplus[row, column[name]] = value
+
+def run_shared_chunk(task):
+    """
+    Runs one chunk of rounds in a worker process, writing the results
+    straight into the shared arrays of a SharedResults.
+    returns:
+        number of rounds run
+    """
+    spec, config, bank, sim_period, book_type, first, last, seed = task
+    results = SharedResults(*spec)
+    try:
+        run_block(config, bank, sim_period, book_type, results.names, first, last, seed,
+                  results.summary[first:last], results.surplus[first:last])
+    finally:
+        results.close()
+    return last - first
+
+class TournamentResults:
+    """
+    Tournament results as arrays:
+        summary, array (rounds, len(SUMMARY))
+        surplus, array (rounds, traders), columns in the order of names
+    Rounds not run yet are nan.
+    args:
+        summary, surplus, the arrays.
+        names, trader names.
+    """
+    def __init__(self, summary, surplus, names):
+        self.summary = summary
+        self.surplus = surplus
+        self.names = list(names)
+        self.rounds = len(summary)
+
+    def column(self, name):
+        return self.summary[:, SUMMARY.index(name)]
+
+    def trader_means(self):
+        """
+        Returns {trader name: mean surplus}
+        """
+        return dict(zip(self.names, np.nanmean(self.surplus, axis=0).tolist()))
+
+    def strategy_means(self, strategy_of):
+        """
+        Returns {strategy: mean surplus per seat}
+        args:
+            strategy_of, {trader name: trader_type}
+        """
+        strategies = sorted(set(strategy_of[name] for name in self.names))
+        means = {}
+        for strategy in strategies:
+            seats = [k for k, name in enumerate(self.names) if strategy_of[name] == strategy]
+            means[strategy] = float(np.nanmean(self.surplus[:, seats]))
+        return means
+
+    def to_results(self):
+        """
+        Returns the results as the list of tuples returned by run_tournament.
+        """
+        results = []
+        for row, surplus in zip(self.summary.tolist(), self.surplus.tolist()):
+            actual_surplus, efficiency, eq_units, eq_price_low, eq_price_high = row
+            results.append((actual_surplus, efficiency, int(eq_units),
+                            None if np.isnan(eq_price_low) else int(eq_price_low),
+                            None if np.isnan(eq_price_high) else int(eq_price_high),
+                            dict(zip(self.names, surplus))))
+        return results
+
+    def close(self):
+        pass
+
+class SharedResults(TournamentResults):
+    """
+    TournamentResults held in shared memory, so worker processes write
+    each round in place and the parent reads them without copies.
+    args:
+        rounds, number of tournament rounds.
+        names, trader names.
+        blocks, names of existing shared memory blocks to attach to
+                (default: create new ones).
+    """
+    def __init__(self, rounds, names, blocks = None):
+        names = list(names)
+        sizes = (rounds * len(SUMMARY) * 8, max(rounds * len(names) * 8, 1))
+        self.owner = blocks is None
+        if self.owner:
+            self.blocks = [shared_memory.SharedMemory(create=True, size=size) for size in sizes]
+        else:
+            self.blocks = [shared_memory.SharedMemory(name=name) for name in blocks]
+        summary = np.ndarray((rounds, len(SUMMARY)), dtype=np.float64, buffer=self.blocks[0].buf)
+        surplus = np.ndarray((rounds, len(names)), dtype=np.float64, buffer=self.blocks[1].buf)
+        super().__init__(summary, surplus, names)
+        if self.owner:
+            self.summary.fill(np.nan)
+            self.surplus.fill(np.nan)
+
+    def spec(self):
+        """
+        Returns the arguments that attach another process to these results.
+        """
+        return self.rounds, self.names, [block.name for block in self.blocks]
+
+    def close(self):
+        """
+        Detaches from the shared memory; the owner also frees it.
+        """
+        self.summary = self.surplus = None
+        for block in self.blocks:
+            block.close()
+            if self.owner:
+                block.unlink()
+        self.blocks = []
 
 @dataclass
 class Tournament:
@@ -15,12 +167,77 @@ class Tournament:
         tournament_rounds, number of tournament rounds.
         sim_period, number of rounds within simulation period.
         file_path, path to TOML file.
+        book_type, 'standing' or 'depth' order book for each market.
+        profile, if True time each phase in self.profiler (a profiling.SimProfiler).
+        metrics, if True record per-strategy decision metrics in self.metrics
+                 (a profiling.StrategyMetrics).
+        bank, optional token_bank.TokenBank; round r then uses the bank's
+              tokens and equilibrium of round r (modulo the bank's rounds)
+              instead of fresh draws.
+        tape_every, if set keep a quote_tape.QuoteTape of every round in
+                    self.tapes, recording every tape_every-th step.
+        tape_on_change, if True the tapes only record steps where the quotes change.
+        records, if True keep tokens, trades and prices of every round in
+                 self.records (an analytics.MarketRecords) for analytics.analyze.
     """
-    def __init__(self, tournament_name, tournament_rounds, sim_period, file_path):
+    def __init__(self, tournament_name, tournament_rounds, sim_period, file_path, book_type = "standing", profile = False, metrics = False, bank = None,
+                 tape_every = None, tape_on_change = False, records = False):
         self.tournament_name = tournament_name
         self.tournament_rounds= tournament_rounds
         self.sim_period = sim_period
         self.file_path = file_path
+        self.book_type = book_type
+        self.profiler = profiling.SimProfiler() if profile else None
+        self.metrics = profiling.StrategyMetrics() if metrics else None
+        self.bank = bank
+        self.tape_every = tape_every
+        self.tape_on_change = tape_on_change
+        self.tapes = []
+        self.records = analytics.MarketRecords() if records else None
+
+    def phase(self, name):
+        """
+        Returns a context manager timing phase name when profiling, 
+        otherwise one that does nothing.
+        """
+        if self.profiler is None:
+            return nullcontext()
+        return self.profiler.phase(name)
+
+    def load(self):
+        """
+        Loads the TOML file once for all rounds of the tournament.
+        returns:
+            config, the configuration dictionary
+        """
+        if getattr(self, "config", None) is None:
+            self.config = self.bank.config if self.bank is not None else toml.load(self.file_path)
+        return self.config
+
+    def run_round(self, sim_num):
+        """
+        Builds a fresh market for round sim_num and simulates one period.
+        returns:
+            results of MarketSim.sim_period_silent
+        """
+        tape = None
+        if self.tape_every is not None:
+            tape = quote_tape.QuoteTape(self.sim_period, self.tape_every, self.tape_on_change)
+            self.tapes.append(tape)
+        sim = msim.MarketSim(self.tournament_name, f"Market {sim_num}", self.book_type, self.profiler, self.metrics, tape)
+        if self.bank is not None:
+            with self.phase("load_bank"):
+                sim.load_bank(self.bank, sim_num % self.bank.rounds)
+        else:
+            with self.phase("load_config"):
+                sim.load_config_dict(self.load())
+            with self.phase("calc_market"):
+                sim.calc_market()
+        with self.phase("sim_period_silent"):
+            result = sim.sim_period_silent(self.sim_period)
+        if self.records is not None:
+            self.records.add(sim)
+        return result
 
     def run_tournament(self):
         """
@@ -29,19 +246,184 @@ class Tournament:
             tournament results
         """
         sims = []
-        for sim_num in range(self.tournament_rounds):
-            sim = msim.MarketSim(self.tournament_name, f"Market {sim_num}")
-            sim.load_config2(self.file_path)
-            sim.calc_market()
-            sims.append(sim.sim_period_silent(self.sim_period))
+        with self.phase("run_tournament"):
+            for sim_num in range(self.tournament_rounds):
+                sims.append(self.run_round(sim_num))
+
+        return sims
+
+    def run_tournament_parallel(self, workers = None, chunk_size = 50, seed = 0):
+        """
+        Runs the tournament on a pool of worker processes.  Workers write
+        each round straight into shared memory (see SharedResults) and only
+        report the number of rounds in each chunk back.  Round r is seeded
+        with seed + r, so results do not depend on the number of workers.
+        Profiling, metrics, tapes and records are not collected on this path.
+        args:
+            workers, number of worker processes (default: all cores).
+            chunk_size, rounds sent to a worker at a time.
+            seed, seed of round 0.
+        returns:
+            results, a SharedResults; call results.close() when done with it
+        """
+        config = self.load()
+        results = SharedResults(self.tournament_rounds, self.trader_names())
+        tasks = [(results.spec(), config, self.bank, self.sim_period, self.book_type,
+                  first, min(first + chunk_size, self.tournament_rounds), seed)
+                 for first in range(0, self.tournament_rounds, chunk_size)]
+        try:
+            with self.phase("run_tournament"):
+                with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+                    rounds = sum(pool.map(run_shared_chunk, tasks))
+            if rounds != self.tournament_rounds:
+                raise RuntimeError(f"ran {rounds} of {self.tournament_rounds} tournament rounds")
+        except BaseException:
+            results.close()
+            raise
+        return results
+
+    def stack_tapes(self):
+        """
+        Returns the quote tapes of the rounds run so far stacked on a grid
+        of sim_period steps (see quote_tape.stack).
+        returns:
+            bid, ask, last, arrays (rounds, sim_period)
+        """
+        return quote_tape.stack(self.tapes, self.sim_period)
+
+    def population(self):
+        """
+        Returns True if the TOML file is in population form ([buyers] and
+        [sellers], see MarketSim.load_population).
+        """
+        return 'buyers' in self.load()
+
+    def trader_names(self):
+        """
+        Returns the trader names in seat order, buyers first.
+        """
+        config = self.load()
+        if self.population():
+            return ([f"B{k + 1}" for k in range(config['buyers']['count'])]
+                    + [f"S{k + 1}" for k in range(config['sellers']['count'])])
+        return list(self.strategies())
+
+    def strategies(self):
+        """
+        Returns {trader name: trader_type} from the TOML file.
+        A population-form file draws each trader's strategy anew every
+        round, so it has no such mapping and raises ValueError.
+        """
+        config = self.load()
+        if self.population():
+            raise ValueError(f"{self.file_path} is a population-form config; its traders "
+                             "change strategy every round, so results cannot be grouped by strategy")
+        seats = [f"B{k + 1}" for k in range(config['num_buyers'])]
+        seats += [f"S{k + 1}" for k in range(config['num_sellers'])]
+        return {config[seat]['name']: config[seat]['trader_type'] for seat in seats}
+
+    def half_widths(self, results, confidence = 0.95):
+        """
+        Returns confidence-interval half-widths of the tournament metrics.
+        args:
+            results, tournament results so far.
+            confidence, confidence level of the intervals.
+        returns:
+            {'efficiency': half-width of mean efficiency,
+             'surplus': largest half-width of a trader's mean surplus,
+             'strategy_means': {strategy: mean surplus per seat},
+             'strategy_half_widths': {strategy: half-width}}
+            the strategy entries are empty for a population-form config.
+        """
+        n = len(results)
+        t = scipy.stats.t.ppf((1 + confidence) / 2, n - 1)
+        def half_width(samples):
+            return t * samples.std(axis=0, ddof=1) / np.sqrt(n)
+
+        efficiency = np.array([result[1] for result in results])
+        names = list(results[0][5])
+        surplus = np.array([[result[5][name] for name in names] for result in results])
+        widths = {'efficiency': float(half_width(efficiency)),
+                  'surplus': float(half_width(surplus).max()),
+                  'strategy_means': {}, 'strategy_half_widths': {}}
+        if self.population():
+            return widths
+        strategy_of = self.strategies()
+        strategies = sorted(set(strategy_of[name] for name in names))
+        by_strategy = np.column_stack([
+            surplus[:, [k for k, name in enumerate(names) if strategy_of[name] == strategy]].mean(axis=1)
+            for strategy in strategies])
+        widths['strategy_means'] = dict(zip(strategies, by_strategy.mean(axis=0)))
+        widths['strategy_half_widths'] = dict(zip(strategies, half_width(by_strategy)))
+        return widths
+
+    def converged(self, widths, targets):
+        """
+        Checks the half-widths against targets, a dict with any of
+            'efficiency', target half-width of mean efficiency (percentage points),
+            'surplus', target half-width of every trader's mean surplus,
+            'ranking', the strategy ranking is settled when every pair of
+                       neighbouring strategies is separated by their
+                       confidence intervals, or both half-widths are below this.
+        """
+        if 'efficiency' in targets and widths['efficiency'] > targets['efficiency']:
+            return False
+        if 'surplus' in targets and widths['surplus'] > targets['surplus']:
+            return False
+        if 'ranking' in targets:
+            means = widths['strategy_means']
+            hws = widths['strategy_half_widths']
+            ranked = sorted(means, key=means.get)
+            for low, high in zip(ranked, ranked[1:]):
+                separated = means[high] - means[low] > hws[high] + hws[low]
+                settled = max(hws[high], hws[low]) <= targets['ranking']
+                if not (separated or settled):
+                    return False
+        return True
+
+    def run_tournament_adaptive(self, targets, batch_size = 50, max_rounds = None, confidence = 0.95):
+        """
+        Runs rounds in batches until the confidence intervals of the chosen
+        metrics are narrower than targets (see converged), or until
+        max_rounds (default: tournament_rounds) have run.
+        args:
+            targets, {'efficiency': ..., 'surplus': ..., 'ranking': ...}
+            batch_size, rounds run between checks.
+            max_rounds, round budget.
+            confidence, confidence level of the intervals.
+        returns:
+            tournament results, self.stopping holds the rounds run and the final half-widths
+        """
+        if 'ranking' in targets:
+            self.strategies()   # a population-form config has no ranking to settle
+        max_rounds = max_rounds or self.tournament_rounds
+        sims = []
+        widths = None
+        with self.phase("run_tournament"):
+            while len(sims) < max_rounds:
+                for sim_num in range(len(sims), min(len(sims) + batch_size, max_rounds)):
+                    sims.append(self.run_round(sim_num))
+                if len(sims) < 2:
+                    continue
+                widths = self.half_widths(sims, confidence)
+                if self.converged(widths, targets):
+                    break
 
+        if widths is None:
+            self.stopping = {'rounds': len(sims), 'converged': False}
+        else:
+            self.stopping = {'rounds': len(sims), 'converged': self.converged(widths, targets), **widths}
         return sims
         
-    def eval_tournament(self):
+    def eval_tournament(self, results = None):
         """
         Runs and evaluates tournament results, including a neat printing of useful results and plots.
+        args:
+            results, results of an earlier run (e.g. run_tournament_adaptive), 
+                     otherwise the tournament is run here.
         """
-        results = self.run_tournament()
+        if results is None:
+            results = self.run_tournament()
         act_sur = []
         eff = []
         for sim in range(len(results)):
@@ -76,6 +458,8 @@ class Tournament:
         print(f"Mean Actual Surplus: {scipy.ndimage.mean(np.array(act_sur))}")
         print(f"Median Efficiency: {scipy.ndimage.median(np.array(eff))}")
         print(f"Mean Efficiency: {scipy.ndimage.mean(np.array(eff))}")
+        if self.records is not None and len(self.records):
+            analytics.report(analytics.analyze(self.records))
 
         plt.hist(act_sur, bins=30, edgecolor='k', alpha=0.7)  # bins and aesthetics
         plt.title('Distribution of Actual Surplus')
@@ -0,0 +1,152 @@
+import numpy as np
+
+import batch_engine
+
+# columns of the observation array
+OBSERVATION = ('standing_bid', 'standing_ask', 'token', 'next_token', 'units_left',
+               'time_fraction', 'active')
+
+class VectorMarketEnv:
+    """
+    Gym-style vectorized environment: one learning agent takes a seat in
+    num_envs independent copies of a market and trades against the
+    configured strategies of every other seat (see batch_engine.BatchMarkets).
+    Each step is one round in every market.  In the markets where the
+    agent is the arriving trader (observation column 'active' is 1) its
+    action is its order price, nan for no order; elsewhere the action is
+    ignored.  The reward is the surplus the agent made in the round.
+    When the period ends every market starts a new one with new tokens
+    (auto-reset); done is True for that step.
+    Observations, rewards and done flags are written in place into arrays
+    allocated once, so callers should copy them to keep them past the
+    next step.
+    args:
+        config, per-seat configuration dictionary laid out as in the TOML files.
+        num_envs, number of markets.
+        sim_period, rounds per period.
+        agent, name of the agent's seat, e.g. 'B1' or 'S3'.
+        history, number of recent contract prices in the observation.
+        seed, seed of the markets.
+        bank, optional token_bank.TokenBank to take the tokens from.
+    """
+    def __init__(self, config, num_envs, sim_period, agent = 'B1', history = 4, seed = 0, bank = None):
+        self.markets = batch_engine.BatchMarkets(config, num_envs, sim_period, seed, bank, agent)
+        if self.markets.agent_arrival < 0:
+            raise ValueError(f"no seat named {agent}")
+        self.num_envs = num_envs
+        self.sim_period = sim_period
+        self.history = history
+        self.buyer = self.markets.agent_arrival < self.markets.num_buyers
+        self.seat = self.markets.agent_arrival - (0 if self.buyer else self.markets.num_buyers)
+        seats = self.markets.buyer_seats if self.buyer else self.markets.seller_seats
+        self.num_units = seats[self.seat]['num_units']
+        self.columns = OBSERVATION + tuple(f"price_{k + 1}" for k in range(history))
+        self.observation = np.zeros((num_envs, len(self.columns)))
+        self.reward = np.zeros(num_envs)
+        self.done = np.zeros(num_envs, dtype=bool)
+        self.prices = np.zeros((num_envs, history))
+        self.envs = np.arange(num_envs)
+        self.surplus = np.zeros(num_envs)
+        self.active = np.zeros(num_envs, dtype=bool)
+        self.has_units = np.zeros(num_envs, dtype=bool)
+        self.last_efficiency = np.full(num_envs, np.nan)
+
+    def agent_arrays(self):
+        """
+        Returns the agent's tokens, units and surplus arrays
+        """
+        m = self.markets
+        if self.buyer:
+            return m.values, m.buyer_unit, m.buyer_surplus
+        return m.costs, m.seller_unit, m.seller_surplus
+
+    def reset(self):
+        """
+        Reseeds every market and starts the first period.
+        returns:
+            observation, array (num_envs, len(self.columns))
+        """
+        self.markets.reset()
+        self.start_period()
+        return self.observation
+
+    def start_period(self):
+        self.round = 0
+        self.prices.fill(0.0)
+        self.arrivals = self.markets.arrive()
+        self.observe()
+
+    def observe(self):
+        """
+        Writes the observation of the coming round into self.observation
+        """
+        m = self.markets
+        tokens, units, _ = self.agent_arrays()
+        unit = units[:, self.seat]
+        obs = self.observation
+        obs[:, 0] = m.standing_bid
+        obs[:, 1] = m.standing_ask
+        obs[:, 2] = tokens[self.envs, self.seat, unit]
+        obs[:, 3] = tokens[self.envs, self.seat, unit + 1]
+        np.nan_to_num(obs[:, 2:4], copy=False)
+        np.subtract(self.num_units, unit, out=obs[:, 4])
+        np.maximum(obs[:, 4], 0.0, out=obs[:, 4])
+        obs[:, 5] = self.round / self.sim_period
+        obs[:, 6] = self.arrivals == m.agent_arrival
+        obs[:, 7:] = self.prices
+
+    def step(self, actions):
+        """
+        Runs one round in every market.
+        args:
+            actions, array (num_envs,) of the agent's order prices, nan for
+                     no order; used where observation column 'active' is 1.
+        returns:
+            observation, reward, done, info
+            info['efficiency'] holds each market's efficiency of the period
+            that ended on a done step
+        """
+        m = self.markets
+        _, _, surplus = self.agent_arrays()
+        self.surplus[:] = surplus[:, self.seat]
+        prices = m.decide(self.arrivals, self.round)
+        np.greater(self.observation[:, 6], 0, out=self.active)
+        np.greater(self.observation[:, 4], 0, out=self.has_units)
+        self.active &= self.has_units
+        np.copyto(prices, actions, where=self.active)
+        contract = m.match(self.arrivals, prices)
+        np.subtract(surplus[:, self.seat], self.surplus, out=self.reward)
+
+        for k in range(self.history - 1):
+            np.copyto(self.prices[:, k], self.prices[:, k + 1], where=contract)
+        if self.history:
+            np.copyto(self.prices[:, -1], m.last_price, where=contract)
+
+        self.round += 1
+        info = {}
+        if self.round == self.sim_period:
+            actual_surplus = m.buyer_surplus.sum(axis=1) + m.seller_surplus.sum(axis=1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                np.divide(actual_surplus * 100.0, m.max_surplus, out=self.last_efficiency)
+            info['efficiency'] = self.last_efficiency
+            m.new_period()
+            self.start_period()
+            self.done.fill(True)
+            return self.observation, self.reward, self.done, info
+        self.done.fill(False)
+        self.arrivals = m.arrive()
+        self.observe()
+        return self.observation, self.reward, self.done, info
+
+if __name__ == "__main__":
+    import time
+    import toml
+    env = VectorMarketEnv(toml.load("config files/config_test_Kaplan.toml"), 4096, 100)
+    obs = env.reset()
+    steps = 0
+    start = time.perf_counter()
+    while steps < 200 * env.num_envs:
+        # truthful agent: bid its current token
+        obs, reward, done, info = env.step(obs[:, 2].copy())
+        steps += env.num_envs
+    print(f"{steps / (time.perf_counter() - start):,.0f} env-steps/s")